@@ -0,0 +1,279 @@
+"""
+Checkpoint 儲存與維護
+建立 graph 使用的 SQLite checkpointer，並負責 checkpoints.db 的長期維護：
+    - 連線設定：WAL、synchronous=NORMAL、busy_timeout、記憶體暫存
+    - 壓縮：序列化後超過 CHECKPOINT_COMPRESS_MIN_BYTES 的 checkpoint / write 以 zlib 壓縮
+    - 保留政策：閒置的 run 只保留最新的 checkpoint（含待處理的 interrupt），
+      超過 CHECKPOINT_RETENTION_DAYS 且已結束的 run 整個刪除
+    - 定期 incremental vacuum 與 WAL checkpoint，釋放磁碟空間
+    - 統計：資料庫大小、checkpoint 數量、寫入時間與大小（/metrics、/health）
+"""
+import os
+import time
+import zlib
+import sqlite3
+from typing import Any, Dict, Optional, Tuple
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from services.metrics import inc, observe
+
+CHECKPOINT_DB_PATH = os.getenv('CHECKPOINT_DB_PATH', 'checkpoints.db')
+CHECKPOINT_COMPRESSION = os.getenv('CHECKPOINT_COMPRESSION', 'true').lower() == 'true'
+CHECKPOINT_COMPRESS_MIN_BYTES = int(os.getenv('CHECKPOINT_COMPRESS_MIN_BYTES', '1024'))
+CHECKPOINT_RETENTION_DAYS = float(os.getenv('CHECKPOINT_RETENTION_DAYS', '30'))
+CHECKPOINT_MAINTENANCE_INTERVAL = float(os.getenv('CHECKPOINT_MAINTENANCE_INTERVAL', '3600'))
+# 最新 checkpoint 超過此秒數未更新的 run 才視為閒置（避免修剪執行中的 run）
+IDLE_AFTER_SECONDS = 3600.0
+
+COMPRESSED_SUFFIX = '+zlib'
+INTERRUPT_CHANNEL = '__interrupt__'
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=30000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',  # 16 MB
+)
+
+_last_maintenance: Dict[str, Any] = {}
+
+
+# ===== 序列化 =====
+
+class CheckpointSerializer(JsonPlusSerializer):
+    """LangGraph 預設序列化 + zlib 壓縮，並記錄寫入大小
+
+    壓縮後的型別加上 '+zlib' 後綴，讀取時據此解壓縮；未壓縮的舊資料照常讀取
+    """
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = super().dumps_typed(obj)
+        if CHECKPOINT_COMPRESSION and data and len(data) >= CHECKPOINT_COMPRESS_MIN_BYTES:
+            compressed = zlib.compress(data)
+            if len(compressed) < len(data):
+                type_, data = type_ + COMPRESSED_SUFFIX, compressed
+
+        size = len(data) if data else 0
+        observe('email_summary_checkpoint_write_bytes', size)
+        inc('email_summary_checkpoint_written_bytes_total', value=size)
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.endswith(COMPRESSED_SUFFIX):
+            type_, payload = type_[:-len(COMPRESSED_SUFFIX)], zlib.decompress(payload)
+        return super().loads_typed((type_, payload))
+
+
+# ===== Checkpointer =====
+
+class MeteredSqliteSaver(SqliteSaver):
+    """記錄每次寫入耗時的 SqliteSaver"""
+
+    def put(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().put(*args, **kwargs)
+        finally:
+            observe('email_summary_checkpoint_write_seconds', time.perf_counter() - start, {'kind': 'checkpoint'})
+
+    def put_writes(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().put_writes(*args, **kwargs)
+        finally:
+            observe('email_summary_checkpoint_write_seconds', time.perf_counter() - start, {'kind': 'writes'})
+
+
+class MeteredAsyncSqliteSaver(AsyncSqliteSaver):
+    """記錄每次寫入耗時的 AsyncSqliteSaver"""
+
+    async def aput(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().aput(*args, **kwargs)
+        finally:
+            observe('email_summary_checkpoint_write_seconds', time.perf_counter() - start, {'kind': 'checkpoint'})
+
+    async def aput_writes(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().aput_writes(*args, **kwargs)
+        finally:
+            observe('email_summary_checkpoint_write_seconds', time.perf_counter() - start, {'kind': 'writes'})
+
+
+def create_saver(db_path: Optional[str] = None) -> SqliteSaver:
+    """建立同步 checkpointer（已套用連線設定與壓縮）"""
+    conn = sqlite3.connect(db_path or CHECKPOINT_DB_PATH, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return MeteredSqliteSaver(conn, serde=CheckpointSerializer())
+
+
+async def create_async_saver(db_path: Optional[str] = None):
+    """建立非同步 checkpointer
+
+    Returns:
+        (AsyncSqliteSaver, aiosqlite 連線)：連線由呼叫端在結束時關閉
+    """
+    import aiosqlite
+
+    conn = await aiosqlite.connect(db_path or CHECKPOINT_DB_PATH)
+    for pragma in PRAGMAS:
+        await conn.execute(pragma)
+    return MeteredAsyncSqliteSaver(conn, serde=CheckpointSerializer()), conn
+
+
+# ===== 維護 =====
+
+def checkpoint_time(checkpoint_id: str) -> float:
+    """由 checkpoint ID（UUID v6，時間排序）取得建立時間（Unix 秒）"""
+    hex_id = checkpoint_id.replace('-', '')
+    timestamp = int(hex_id[:12] + hex_id[13:16], 16)  # 100ns，自 1582-10-15 起
+    return (timestamp - 0x01B21DD213814000) / 1e7
+
+
+def _connect(db_path: Optional[str]) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or CHECKPOINT_DB_PATH, timeout=30, isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _has_tables(conn: sqlite3.Connection) -> bool:
+    return conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('checkpoints', 'writes')"
+    ).fetchone()[0] == 2
+
+
+def apply_retention(db_path: Optional[str] = None, retention_days: float = CHECKPOINT_RETENTION_DAYS,
+                    idle_after: float = IDLE_AFTER_SECONDS, now: Optional[float] = None) -> Dict[str, int]:
+    """套用保留政策
+
+    閒置的 run：刪除最新 checkpoint 以外的 checkpoint 與 writes（最新 checkpoint 的 writes
+    含 interrupt，保留以便恢復）；超過保留天數且沒有待處理 interrupt 的 run 整個刪除
+
+    Returns:
+        Dict[str, int]: {"checkpoints": 刪除的 checkpoint 數, "writes": 刪除的 write 數, "threads": 刪除的 run 數}
+    """
+    now = now or time.time()
+    conn = _connect(db_path)
+    deleted = {"checkpoints": 0, "writes": 0, "threads": 0}
+    try:
+        if not _has_tables(conn):
+            return deleted
+
+        threads = conn.execute(
+            'SELECT thread_id, checkpoint_ns, MAX(checkpoint_id), COUNT(*) FROM checkpoints '
+            'GROUP BY thread_id, checkpoint_ns'
+        ).fetchall()
+
+        for thread_id, checkpoint_ns, latest_id, count in threads:
+            age = now - checkpoint_time(latest_id)
+            if age < idle_after:
+                continue
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                pending_interrupt = conn.execute(
+                    'SELECT 1 FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? '
+                    'AND channel = ? LIMIT 1',
+                    (thread_id, checkpoint_ns, latest_id, INTERRUPT_CHANNEL)
+                ).fetchone() is not None
+
+                if age > retention_days * 86400 and not pending_interrupt:
+                    deleted["checkpoints"] += conn.execute(
+                        'DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?', (thread_id, checkpoint_ns)
+                    ).rowcount
+                    deleted["writes"] += conn.execute(
+                        'DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ?', (thread_id, checkpoint_ns)
+                    ).rowcount
+                    deleted["threads"] += 1
+                else:
+                    if count > 1:
+                        deleted["checkpoints"] += conn.execute(
+                            'DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?',
+                            (thread_id, checkpoint_ns, latest_id)
+                        ).rowcount
+                    deleted["writes"] += conn.execute(
+                        'DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id != ?',
+                        (thread_id, checkpoint_ns, latest_id)
+                    ).rowcount
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+    finally:
+        conn.close()
+
+    return deleted
+
+
+def compact(db_path: Optional[str] = None) -> Dict[str, int]:
+    """釋放空間：incremental vacuum + WAL checkpoint
+
+    第一次執行時將資料庫切換為 auto_vacuum=INCREMENTAL（需要一次完整 VACUUM）
+
+    Returns:
+        Dict[str, int]: {"freed_bytes": 釋放的位元組數}
+    """
+    conn = _connect(db_path)
+    try:
+        before = database_bytes(db_path)
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+        else:
+            conn.execute('PRAGMA incremental_vacuum')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+    return {"freed_bytes": max(0, before - database_bytes(db_path))}
+
+
+def run_maintenance(db_path: Optional[str] = None) -> Dict[str, Any]:
+    """執行一次完整維護（保留政策 + 壓縮空間）"""
+    start = time.perf_counter()
+    result = {**apply_retention(db_path), **compact(db_path)}
+    result['duration_ms'] = round((time.perf_counter() - start) * 1000)
+    result['at'] = time.time()
+    _last_maintenance.clear()
+    _last_maintenance.update(result)
+
+    print(f"Checkpoint 維護完成: 刪除 {result['checkpoints']} 個 checkpoint、{result['threads']} 個 run，"
+          f"釋放 {result['freed_bytes'] / 1024:.0f} KB（{result['duration_ms']} ms）")
+    return result
+
+
+# ===== 統計 =====
+
+def database_bytes(db_path: Optional[str] = None) -> int:
+    """資料庫檔案（含 WAL）的大小"""
+    path = db_path or CHECKPOINT_DB_PATH
+    return sum(os.path.getsize(p) for p in (path, f'{path}-wal') if os.path.exists(p))
+
+
+def stats(db_path: Optional[str] = None) -> Dict[str, Any]:
+    """checkpoints.db 大小、checkpoint / write / run 數量與上次維護結果"""
+    result = {"db_bytes": database_bytes(db_path), "last_maintenance": dict(_last_maintenance) or None}
+    if not os.path.exists(db_path or CHECKPOINT_DB_PATH):
+        return result
+
+    conn = _connect(db_path)
+    try:
+        if _has_tables(conn):
+            result["checkpoints"], result["threads"] = conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT thread_id) FROM checkpoints'
+            ).fetchone()
+            result["writes"] = conn.execute('SELECT COUNT(*) FROM writes').fetchone()[0]
+        result["free_bytes"] = (conn.execute('PRAGMA freelist_count').fetchone()[0]
+                                * conn.execute('PRAGMA page_size').fetchone()[0])
+    finally:
+        conn.close()
+    return result
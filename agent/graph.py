@@ -1,18 +1,22 @@
 # LangGraph 定義
 # 定義整個 Email Summary 的工作流程
+import os
+import operator
+from collections import OrderedDict
 from typing import Annotated, NotRequired
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.types import interrupt
+from langchain_core.runnables import RunnableConfig
 
 ## EmailSummaryGraph:
 # ├── 郵件獲取節點 (Fetch Emails)
-# ├── 重要性分類節點 (Classify Importance)
-# ├── 內容摘要節點 (Summarize Content)
-# ├── 事件判斷節點 (Event Detection)
-# ├── 報告生成節點 (Generate Report)
+# │   ├── 重要性分類節點 (Classify Importance)      ┐ 高重要性郵件先行通知（PRIORITY_ALERTS）
+# │   ├── 內容摘要節點 (Summarize Content)          ├ 平行分支，只依賴郵件內容
+# │   └── 事件判斷節點 (Event Detection)            │
+# │       └── 日曆比對節點 (Check Calendar)         ┘
+# ├── 報告生成節點 (Generate Report)                  三個分支都完成後匯合
 # └── 通知發送節點 (Send Notification)
 
 ## Define state
@@ -23,13 +27,14 @@ class EmailSummaryState(TypedDict):
     time_range: str  # "24h", "7d", "30d" 等
     max_emails: int  # 最多處理幾封郵件
 
-    # 郵件資料
-    raw_emails: NotRequired[list[dict]]  # Gmail API 回傳的原始郵件
-    # 每個 dict 包含: {id, subject, sender, body, date, ...}
+    # 郵件資料（只保存參照，完整內容在 services/email_store.py，以 load_emails() 取得）
+    email_refs: NotRequired[list[str]]  # Gmail API 回傳郵件的內容參照
+    # 每封郵件包含: {id, subject, from, body, date, ...}
 
+    # 以下三組結果由平行分支各自寫入（欄位互不重疊，不需要 reducer）
     # 分類結果
-    classified_emails: NotRequired[dict[str, list[dict]]]
-    # 格式: {"high": [...], "medium": [...], "low": [...]}
+    classified_emails: NotRequired[dict[str, list[str]]]
+    # 格式: {"high": [參照...], "medium": [...], "low": [...]}
 
     # 摘要結果
     email_summaries: NotRequired[dict]
@@ -37,22 +42,34 @@ class EmailSummaryState(TypedDict):
 
     # 事件判斷結果
     detected_events: NotRequired[list[dict]]
-    confirmed_events: NotRequired[list[dict]]  # 用戶確認的事件
-    # dict 包含: ["事件標題", "相關信件標題", "起始時間", "結束時間", ...]
+    confirmed_events: NotRequired[list[str]]  # 本批用戶確認的事件 ID（每次恢復時覆寫）
+    skipped_events: NotRequired[list[str]]  # 本批用戶跳過的事件 ID（每次恢復時覆寫）
+    decided_events: NotRequired[Annotated[list[str], operator.add]]  # 累計已確認或跳過的事件 ID
+    # detected_events 的 dict 包含: ["事件標題", "相關信件標題", "起始時間", "結束時間", ...]
+
+    # Calendar 建立結果
+    calendar_events_created: NotRequired[Annotated[list[str], operator.add]]  # 累計成功建立（或已存在）的 Calendar 事件 ID
+    calendar_results: NotRequired[Annotated[dict[str, dict], operator.or_]]
+    # 格式: {事件 ID: {"status": "created" | "exists" | "failed", "calendar_event_id": str, "error": str | None}}
 
     # 最終輸出
     final_report: NotRequired[str]  # Markdown 格式的最終報告
-    report_sent: NotRequired[bool]  # 是否已成功發送
+    report_sent: NotRequired[bool]  # 是否已成功發送（OUTBOX_ENABLED=false 時同步發送）
+    report_outbox_ids: NotRequired[list[int]]  # 報告各頁在 outbox 中的項目 ID（由背景 worker 送出）
 
     # 執行記錄
     messages: NotRequired[Annotated[list[str], add_messages]]  # 執行日誌
 
-    # 錯誤處理
+    # 錯誤處理（節點重試由 RetryPolicy 處理，見 agent/policies.py）
     error: NotRequired[str | None]
-    retry_count: NotRequired[int]
 
 
 ## Define nodes
+def load_emails(refs: list[str]) -> list[dict]:
+    """依參照取得郵件內容（行程內快取，回傳的 dict 不可修改）"""
+    from services.email_store import get_emails
+    return get_emails(refs)
+
 def fetch_emails(state: EmailSummaryState) -> dict:
     """獲取郵件"""
     time_range = state.get('time_range', '24h')
@@ -102,29 +119,79 @@ def fetch_emails(state: EmailSummaryState) -> dict:
 
     else:
         from services.gmail_service import fetch_emails_from_gmail
+        from services.tracing import span
 
-        emails = fetch_emails_from_gmail(time_range, max_emails)
+        with span('gmail.account', kind='account', account='default') as account_span:
+            emails = fetch_emails_from_gmail(time_range, max_emails)
+            account_span.set('emails', len(emails))
 
         if len(emails) > max_emails:
             emails = emails[:max_emails]
 
-    return {"raw_emails": emails}
+    # 正規化郵件文字（去除引用、簽名、樣板與追蹤網址），供後續所有 AI 節點共用
+    from services.text_service import normalize_emails
+    normalize_emails(emails)
+
+    # 郵件內容寫入 email store，state（checkpoint）只保存參照
+    from services.email_store import put_emails
+    return {"email_refs": put_emails(emails)}
+
+# 兩階段模式：分類一發現高重要性郵件就先送出精簡通知，完整摘要稍後送出
+PRIORITY_ALERTS = os.getenv('PRIORITY_ALERTS', 'true').lower() == 'true'
+
+# 已送出優先通知的 (run ID, 郵件參照)，節點重試時不重複通知
+_alerted: "OrderedDict[tuple, None]" = OrderedDict()
+_ALERTED_LIMIT = 5000
+
+def _priority_alert_callback(run_id: str, ref_by_email: dict):
+    """分類批次完成時的回呼：送出本批尚未通知過的高重要性郵件"""
+    from services.slack_service import queue_priority_alert
 
-def classify_importance(state: EmailSummaryState) -> dict:
-    """分類郵件重要性"""
+    def on_high(emails: list[dict]):
+        fresh = [e for e in emails if (run_id, ref_by_email[id(e)]) not in _alerted]
+        if not fresh:
+            return
+        queue_priority_alert(fresh)
+        for email in fresh:
+            _alerted[(run_id, ref_by_email[id(email)])] = None
+        while len(_alerted) > _ALERTED_LIMIT:
+            _alerted.popitem(last=False)
+        print(f"[{run_id}] 已送出 {len(fresh)} 封重要郵件的優先通知")
+
+    return on_high
+
+def classify_importance(state: EmailSummaryState, config: RunnableConfig) -> dict:
+    """分類郵件重要性（由新到舊分批；PRIORITY_ALERTS 開啟時，高重要性郵件先行通知）"""
     from services.ai_service import classify_importance
-    classified = classify_importance(state['raw_emails'])
 
-    return {"classified_emails": classified}
+    refs = state.get('email_refs', [])
+    emails = load_emails(refs)
+    ref_by_email = {id(email): ref for email, ref in zip(emails, refs)}
 
-def summarize_content(state: EmailSummaryState) -> dict:
-    """摘要郵件內容"""
-    from services.ai_service import summarize_emails
+    on_high = None
+    if PRIORITY_ALERTS:
+        on_high = _priority_alert_callback(config["configurable"]["thread_id"], ref_by_email)
+    classified = classify_importance(emails, on_high=on_high)
+
+    # 分類結果中的郵件即輸入的 dict，換回參照
+    return {"classified_emails": {
+        level: [ref_by_email[id(email)] for email in items]
+        for level, items in classified.items()
+    }}
+
+# 增量摘要：只摘要先前執行沒看過的郵件，合併進每個帳號每天的滾動摘要（services/digest_store.py）
+INCREMENTAL_DIGEST = os.getenv('INCREMENTAL_DIGEST', 'true').lower() == 'true'
 
-    raw_emails = state.get('raw_emails', [])
-    classified = state.get('classified_emails', {})
+def summarize_content(state: EmailSummaryState) -> dict:
+    """摘要郵件內容（與分類平行執行，不使用分類結果）"""
+    raw_emails = load_emails(state.get('email_refs', []))
 
-    summaries = summarize_emails(raw_emails, classified)
+    if INCREMENTAL_DIGEST:
+        from services.digest_store import digest_emails
+        summaries = digest_emails(raw_emails)
+    else:
+        from services.ai_service import summarize_emails
+        summaries = summarize_emails(raw_emails)
 
     return {"email_summaries": summaries}
 
@@ -132,81 +199,144 @@ def detect_events(state: EmailSummaryState) -> dict:
     """判斷是否有重要事件"""
     from services.event_service import detect_events_from_emails
 
-    raw_emails = state.get('raw_emails', [])
+    raw_emails = load_emails(state.get('email_refs', []))
 
     events = detect_events_from_emails(raw_emails)
 
     return {"detected_events": events}
 
-def request_confirmation(state: EmailSummaryState) -> dict:
+def check_calendar(state: EmailSummaryState) -> dict:
+    """與既有日曆比對：移除重複事件並標註時間衝突"""
+    events = state.get('detected_events', [])
+
+    if not events:
+        return {}
+
+    from services.calendar_service import annotate_with_existing_events
+
+    try:
+        events = annotate_with_existing_events(events)
+    except Exception as e:
+        # 日曆無法存取時不影響後續流程，保留原始事件
+        print(f"Calendar 比對失敗，略過: {e}")
+        return {}
+
+    return {"detected_events": events}
+
+def request_confirmation(state: EmailSummaryState, config: RunnableConfig) -> dict:
     """請求用戶確認事件（中斷點）"""
     events = state.get('detected_events', [])
     
     if not events:
         return {"confirmed_events": []}
     
-    # 發送 Slack 互動訊息
-    from services.slack_service import send_event_confirmation_request
-    message_ts = send_event_confirmation_request(events)
+    # 發送 Slack 互動訊息（按鈕帶上本次執行的 thread ID，回調時據此恢復）
+    # 寫入與報告相同的 outbox stream：確認按鈕在報告之後才送達
+    run_id = config["configurable"]["thread_id"]
+    if os.getenv('OUTBOX_ENABLED', 'true').lower() != 'true':
+        from services.slack_service import send_event_confirmation_request
+        sent = {"message_ts": send_event_confirmation_request(events, run_id)}
+    else:
+        from services.slack_service import queue_event_confirmation_request
+        sent = {"outbox_ids": queue_event_confirmation_request(events, run_id)}
     
     # 中斷工作流，等待用戶回應
     confirmed = interrupt({
         "message": "等待用戶確認事件",
         "events": events,
-        "message_ts": message_ts
+        **sent
     })
     
     return {"confirmed_events": confirmed}
 
+def wait_for_confirmation(state: EmailSummaryState) -> dict:
+    """等待其餘事件的確認（中斷點，不會重送 Slack 訊息）
+
+    恢復時由 API 以 update_state(as_node="wait_for_confirmation") 寫入下一批回應
+    """
+    interrupt({
+        "message": "等待其餘事件確認",
+        "pending": get_pending_event_ids(state)
+    })
+    return {}
+
+def get_pending_event_ids(state: EmailSummaryState) -> list[str]:
+    """尚未確認或跳過的事件 ID"""
+    decided = set(state.get('decided_events', []))
+    return [e['id'] for e in state.get('detected_events', []) if e['id'] not in decided]
+
 def create_calendar_events(state: EmailSummaryState) -> dict:
-    """創建 Calendar 事件"""
+    """創建 Calendar 事件（批次、冪等）
+
+    只處理本批確認的事件；之前批次建立的結果保留在 calendar_events_created / calendar_results
+    """
     confirmed_events = state.get('confirmed_events', [])
+    decided = list(dict.fromkeys(confirmed_events + state.get('skipped_events', [])))
 
     if not confirmed_events:
-        return {"calendar_events_created": []}
+        return {"calendar_events_created": [], "calendar_results": {}, "decided_events": decided}
 
-    from services.calendar_service import create_calendar_event
+    from services.calendar_service import create_calendar_events_batch
 
-    created_ids = []
+    # 從 detected_events 中找到完整事件資料
+    events_by_id = {e['id']: e for e in state.get('detected_events', [])}
+    events = []
+    results = {}
     for event_id in confirmed_events:
-        # 從 detected_events 中找到完整事件資料
-        events = state.get('detected_events', [])
-        event = next((e for e in events if e['id'] == event_id), None)
-
+        event = events_by_id.get(event_id)
         if not event:
             print(f"警告：找不到事件 ID: {event_id}")
+            results[event_id] = {"status": "failed", "calendar_event_id": None, "error": "event not found"}
             continue
-
-        # 創建 Calendar 事件
-        try:
-            calendar_id = create_calendar_event(event)
-            created_ids.append(calendar_id)
-            print(f"成功創建 Calendar 事件: {event.get('title')}")
-        except Exception as e:
-            print(f"創建 Calendar 事件失敗: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    return {"calendar_events_created": created_ids}
+        events.append(event)
+
+    # 一次 batch 請求建立所有事件；固定的事件 ID 讓重試不會重複建立
+    try:
+        results.update(create_calendar_events_batch(events))
+    except Exception as e:
+        print(f"創建 Calendar 事件失敗: {e}")
+        import traceback
+        traceback.print_exc()
+        for event in events:
+            results.setdefault(event['id'], {"status": "failed", "calendar_event_id": None, "error": str(e)})
+
+    created_ids = [
+        result['calendar_event_id'] for result in results.values()
+        if result['status'] in ('created', 'exists')
+    ]
+
+    # 失敗的事件寫入 outbox 持續重試（固定事件 ID，重送不會重複建立）
+    failed_events = [e for e in events if results.get(e['id'], {}).get('status') == 'failed']
+    if failed_events:
+        from services.outbox import enqueue
+        enqueue('calendar_create', {"events": failed_events}, stream='calendar')
+        print(f"{len(failed_events)} 個 Calendar 事件已排入 outbox 重試")
+
+    return {"calendar_events_created": created_ids, "calendar_results": results, "decided_events": decided}
 
 def generate_report(state: EmailSummaryState) -> dict:
     """生成最終報告"""
     import datetime
     summaries = state.get('email_summaries', {})
-    raw_emails = state.get('raw_emails', [])
+    email_refs = state.get('email_refs', [])
     classified_emails = state.get('classified_emails', {})
 
     summary_text = summaries.get('summary', '')
 
     # 計算各類別郵件數量
-    high_emails = classified_emails.get('high', [])
+    high_emails = load_emails(classified_emails.get('high', []))
     medium_emails = classified_emails.get('medium', [])
     low_emails = classified_emails.get('low', [])
 
     report = "# 每日郵件摘要\n\n"
     report += f"**時間範圍**: {state.get('time_range', 'N/A')}\n\n"
+    if summaries.get('outside_window'):
+        # 增量摘要以整天為單位，摘要可能包含時間範圍外、先前執行已摘要的同日郵件
+        first_day, last_day = summaries['days']
+        days = first_day if first_day == last_day else f"{first_day} ~ {last_day}"
+        report += f"**摘要涵蓋**: {days} 全日（含 {summaries['outside_window']} 封時間範圍外、先前已摘要的郵件）\n\n"
     report += f"**執行日期**: {datetime.datetime.now().strftime('%Y-%m-%d')}\n\n"
-    report += f"**總郵件數**: {len(raw_emails)}\n\n"
+    report += f"**總郵件數**: {len(email_refs)}\n\n"
 
     report += "## 重要性統計\n\n"
     report += f"- 高重要性: {len(high_emails)} 封\n"
@@ -230,34 +360,61 @@ def generate_report(state: EmailSummaryState) -> dict:
     return {"final_report": report}
 
 def send_notification(state: EmailSummaryState) -> dict:
-    """發送通知"""
-    from services.slack_service import send_slack_notification
+    """發送通知（寫入 outbox，由背景 worker 送出，不阻塞工作流）"""
+    import os
 
     final_report = state.get('final_report', '')
-    success = send_slack_notification(final_report)
 
-    return {"report_sent": success}
+    if os.getenv('OUTBOX_ENABLED', 'true').lower() != 'true':
+        from services.slack_service import send_slack_notification
+        return {"report_sent": send_slack_notification(final_report)}
+
+    from services.slack_service import queue_slack_notification
+    outbox_ids = queue_slack_notification(final_report)
+
+    return {"report_outbox_ids": outbox_ids}
 
 
 # Build graph
 builder = StateGraph(EmailSummaryState)
 
 # 加入所有節點
-builder.add_node("fetch_emails", fetch_emails)
-builder.add_node("classify_importance", classify_importance)
-builder.add_node("summarize_content", summarize_content)
-builder.add_node("detect_events", detect_events)
-builder.add_node("request_confirmation", request_confirmation)
-builder.add_node("create_calendar_events", create_calendar_events)
-builder.add_node("generate_report", generate_report)
-builder.add_node("send_notification", send_notification)
+# AI 節點只依賴郵件內容：以 email_refs 為鍵快取結果，失敗後恢復或重新觸發不會重複呼叫 GPT-4o
+# 外部 API 節點遇到暫時性錯誤（429 / 5xx / 連線）時以指數退避重試
+from agent.policies import API_RETRY, AI_RETRY, email_cache_policy
+from services.tracing import traced_node
+
+
+def add_traced_node(name: str, func, **kwargs):
+    """加入節點；每次執行（含重試）記錄一個 node span，見 services/tracing.py"""
+    builder.add_node(name, traced_node(name, func), **kwargs)
+
+
+add_traced_node("fetch_emails", fetch_emails, retry_policy=API_RETRY)
+add_traced_node("classify_importance", classify_importance, retry_policy=AI_RETRY, cache_policy=email_cache_policy())
+# 增量摘要本身只處理新郵件，不使用節點快取（快取的結果會缺少其他執行之後合併的郵件）
+add_traced_node("summarize_content", summarize_content, retry_policy=AI_RETRY,
+                cache_policy=None if INCREMENTAL_DIGEST else email_cache_policy())
+add_traced_node("detect_events", detect_events, retry_policy=AI_RETRY, cache_policy=email_cache_policy())
+add_traced_node("check_calendar", check_calendar)
+add_traced_node("request_confirmation", request_confirmation, retry_policy=API_RETRY)
+add_traced_node("wait_for_confirmation", wait_for_confirmation)
+add_traced_node("create_calendar_events", create_calendar_events, retry_policy=API_RETRY)
+add_traced_node("generate_report", generate_report)
+add_traced_node("send_notification", send_notification, retry_policy=API_RETRY)
 
 # 定義執行流程（邊）
 builder.add_edge(START, "fetch_emails")
+
+# 分類、摘要、事件判斷都只依賴郵件內容（email_refs）：從 fetch_emails 平行展開，
+# AI 階段的耗時為最慢的分支，而不是三者相加
 builder.add_edge("fetch_emails", "classify_importance")
-builder.add_edge("classify_importance", "summarize_content")
-builder.add_edge("summarize_content", "detect_events")
-builder.add_edge("detect_events", "generate_report")
+builder.add_edge("fetch_emails", "summarize_content")
+builder.add_edge("fetch_emails", "detect_events")
+builder.add_edge("detect_events", "check_calendar")
+
+# 三個分支全部完成後才生成報告
+builder.add_edge(["classify_importance", "summarize_content", "check_calendar"], "generate_report")
 builder.add_edge("generate_report", "send_notification")
 
 # 條件路由：發送通知後，如果有事件 → 請求確認；無事件 → 結束
@@ -275,12 +432,79 @@ builder.add_conditional_edges(
 )
 
 builder.add_edge("request_confirmation", "create_calendar_events")
-builder.add_edge("create_calendar_events", END)
+builder.add_edge("wait_for_confirmation", "create_calendar_events")
 
-# 5. 編譯 graph（使用 checkpointer）
-import sqlite3
+# 條件路由：建立本批事件後，仍有未回應的事件 → 繼續等待；全部回應 → 結束
+def should_wait_for_more(state: EmailSummaryState) -> str:
+    return "wait_for_confirmation" if get_pending_event_ids(state) else "end"
+
+builder.add_conditional_edges(
+    "create_calendar_events",
+    should_wait_for_more,
+    {
+        "wait_for_confirmation": "wait_for_confirmation",
+        "end": END
+    }
+)
 
-# 創建持久化的 SQLite 連接和 checkpointer
-conn = sqlite3.connect("checkpoints.db", check_same_thread=False)
-checkpointer = SqliteSaver(conn)
-graph = builder.compile(checkpointer=checkpointer)
+# 5. 編譯 graph（使用 checkpointer）
+# 延遲到第一次存取 `graph` 時才開啟 checkpoints.db 並編譯，
+# import 本模組不會產生任何 I/O（`from agent.graph import graph` 仍然可用）
+import threading
+
+_graph = None
+_graph_lock = threading.Lock()
+
+def get_graph():
+    """取得編譯後的 graph（第一次呼叫時建立 checkpointer 並編譯）"""
+    global _graph
+
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                from agent.checkpointing import create_saver
+                from agent.policies import create_node_cache
+
+                # 創建持久化的 SQLite checkpointer（WAL、壓縮，見 agent/checkpointing.py）
+                _graph = builder.compile(checkpointer=create_saver(), cache=create_node_cache())
+
+    return _graph
+
+_async_graph = None
+_async_conn = None
+
+async def get_async_graph():
+    """取得使用非同步 checkpointer 的 graph（供 FastAPI 以 astream / aupdate_state 執行）
+
+    AsyncSqliteSaver 的連線綁定建立它的 event loop，只能在同一個 loop 中使用；
+    同步節點由 LangGraph 在 loop 的執行緒池中執行，不會阻塞 event loop
+    """
+    global _async_graph, _async_conn
+
+    if _async_graph is None:
+        from agent.checkpointing import create_async_saver
+        from agent.policies import create_node_cache
+
+        checkpointer, conn = await create_async_saver()
+        if _async_graph is None:
+            _async_conn = conn
+            _async_graph = builder.compile(checkpointer=checkpointer, cache=create_node_cache())
+        else:
+            # 等待連線期間已由其他協程建立
+            await conn.close()
+
+    return _async_graph
+
+async def close_async_graph():
+    """關閉非同步 checkpointer 的連線（服務關閉時呼叫）"""
+    global _async_graph, _async_conn
+
+    if _async_conn is not None:
+        await _async_conn.close()
+    _async_graph = None
+    _async_conn = None
+
+def __getattr__(name: str):
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
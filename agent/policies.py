@@ -0,0 +1,115 @@
+"""
+節點快取與重試政策
+失敗的執行恢復或重新觸發時，不必再次支付已完成的昂貴階段：
+    - AI 節點（分類、摘要、事件判斷）的結果以輸入郵件的內容參照（email_refs）為鍵快取在 node_cache.db，
+      相同郵件再次執行時直接取用，不再呼叫 GPT-4o
+    - 外部 API 節點依錯誤類型重試：429 / 5xx / 連線逾時以指數退避重試，4xx 等永久錯誤立即失敗
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Optional
+
+from langgraph.types import CachePolicy, RetryPolicy, default_retry_on
+
+NODE_CACHE_ENABLED = os.getenv('NODE_CACHE_ENABLED', 'true').lower() == 'true'
+NODE_CACHE_DB_PATH = os.getenv('NODE_CACHE_DB_PATH', 'node_cache.db')
+NODE_CACHE_TTL = int(os.getenv('NODE_CACHE_TTL', '86400'))
+NODE_MAX_ATTEMPTS = int(os.getenv('NODE_MAX_ATTEMPTS', '3'))
+
+# 節點邏輯或 prompt 改變時遞增，讓舊的快取失效
+CACHE_VERSION = 1
+
+TRANSIENT_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+# ===== 快取 =====
+
+def email_content_key(state: dict) -> str:
+    """以郵件內容參照為鍵（內容相同的郵件 → 相同的鍵，與 run ID、其他欄位無關）"""
+    payload = json.dumps({"v": CACHE_VERSION, "emails": state.get('email_refs', [])})
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def email_cache_policy() -> Optional[CachePolicy]:
+    """只依賴郵件內容的節點使用的快取政策（NODE_CACHE_ENABLED=false 時不快取）"""
+    if not NODE_CACHE_ENABLED:
+        return None
+    return CachePolicy(key_func=email_content_key, ttl=NODE_CACHE_TTL)
+
+
+def create_node_cache():
+    """建立節點結果快取（與 checkpoint 相同的序列化與壓縮）"""
+    if not NODE_CACHE_ENABLED:
+        return None
+
+    from langgraph.cache.sqlite import SqliteCache
+    from agent.checkpointing import CheckpointSerializer
+
+    return SqliteCache(path=NODE_CACHE_DB_PATH, serde=CheckpointSerializer())
+
+
+def prune_node_cache(db_path: Optional[str] = None) -> int:
+    """刪除過期的快取項目（LangGraph 只在讀到時才刪除）
+
+    Returns:
+        int: 刪除的筆數
+    """
+    path = db_path or NODE_CACHE_DB_PATH
+    if not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn:
+            return conn.execute('DELETE FROM cache WHERE expiry IS NOT NULL AND expiry < ?', (time.time(),)).rowcount
+    except sqlite3.OperationalError:
+        # 尚未建立資料表
+        return 0
+    finally:
+        conn.close()
+
+
+# ===== 重試 =====
+
+def is_transient_error(exc: Exception) -> bool:
+    """是否為值得重試的暫時性錯誤"""
+    try:
+        from googleapiclient.errors import HttpError
+        if isinstance(exc, HttpError):
+            return exc.resp.status in TRANSIENT_STATUS_CODES
+    except ImportError:
+        pass
+
+    try:
+        import openai
+        if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+            return True
+        if isinstance(exc, openai.APIStatusError):
+            return exc.status_code in TRANSIENT_STATUS_CODES
+    except ImportError:
+        pass
+
+    from services.slack_transport import SlackTransportError
+    if isinstance(exc, SlackTransportError):
+        return exc.status_code is None or exc.status_code in TRANSIENT_STATUS_CODES
+
+    from services.digest_store import DigestConflict
+    if isinstance(exc, DigestConflict):
+        return True
+
+    if isinstance(exc, TimeoutError):
+        return True
+    if isinstance(exc, sqlite3.OperationalError):
+        return 'locked' in str(exc)
+    return default_retry_on(exc)
+
+
+# Gmail / Calendar：等待時間短
+API_RETRY = RetryPolicy(max_attempts=NODE_MAX_ATTEMPTS, initial_interval=1.0, backoff_factor=2.0,
+                        max_interval=30.0, retry_on=is_transient_error)
+
+# OpenAI：限流時需要較長的等待
+AI_RETRY = RetryPolicy(max_attempts=NODE_MAX_ATTEMPTS, initial_interval=5.0, backoff_factor=3.0,
+                       max_interval=120.0, retry_on=is_transient_error)
@@ -0,0 +1,120 @@
+"""
+Slack 事件確認的合併處理
+同一個 run 的按鈕點擊先暫存，在短暫的 debounce 視窗內沒有新點擊時才一次送出：
+    - 工作流只恢復一次，帶上這段時間累積的所有確認 / 跳過
+    - 每則 Slack 訊息只送一次 chat.update
+"""
+import os
+import asyncio
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Set, Tuple
+
+CONFIRMATION_DEBOUNCE_SECONDS = float(os.getenv("CONFIRMATION_DEBOUNCE_SECONDS", "2"))
+
+# 等待確認的中斷節點（首次請求確認 / 等待其餘事件）
+CONFIRMATION_NODES = ("request_confirmation", "wait_for_confirmation")
+
+MessageKey = Tuple[str, str]  # (channel, message ts)
+
+
+@dataclass
+class ConfirmationBatch:
+    """一個 run 在 debounce 視窗內累積的回應"""
+    run_id: str
+    decisions: Dict[str, bool] = field(default_factory=dict)  # {事件 ID: 確認 / 跳過}
+    messages: Dict[MessageKey, list] = field(default_factory=dict)  # 需要更新的訊息與其目前的 blocks
+
+
+class ConfirmationBuffer:
+    """依 run 暫存按鈕點擊，debounce 後交給 on_flush 處理（只能在同一個 event loop 中使用）"""
+
+    def __init__(self, on_flush: Callable[[ConfirmationBatch], None], delay: float = CONFIRMATION_DEBOUNCE_SECONDS):
+        self.on_flush = on_flush
+        self.delay = delay
+        self._batches: Dict[str, ConfirmationBatch] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # 已送出更新的訊息 blocks：Slack 回傳的 payload 可能還是更新前的版本
+        self._rendered: Dict[MessageKey, list] = {}
+
+    def add(self, run_id: str, decisions: Dict[str, bool], channel: str, message_ts: str, blocks: list):
+        """加入一次點擊（重設該 run 的 debounce 計時）
+
+        Args:
+            run_id: 執行 ID
+            decisions: {事件 ID: True（確認）/ False（跳過）}
+            channel: 訊息所在頻道
+            message_ts: 訊息 timestamp
+            blocks: Slack payload 中訊息的 blocks
+        """
+        batch = self._batches.get(run_id)
+        if batch is None:
+            batch = self._batches[run_id] = ConfirmationBatch(run_id)
+        batch.decisions.update(decisions)
+
+        key = (channel, message_ts)
+        batch.messages.setdefault(key, self._rendered.get(key, blocks))
+
+        timer = self._timers.pop(run_id, None)
+        if timer is not None:
+            timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timers[run_id] = loop.call_later(self.delay, self._flush, run_id)
+
+    def decided(self, run_id: str) -> Set[str]:
+        """暫存中已有回應的事件 ID"""
+        batch = self._batches.get(run_id)
+        return set(batch.decisions) if batch else set()
+
+    def current_blocks(self, channel: str, message_ts: str, blocks: list) -> list:
+        """訊息目前的 blocks（優先使用暫存或已送出的版本）"""
+        key = (channel, message_ts)
+        for batch in self._batches.values():
+            if key in batch.messages:
+                return batch.messages[key]
+        return self._rendered.get(key, blocks)
+
+    def remember(self, key: MessageKey, blocks: list, done: bool = False):
+        """記錄已送出的訊息 blocks；訊息中的事件都回應後即可丟棄"""
+        if done:
+            self._rendered.pop(key, None)
+        else:
+            self._rendered[key] = blocks
+
+    def forget(self, key: MessageKey):
+        """訊息更新失敗時丟棄記錄，之後改用 Slack payload 中的 blocks"""
+        self._rendered.pop(key, None)
+
+    def _flush(self, run_id: str):
+        self._timers.pop(run_id, None)
+        batch = self._batches.pop(run_id, None)
+        if batch is not None and batch.decisions:
+            self.on_flush(batch)
+
+    def pending(self) -> Dict[str, int]:
+        """每個 run 暫存中的回應數量"""
+        return {run_id: len(batch.decisions) for run_id, batch in self._batches.items()}
+
+
+def split_decisions(decisions: Dict[str, bool], decided) -> Tuple[list, list]:
+    """將一批回應分成 (確認, 跳過)，略過之前批次已處理的事件"""
+    decided = set(decided)
+    confirmed = [event_id for event_id, ok in decisions.items() if ok and event_id not in decided]
+    skipped = [event_id for event_id, ok in decisions.items() if not ok and event_id not in decided]
+    return confirmed, skipped
+
+
+def enqueue_message_updates(updates: Dict[MessageKey, list]) -> None:
+    """每則訊息一次 chat.update（經由 outbox，同一頻道依序送出）"""
+    from services.outbox import enqueue
+
+    for (channel, message_ts), blocks in updates.items():
+        enqueue('slack_api', {
+            "method": "chat.update",
+            "args": {
+                "channel": channel,
+                "ts": message_ts,
+                "blocks": blocks,
+                "text": "事件處理完成"  # fallback text
+            }
+        }, stream=f"slack:{channel}")
+    print(f"✓ {len(updates)} 則 Slack 訊息更新已排入 outbox")
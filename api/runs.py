@@ -0,0 +1,113 @@
+"""
+工作流執行管理
+在 event loop 中以 asyncio task 執行工作流：
+    - 同時執行數量受 MAX_CONCURRENT_RUNS 限制，超過的排隊等待
+    - 同一個 run（thread ID）的工作依序執行（首次執行 → 各次恢復）
+    - 可取消執行中或排隊中的工作
+"""
+import os
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", "4"))
+
+
+class RunManager:
+    """管理工作流的 asyncio task（只能在同一個 event loop 中使用）"""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_RUNS):
+        self.max_concurrent = max_concurrent
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, Set[asyncio.Task]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._queued = 0
+        self._running = 0
+
+    def _lock(self, run_id: str) -> asyncio.Lock:
+        lock = self._locks.get(run_id)
+        if lock is None:
+            lock = self._locks[run_id] = asyncio.Lock()
+        return lock
+
+    async def _execute(self, run_id: str, factory: Callable[[], Awaitable]):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        self._queued += 1
+        queued = True
+        try:
+            # 先取得 run 的鎖再佔用執行名額，避免等待同一個 run 時佔住名額
+            async with self._lock(run_id):
+                async with self._semaphore:
+                    self._queued -= 1
+                    queued = False
+                    self._running += 1
+                    try:
+                        return await factory()
+                    finally:
+                        self._running -= 1
+        finally:
+            if queued:
+                self._queued -= 1
+
+    def submit(self, run_id: str, factory: Callable[[], Awaitable]) -> asyncio.Task:
+        """排入一個屬於 run_id 的工作
+
+        Args:
+            run_id: 執行 ID（LangGraph thread ID）
+            factory: 回傳 coroutine 的函數（取得執行名額後才呼叫）
+
+        Returns:
+            asyncio.Task: 工作的 task
+        """
+        task = asyncio.get_running_loop().create_task(self._execute(run_id, factory), name=f"run:{run_id}")
+        self._tasks.setdefault(run_id, set()).add(task)
+        task.add_done_callback(lambda t: self._on_done(run_id, t))
+        return task
+
+    def _on_done(self, run_id: str, task: asyncio.Task):
+        tasks = self._tasks.get(run_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._tasks[run_id]
+                lock = self._locks.get(run_id)
+                if lock is not None and not lock.locked():
+                    del self._locks[run_id]
+
+        if task.cancelled():
+            print(f"工作流 {run_id} 已取消")
+        elif task.exception() is not None:
+            print(f"執行工作流 {run_id} 時出錯: {task.exception()!r}")
+
+    def cancel(self, run_id: str) -> bool:
+        """取消 run_id 所有執行中與排隊中的工作
+
+        注意：已在執行緒中執行的同步節點會跑完，但之後的節點不會再執行
+
+        Returns:
+            bool: 是否有工作被取消
+        """
+        tasks = self._tasks.get(run_id, set())
+        for task in tasks:
+            task.cancel()
+        return bool(tasks)
+
+    def is_active(self, run_id: str) -> bool:
+        return run_id in self._tasks
+
+    def stats(self) -> Dict[str, int]:
+        """目前的執行數量與排隊深度"""
+        return {
+            "running": self._running,
+            "queued": self._queued,
+            "max_concurrent": self.max_concurrent,
+        }
+
+    async def shutdown(self, timeout: float = 5.0):
+        """取消所有工作並等待結束"""
+        tasks = [task for tasks in self._tasks.values() for task in tasks]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
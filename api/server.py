@@ -2,21 +2,232 @@
 FastAPI 服務器 - 處理 Slack 互動回調
 優化用於 Render 免費方案（處理 cold start）
 """
-from fastapi import FastAPI, Request, BackgroundTasks
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Header
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 import os
 import hmac
 import hashlib
 import json
+import asyncio
+import threading
+import time
+from typing import Optional
 from urllib.parse import parse_qs
+from pydantic import BaseModel
 
 # ⚠️ 重要：在導入 graph 之前先初始化 credentials
 from init_credentials import init_credentials
 init_credentials()
 
-from agent.graph import graph  # 導入 compiled graph
+# agent.graph 會載入 langgraph / langchain_openai / googleapiclient，
+# 冷啟動時改為背景預熱，第一次使用時若尚未完成則等待（在執行緒中等待，不阻塞 event loop）
+WARMUP_MODULES = [
+    "agent.graph",
+    "services.ai_service",
+    "services.event_service",
+    "services.gmail_service",
+    "services.calendar_service",
+    "services.slack_service",
+    "langchain_openai",
+]
 
-app = FastAPI()
+_warmup_lock = threading.Lock()
+_warmup_timings: dict[str, float] = {}
+
+
+def _load_graph_module():
+    with _warmup_lock:
+        import agent.graph
+        return agent.graph
+
+
+async def get_graph():
+    """取得使用非同步 checkpointer 的 compiled graph（必要時等待載入與編譯）"""
+    graph_module = await asyncio.to_thread(_load_graph_module)
+    return await graph_module.get_async_graph()
+
+
+def warm_up(loop: Optional[asyncio.AbstractEventLoop] = None):
+    """預先載入重量級模組並編譯 graph，記錄每個模組的載入時間
+
+    Args:
+        loop: 服務的 event loop（非同步 checkpointer 必須在該 loop 中建立）
+    """
+    import importlib
+
+    with _warmup_lock:
+        start = time.perf_counter()
+        for module_name in WARMUP_MODULES:
+            module_start = time.perf_counter()
+            try:
+                importlib.import_module(module_name)
+            except Exception as e:
+                print(f"預熱模組 {module_name} 失敗: {e}")
+            _warmup_timings[module_name] = time.perf_counter() - module_start
+
+        module_start = time.perf_counter()
+        from agent.graph import get_async_graph
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(get_async_graph(), loop).result()
+        _warmup_timings["graph.compile"] = time.perf_counter() - module_start
+        _warmup_timings["total"] = time.perf_counter() - start
+
+    print("預熱完成: " + ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in _warmup_timings.items()))
+
+
+# ===== 執行管理 =====
+
+# 每次執行使用獨立的 thread ID（checkpoint 互不干擾），
+# 工作流以 asyncio task 執行，同時執行數量由 MAX_CONCURRENT_RUNS 限制，超過的排隊等待
+from api.runs import RunManager
+from api.confirmations import (
+    ConfirmationBuffer, ConfirmationBatch, CONFIRMATION_NODES, split_decisions, enqueue_message_updates
+)
+from api import tracking
+from api.triggers import TriggerRegistry, trigger_key, trigger_scope
+
+run_manager = RunManager()
+run_tracker = tracking.RunTracker()
+trigger_registry = TriggerRegistry()
+
+# inprocess：在本服務的 event loop 中執行；queue：寫入 job queue，由 worker.py 的獨立行程執行
+WORKFLOW_EXECUTOR = os.getenv("WORKFLOW_EXECUTOR", "inprocess").lower()
+JOB_EVENT_POLL_INTERVAL = 0.5
+
+
+def use_job_queue() -> bool:
+    return WORKFLOW_EXECUTOR == "queue"
+
+
+def executor_stats() -> dict:
+    """執行數量與排隊深度"""
+    if use_job_queue():
+        from services.job_queue import stats as job_stats
+        return {"executor": "queue", **job_stats()}
+    return {"executor": "inprocess", **run_manager.stats()}
+
+
+async def follow_job_events():
+    """queue 模式：讀取 worker 寫入的進度事件，更新 run_tracker（/runs 與 SSE 因此照常運作）"""
+    from services import job_queue
+
+    after_id = await asyncio.to_thread(job_queue.last_event_id)
+    while True:
+        try:
+            events = await asyncio.to_thread(job_queue.read_events, after_id)
+        except Exception as e:
+            print(f"讀取 job 事件失敗: {e}")
+            events = []
+
+        for event in events:
+            after_id = event['id']
+            run_id, data = event['run_id'], event['data']
+            if event['event'] == "start":
+                run_tracker.start(run_id, resume=data.get("resume", False), at=data.get("at"))
+            elif event['event'] == "node_start":
+                run_tracker.node_started(run_id, data["node"], at=data.get("at"))
+            elif event['event'] == "node_end":
+                run_tracker.node_finished(run_id, data["node"], error=data.get("error"),
+                                          counts=data.get("counts", {}), at=data.get("at"))
+            elif event['event'] == "finish":
+                run_tracker.finish(run_id, data["status"], error=data.get("error"),
+                                   current_node=data.get("current_node"), at=data.get("at"))
+                trigger_registry.release_run(run_id)
+
+        if not events:
+            await asyncio.sleep(JOB_EVENT_POLL_INTERVAL)
+
+
+async def checkpoint_maintenance_loop():
+    """定期修剪 checkpoints.db 與過期的節點快取，並釋放空間（CHECKPOINT_MAINTENANCE_INTERVAL 秒一次）"""
+    from agent.checkpointing import run_maintenance, CHECKPOINT_MAINTENANCE_INTERVAL
+    from agent.policies import prune_node_cache
+
+    while True:
+        await asyncio.sleep(CHECKPOINT_MAINTENANCE_INTERVAL)
+        try:
+            await asyncio.to_thread(run_maintenance)
+            await asyncio.to_thread(prune_node_cache)
+        except Exception as e:
+            print(f"Checkpoint 維護失敗: {e}")
+
+
+def _run_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+async def execute_run(graph, run_id: str, graph_input, resume: bool = False):
+    """以 astream 執行（或恢復）工作流，並將每個節點的開始 / 結束回報給 run_tracker
+
+    Args:
+        graph: 非同步 compiled graph
+        run_id: 執行 ID（thread ID）
+        graph_input: 初始 state；恢復時為 None
+        resume: 是否為恢復執行
+    """
+    from services.tracing import span
+
+    config = _run_config(run_id)
+    run_tracker.start(run_id, resume=resume)
+
+    # 整次執行為 trace 的根 span，節點與外部呼叫的 span 掛在其下
+    with span("workflow.run", kind="run", trace_id=run_id, resume=resume, executor="async") as run_span:
+        try:
+            async for task in graph.astream(graph_input, config, stream_mode="tasks"):
+                if "result" in task:
+                    run_tracker.node_finished(run_id, task["name"], task["result"], task.get("error"))
+                    print(f"[{run_id}] 節點完成: {task['name']}")
+                else:
+                    run_tracker.node_started(run_id, task["name"])
+        except asyncio.CancelledError:
+            run_tracker.finish(run_id, tracking.CANCELLED)
+            run_span.status = "cancelled"
+            raise
+        except Exception as e:
+            run_tracker.finish(run_id, tracking.FAILED, error=str(e))
+            raise
+
+        snapshot = await graph.aget_state(config)
+        if snapshot.next:
+            run_tracker.finish(run_id, tracking.WAITING, current_node=snapshot.next[0])
+            run_span.status = "interrupted"
+            run_span.set("waiting_for", snapshot.next[0])
+        else:
+            run_tracker.finish(run_id, tracking.COMPLETED)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 不阻塞啟動：讓 /health 立即可用，預熱在背景執行緒進行
+    if os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true":
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=warm_up, args=(loop,), name="graph-warmup", daemon=True).start()
+
+    # 已結束的 worker 行程留下的指標檔案併入 metrics-dead.json
+    from services.metrics import cleanup_dead_processes
+    await asyncio.to_thread(cleanup_dead_processes)
+
+    # 在 event loop 上送出 outbox 中的 Slack / Calendar 副作用（Slack 使用非同步用戶端）
+    from services.outbox import run_async_worker
+    background = [asyncio.create_task(run_async_worker())]
+    if use_job_queue():
+        background.append(asyncio.create_task(follow_job_events()))
+    if float(os.getenv("CHECKPOINT_MAINTENANCE_INTERVAL", "3600")) > 0:
+        background.append(asyncio.create_task(checkpoint_maintenance_loop()))
+    yield
+    for task in background:
+        task.cancel()
+    await run_manager.shutdown()
+
+    from services.slack_transport import close_async_slack_transport
+    await close_async_slack_transport()
+
+    from agent.graph import close_async_graph
+    await close_async_graph()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Slack 簽名驗證
 def verify_slack_signature(timestamp: str, body: str, signature: str) -> bool:
@@ -34,82 +245,76 @@ def verify_slack_signature(timestamp: str, body: str, signature: str) -> bool:
     return hmac.compare_digest(expected_signature, signature)
 
 
-def process_slack_interaction_background(action_id: str, event_id: str, channel: str, message_ts: str, original_blocks: list):
-    """後台處理 Slack 互動（避免超時）"""
-    from slack_sdk import WebClient
+# ===== 事件確認 =====
+
+def _on_confirmation_flush(batch: ConfirmationBatch):
+    """debounce 結束：先算好每則訊息更新後的 blocks，再排入一次工作流恢復"""
+    from services.slack_service import apply_event_decisions, get_pending_event_ids
+
+    updates = {}
+    for key, blocks in batch.messages.items():
+        updated = apply_event_decisions(blocks, batch.decisions)
+        confirmation_buffer.remember(key, updated, done=not get_pending_event_ids(updated))
+        updates[key] = updated
 
-    client = WebClient(token=os.getenv('SLACK_BOT_TOKEN'))
+    if use_job_queue():
+        # 由 loop.call_later 呼叫：寫入 SQLite 放到執行緒，經由 run_manager 保留 task 並讓同一個 run 依序排入
+        from services.job_queue import enqueue_job
+        payload = {
+            "decisions": batch.decisions,
+            "updates": [{"channel": channel, "ts": ts, "blocks": blocks} for (channel, ts), blocks in updates.items()],
+        }
+        run_manager.submit(batch.run_id, lambda: asyncio.to_thread(enqueue_job, 'resume', batch.run_id, payload))
+        return
 
+    run_manager.submit(batch.run_id, lambda: process_confirmations_background(batch, updates))
+
+
+confirmation_buffer = ConfirmationBuffer(_on_confirmation_flush)
+
+
+async def process_confirmations_background(batch: ConfirmationBatch, updates: dict):
+    """後台處理一批事件確認：恢復工作流一次，每則訊息送一次 chat.update"""
+    run_id = batch.run_id
     try:
-        thread_id = {"configurable": {"thread_id": "email-summary-run"}}
-
-        if action_id == "confirm_event":
-            # 用戶確認，更新狀態並恢復工作流
-            print(f"用戶確認事件: {event_id}")
-            status_emoji = "✅"
-            status_text = "已確認加入"
-
-            graph.update_state(
-                thread_id,
-                {"confirmed_events": [event_id]},
-                as_node="request_confirmation"
-            )
-        else:
-            # 用戶跳過
-            print(f"用戶跳過事件: {event_id}")
-            status_emoji = "⏭️"
-            status_text = "已略過"
-
-            graph.update_state(
-                thread_id,
-                {"confirmed_events": []},
-                as_node="request_confirmation"
-            )
-
-        # 恢復執行工作流
-        for event in graph.stream(None, thread_id, stream_mode="values"):
-            print(f"工作流執行中: {list(event.keys())}")
-
-        print("工作流恢復完成")
-
-        # 更新原始訊息，將處理的事件標記為已完成
-        updated_blocks = []
-        event_found = False
-
-        for block in original_blocks:
-            if block.get("block_id") == f"event_{event_id}":
-                # 找到對應的事件按鈕區塊，替換為狀態訊息
-                event_found = True
-                updated_blocks.append({
-                    "type": "context",
-                    "elements": [
-                        {
-                            "type": "mrkdwn",
-                            "text": f"{status_emoji} *{status_text}*"
-                        }
-                    ]
-                })
-            else:
-                # 保留其他區塊
-                updated_blocks.append(block)
-
-        if event_found:
-            # 更新 Slack 訊息
-            client.chat_update(
-                channel=channel,
-                ts=message_ts,
-                blocks=updated_blocks,
-                text=f"事件處理完成"  # fallback text
-            )
-            print(f"✓ Slack 訊息已更新（事件 {event_id}）")
+        graph = await get_graph()
+        config = _run_config(run_id)
+
+        snapshot = await graph.aget_state(config)
+        if not snapshot.next or snapshot.next[0] not in CONFIRMATION_NODES:
+            print(f"工作流 {run_id} 沒有在等待確認，忽略 {len(batch.decisions)} 個回應")
+            for key in updates:
+                confirmation_buffer.forget(key)
+            return
 
+        # 之前批次已處理的事件不再重複送出
+        confirmed, skipped = split_decisions(batch.decisions, snapshot.values.get('decided_events', []))
+        print(f"用戶回應（執行 {run_id}）: 確認 {len(confirmed)} 個、跳過 {len(skipped)} 個事件")
+
+        await graph.aupdate_state(
+            config,
+            {"confirmed_events": confirmed, "skipped_events": skipped},
+            as_node=snapshot.next[0]
+        )
+
+        # 恢復執行工作流（一次處理整批）
+        await execute_run(graph, run_id, None, resume=True)
+
+        print(f"工作流恢復完成: {run_id}")
+
+        await asyncio.to_thread(enqueue_message_updates, updates)
+
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
+        for key in updates:
+            confirmation_buffer.forget(key)
         print(f"處理 Slack 互動時出錯: {e}")
         import traceback
         traceback.print_exc()
 
 @app.post("/slack/interactive")
-async def handle_slack_interaction(request: Request, background_tasks: BackgroundTasks):
+async def handle_slack_interaction(request: Request):
     """
     處理 Slack 按鈕點擊回調
 
@@ -143,27 +348,32 @@ async def handle_slack_interaction(request: Request, background_tasks: Backgroun
     except Exception as e:
         return JSONResponse({"error": f"Invalid payload: {e}"}, status_code=400)
 
+    from services.slack_service import decode_action_value, get_pending_event_ids, ALL_EVENTS
+
     action = payload['actions'][0]
-    action_id = action['action_id']  # "confirm_event" 或 "skip_event"
-    event_id = action['value']  # event ID
+    action_id = action['action_id']  # "confirm_event" / "skip_event" / "confirm_all" / "skip_all"
+    run_id, event_id = decode_action_value(action['value'])  # 執行 ID（thread ID）與 event ID
 
     # 提取原始訊息資訊（用於更新 UI）
     channel = payload['channel']['id']
     message_ts = payload['message']['ts']
     original_blocks = payload['message']['blocks']
 
+    confirm = action_id in ("confirm_event", "confirm_all")
+    if event_id == ALL_EVENTS:
+        # 批次按鈕：套用到這則訊息中尚未回應的事件
+        blocks = confirmation_buffer.current_blocks(channel, message_ts, original_blocks)
+        already = confirmation_buffer.decided(run_id)
+        decisions = {e: confirm for e in get_pending_event_ids(blocks) if e not in already}
+    else:
+        decisions = {event_id: confirm}
+
+    # 暫存回應，debounce 結束後一次恢復工作流
+    confirmation_buffer.add(run_id, decisions, channel, message_ts, original_blocks)
+
     # **立即回應** Slack（避免超時）
-    response_text = f"收到！正在{'確認' if action_id == 'confirm_event' else '跳過'}事件..."
-
-    # 將實際處理放到後台
-    background_tasks.add_task(
-        process_slack_interaction_background,
-        action_id,
-        event_id,
-        channel,
-        message_ts,
-        original_blocks
-    )
+    target = f" {len(decisions)} 個事件" if event_id == ALL_EVENTS else "事件"
+    response_text = f"收到！正在{'確認' if confirm else '跳過'}{target}..."
 
     # 3 秒內回應 Slack
     return JSONResponse({
@@ -172,33 +382,183 @@ async def handle_slack_interaction(request: Request, background_tasks: Backgroun
         "replace_original": False  # 保留原訊息
     })
 
+class TriggerRequest(BaseModel):
+    """觸發參數（皆可省略）"""
+    time_range: str = "24h"
+    max_emails: int = 20
+    idempotency_key: Optional[str] = None  # 也可用 Idempotency-Key header 提供
+
+
+async def _existing_run_status(run_id: str) -> Optional[str]:
+    """run 目前的狀態（沒有執行過時回傳 None；服務重啟後由 checkpoint 判斷）"""
+    record = run_tracker.get(run_id)
+    if record is not None:
+        return record.status
+
+    checkpointed = await _checkpointed_run(run_id)
+    return checkpointed["status"] if checkpointed else None
+
+
+async def _checkpointed_run(run_id: str) -> Optional[dict]:
+    """由 checkpoint 重建 run 的狀態（服務重啟後記憶體中沒有記錄時使用；沒有 checkpoint 時回傳 None）"""
+    graph = await get_graph()
+    snapshot = await graph.aget_state(_run_config(run_id))
+    if not snapshot.values:
+        return None
+    if not snapshot.next:
+        status = tracking.COMPLETED
+    else:
+        # 停在確認以外的節點，表示上次執行中途失敗或服務被中斷
+        status = tracking.WAITING if snapshot.next[0] in CONFIRMATION_NODES else tracking.FAILED
+    return {
+        "run_id": run_id,
+        "status": status,
+        "current_node": snapshot.next[0] if snapshot.next else None,
+        "counts": tracking.count_outputs(snapshot.values),
+        "updated_at": snapshot.created_at,
+    }
+
+
 @app.post("/webhook/email-summary")
-async def trigger_email_summary(background_tasks: BackgroundTasks):
+async def trigger_email_summary(params: Optional[TriggerRequest] = None,
+                                idempotency_key: Optional[str] = Header(None)):
     """
     觸發 Email Summary 工作流
     用於 GitHub Actions 或其他定時任務調用
+
+    每次執行有獨立的 thread ID，以 asyncio task 執行；
+    超過 MAX_CONCURRENT_RUNS 的執行會排隊（排隊深度見 /health）
+
+    重複觸發不會重新執行：
+    - 同一範圍（帳號設定 + 時間範圍）已有執行中的 run → 附加到該 run（status=attached）
+    - 相同冪等鍵（Idempotency-Key，或同一時間區間）已執行過 → 回傳該 run（status=duplicate）
+    - 該 run 上次中途失敗或被取消 → 從最後的 checkpoint 繼續（status=resumed），已完成的節點不會重跑
     """
-    thread_id = {"configurable": {"thread_id": "email-summary-run"}}
+    params = params or TriggerRequest()
+    scope = trigger_scope(params.time_range)
+
+    active = trigger_registry.active_run(scope)
+    if active:
+        return {"status": "attached", "run_id": active, "message": "Email summary workflow already running"}
+
+    key = trigger_key(params.time_range, params.max_emails, idempotency_key or params.idempotency_key)
+    run_id = trigger_registry.run_for_key(key)
+
+    existing = await _existing_run_status(run_id)
+    resume = False
+    if existing in (tracking.FAILED, tracking.CANCELLED):
+        graph = await get_graph()
+        snapshot = await graph.aget_state(_run_config(run_id))
+        if snapshot.next and snapshot.next[0] not in CONFIRMATION_NODES:
+            # 從失敗的節點繼續（已完成的 fetch / AI 節點結果保存在 checkpoint）
+            resume = True
+        else:
+            # 沒有可恢復的 checkpoint：以新的 run ID 重新執行（AI 節點仍可命中節點快取）
+            run_id = trigger_registry.replace(key)
+    elif existing is not None:
+        return {"status": "duplicate", "run_id": run_id, "message": f"Email summary workflow already {existing}"}
+
+    # 查詢 checkpoint 期間可能已有其他請求開始執行
+    if not trigger_registry.acquire(scope, run_id):
+        active = trigger_registry.active_run(scope)
+        return {"status": "attached", "run_id": active, "message": "Email summary workflow already running"}
 
-    def run_workflow():
+    async def run_workflow():
         try:
-            # 執行完整工作流
-            for event in graph.stream(
-                {"time_range": "24h", "max_emails": 20},
-                thread_id,
-                stream_mode="values"
-            ):
-                print(f"工作流執行中: {list(event.keys())}")
-            print("Email Summary 完成")
+            graph = await get_graph()
+
+            # 執行完整工作流（恢復時從最後的 checkpoint 繼續）
+            await execute_run(graph, run_id, None if resume else graph_input, resume=resume)
+            print(f"Email Summary 完成: {run_id}")
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print(f"執行工作流時出錯: {e}")
+            print(f"執行工作流 {run_id} 時出錯: {e}")
             import traceback
             traceback.print_exc()
 
-    # 放到後台執行
-    background_tasks.add_task(run_workflow)
+    graph_input = {"time_range": params.time_range, "max_emails": params.max_emails}
+    run_tracker.create(run_id, graph_input)
+
+    if use_job_queue():
+        # 交給 worker 行程（checkpoint 停在中途時 worker 會自動繼續）；worker 回報結束（或等待確認）時釋放範圍
+        from services.job_queue import enqueue_job
+        await asyncio.to_thread(enqueue_job, 'run', run_id, graph_input)
+    else:
+        # 放到後台 task 執行；結束（含排隊中被取消）後釋放範圍
+        task = run_manager.submit(run_id, run_workflow)
+        task.add_done_callback(lambda _: trigger_registry.release(scope, run_id))
+
+    if resume:
+        return {"status": "resumed", "run_id": run_id, "message": f"Email summary workflow {existing}, resuming from checkpoint"}
+    return {"status": "triggered", "run_id": run_id, "message": "Email summary workflow started"}
+
+
+@app.post("/runs/{run_id}/cancel")
+async def cancel_run(run_id: str):
+    """取消執行中或排隊中的工作流"""
+    if use_job_queue():
+        from services.job_queue import cancel_jobs
+        cancelled = await asyncio.to_thread(cancel_jobs, run_id) > 0
+    else:
+        cancelled = run_manager.cancel(run_id)
+
+    if not cancelled:
+        return JSONResponse({"error": f"Run {run_id} is not active"}, status_code=404)
+
+    # 尚在排隊的 run 不會開始執行，直接標記為已取消
+    record = run_tracker.get(run_id)
+    if record is not None and record.status == tracking.QUEUED:
+        run_tracker.finish(run_id, tracking.CANCELLED)
+        trigger_registry.release_run(run_id)
+    return {"status": "cancelling", "run_id": run_id}
+
+
+@app.get("/runs")
+async def list_runs(status: Optional[str] = None, limit: int = 50):
+    """列出最近的執行（新到舊），可依狀態篩選"""
+    runs = run_tracker.list(status=status, limit=limit)
+    return {
+        "runs": [run.to_dict(include_nodes=False) for run in runs],
+        "stats": executor_stats(),
+    }
+
+
+@app.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    """單一執行的狀態：目前節點、各節點耗時與輸出數量、錯誤
+
+    服務重啟後記憶體中沒有記錄時，改由 checkpoint 提供目前狀態
+    """
+    record = run_tracker.get(run_id)
+    if record is not None:
+        return record.to_dict()
 
-    return {"status": "triggered", "message": "Email summary workflow started"}
+    checkpointed = await _checkpointed_run(run_id)
+    if checkpointed is None:
+        return JSONResponse({"error": f"Run {run_id} not found"}, status_code=404)
+    return checkpointed
+
+
+@app.get("/runs/{run_id}/events")
+async def stream_run_events(run_id: str):
+    """以 server-sent events 推送節點進度（status / node_start / node_end），run 閒置時結束
+
+    服務重啟後記憶體中沒有記錄時，改由 checkpoint 提供狀態，只送出一個 status 事件後結束
+    """
+    if run_tracker.get(run_id) is not None:
+        events = run_tracker.events(run_id)
+    else:
+        checkpointed = await _checkpointed_run(run_id)
+        if checkpointed is None:
+            return JSONResponse({"error": f"Run {run_id} not found"}, status_code=404)
+        events = iter([tracking.format_sse("status", checkpointed)])
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/")
@@ -211,10 +571,51 @@ async def root():
     }
 
 
+def _storage_stats() -> dict:
+    """各 SQLite 資料庫的統計（同步查詢，由 /health 放到執行緒中執行）"""
+    from services.outbox import stats as outbox_stats
+    from services.email_store import stats as email_store_stats
+    from services.digest_store import stats as digest_stats
+    from agent.checkpointing import stats as checkpoint_stats
+
+    return {
+        "outbox": outbox_stats(),
+        "email_store": email_store_stats(),
+        "digests": digest_stats(),
+        "checkpoints": checkpoint_stats(),
+        "runs": executor_stats(),
+    }
+
+
 @app.get("/health")
 async def health():
-    """Render 健康檢查"""
-    return {"status": "healthy"}
+    """Render 健康檢查（資料庫統計在執行緒中查詢，不阻塞 event loop）"""
+    return {
+        "status": "healthy",
+        **await asyncio.to_thread(_storage_stats),
+        "pending_confirmations": confirmation_buffer.pending(),
+        "warm": "total" in _warmup_timings,
+        "warmup_ms": {name: round(seconds * 1000) for name, seconds in _warmup_timings.items()}
+    }
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 指標（節點耗時、外部 API 呼叫、郵件數、佇列深度、checkpoint 大小）"""
+    from services import metrics
+    from services.outbox import pending_count
+
+    runs = await asyncio.to_thread(executor_stats)
+    running = runs.get("running", runs.get("jobs", {}).get("running", 0))
+    metrics.set_gauge('email_summary_runs_in_progress', running)
+    metrics.set_gauge('email_summary_queue_depth', runs["queued"], {'queue': 'runs'})
+    metrics.set_gauge('email_summary_queue_depth', await asyncio.to_thread(pending_count), {'queue': 'outbox'})
+    metrics.set_gauge('email_summary_queue_depth', sum(confirmation_buffer.pending().values()), {'queue': 'confirmations'})
+
+    from agent.checkpointing import database_bytes
+    metrics.set_gauge('email_summary_checkpoint_db_bytes', await asyncio.to_thread(database_bytes))
+
+    return PlainTextResponse(await asyncio.to_thread(metrics.render), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
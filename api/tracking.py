@@ -0,0 +1,213 @@
+"""
+工作流執行追蹤
+記錄每個 run 的狀態、目前節點、各節點耗時與輸出數量，並推送給 SSE 訂閱者：
+    - GET /runs                列出最近的執行
+    - GET /runs/{run_id}        單一執行的狀態
+    - GET /runs/{run_id}/events 以 server-sent events 即時推送節點進度
+"""
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from services import metrics
+
+RUN_HISTORY_LIMIT = int(os.getenv("RUN_HISTORY_LIMIT", "200"))
+
+# 執行狀態
+QUEUED = "queued"
+RUNNING = "running"
+WAITING = "waiting_confirmation"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# 這些狀態之後不會再有新的節點事件（直到下一次恢復）
+IDLE_STATUSES = (WAITING, COMPLETED, FAILED, CANCELLED)
+
+
+@dataclass
+class NodeTiming:
+    """單一節點的執行記錄"""
+    node: str
+    started_at: float
+    finished_at: Optional[float] = None
+    duration_ms: Optional[float] = None
+    counts: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+@dataclass
+class RunRecord:
+    """單一工作流執行的狀態"""
+    run_id: str
+    status: str = QUEUED
+    params: Dict = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    current_node: Optional[str] = None
+    nodes: List[NodeTiming] = field(default_factory=list)
+    counts: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+    resumes: int = 0
+
+    def to_dict(self, include_nodes: bool = True) -> Dict:
+        data = asdict(self)
+        if not include_nodes:
+            data.pop('nodes')
+        if self.started_at:
+            data['duration_ms'] = round(((self.finished_at or time.time()) - self.started_at) * 1000)
+        return data
+
+
+def count_outputs(update) -> Dict[str, int]:
+    """節點輸出中各欄位的數量（list / dict 的長度；分類結果展開為各等級數量）"""
+    counts = {}
+    if not isinstance(update, dict):
+        return counts
+    for key, value in update.items():
+        if isinstance(value, list):
+            counts[key] = len(value)
+        elif isinstance(value, dict):
+            if value and all(isinstance(v, list) for v in value.values()):
+                for sub_key, items in value.items():
+                    counts[f"{key}.{sub_key}"] = len(items)
+            else:
+                counts[key] = len(value)
+    return counts
+
+
+class RunTracker:
+    """保存最近 RUN_HISTORY_LIMIT 個執行的狀態，並把事件推送給訂閱者（只能在同一個 event loop 中使用）"""
+
+    def __init__(self, limit: int = RUN_HISTORY_LIMIT):
+        self.limit = limit
+        self._runs: "OrderedDict[str, RunRecord]" = OrderedDict()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    # ----- 查詢 -----
+
+    def get(self, run_id: str) -> Optional[RunRecord]:
+        return self._runs.get(run_id)
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[RunRecord]:
+        """最近的執行（新到舊）"""
+        runs = [run for run in reversed(self._runs.values()) if status is None or run.status == status]
+        return runs[:limit]
+
+    # ----- 狀態更新 -----
+
+    def create(self, run_id: str, params: Optional[Dict] = None) -> RunRecord:
+        record = self._runs.get(run_id)
+        if record is None:
+            record = self._runs[run_id] = RunRecord(run_id, params=params or {})
+            while len(self._runs) > self.limit:
+                self._runs.popitem(last=False)
+        elif record.status in (FAILED, CANCELLED):
+            # 失敗的 run 重新排入（從 checkpoint 繼續）
+            record.status = QUEUED
+            record.error = None
+        self._publish(run_id, "status", record.to_dict(include_nodes=False))
+        return record
+
+    def _record(self, run_id: str) -> RunRecord:
+        # 服務重啟後恢復的 run 沒有記錄，補建一筆
+        return self._runs.get(run_id) or self.create(run_id)
+
+    def start(self, run_id: str, resume: bool = False, at: Optional[float] = None):
+        record = self._record(run_id)
+        record.status = RUNNING
+        record.finished_at = None
+        record.error = None
+        if resume:
+            record.resumes += 1
+        record.started_at = record.started_at or at or time.time()
+        self._publish(run_id, "status", record.to_dict(include_nodes=False))
+
+    # at：事件發生時間（由 worker 行程回報時使用，預設為現在）
+
+    def node_started(self, run_id: str, node: str, at: Optional[float] = None):
+        record = self._record(run_id)
+        record.current_node = node
+        record.nodes.append(NodeTiming(node, started_at=at or time.time()))
+        self._publish(run_id, "node_start", {"node": node})
+
+    def node_finished(self, run_id: str, node: str, result=None, error: Optional[str] = None,
+                      counts: Optional[Dict[str, int]] = None, at: Optional[float] = None):
+        record = self._record(run_id)
+        finished_at = at or time.time()
+        timing = next((t for t in reversed(record.nodes) if t.node == node and t.finished_at is None), None)
+        if timing is None:
+            timing = NodeTiming(node, started_at=finished_at)
+            record.nodes.append(timing)
+        timing.finished_at = finished_at
+        timing.duration_ms = round((timing.finished_at - timing.started_at) * 1000, 1)
+        timing.counts = counts if counts is not None else count_outputs(result)
+        timing.error = error
+        record.counts.update(timing.counts)
+        metrics.observe('email_summary_node_duration_seconds', timing.finished_at - timing.started_at, {'node': node})
+        if node == 'fetch_emails' and 'email_refs' in timing.counts:
+            metrics.observe('email_summary_run_emails', timing.counts['email_refs'])
+        if record.current_node == node:
+            record.current_node = None
+        self._publish(run_id, "node_end", asdict(timing))
+
+    def finish(self, run_id: str, status: str, error: Optional[str] = None, current_node: Optional[str] = None,
+               at: Optional[float] = None):
+        record = self._record(run_id)
+        record.status = status
+        record.error = error
+        record.current_node = current_node
+        record.finished_at = at or time.time()
+        metrics.inc('email_summary_runs_total', {'status': status})
+        self._publish(run_id, "status", record.to_dict(include_nodes=False))
+
+    # ----- 訂閱 -----
+
+    def _publish(self, run_id: str, event: str, data: Dict):
+        for queue in self._subscribers.get(run_id, ()):
+            queue.put_nowait((event, data))
+
+    async def events(self, run_id: str, heartbeat: float = 15.0) -> AsyncIterator[str]:
+        """以 SSE 格式產生 run 的事件：先送出目前狀態與已完成的節點，再即時推送，直到 run 閒置
+
+        Args:
+            run_id: 執行 ID
+            heartbeat: 沒有事件時送出註解行的間隔秒數（避免代理伺服器斷線）
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(run_id, set()).add(queue)
+        try:
+            record = self._record(run_id)
+            yield format_sse("status", record.to_dict(include_nodes=False))
+            for timing in record.nodes:
+                yield format_sse("node_start", {"node": timing.node})
+                if timing.finished_at is not None:
+                    yield format_sse("node_end", asdict(timing))
+            if record.status in IDLE_STATUSES:
+                return
+
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, data)
+                if event == "status" and data.get("status") in IDLE_STATUSES:
+                    return
+        finally:
+            subscribers = self._subscribers.get(run_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[run_id]
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """server-sent event 格式"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,88 @@
+"""
+觸發去重
+GitHub Actions 重試或手動 workflow_dispatch 可能在幾分鐘內多次呼叫 /webhook/email-summary：
+    - 冪等鍵（Idempotency-Key header，未提供時以時間區間 + 參數推導）決定固定的 run ID，
+      重複的請求回傳同一個 run，不會重新執行（服務重啟後仍可由 checkpoint 判斷）
+    - 同一個範圍（帳號設定 + 時間範圍）同時只會有一個執行中的 run，其他觸發直接附加到該 run
+"""
+import os
+import time
+import hashlib
+import uuid
+from typing import Dict, Optional
+
+# 未提供冪等鍵時，同一時間區間內的觸發視為重複（秒）
+TRIGGER_DEDUP_WINDOW = int(os.getenv("TRIGGER_DEDUP_WINDOW", "900"))
+
+
+def trigger_scope(time_range: str) -> str:
+    """互斥範圍：目前的 Gmail 帳號設定 + 時間範圍（同一範圍不同時執行兩個 run）"""
+    accounts = "multi" if os.getenv('GMAIL_MULTI_ACCOUNT', 'false').lower() == 'true' else "single"
+    return f"{accounts}:{time_range}"
+
+
+def trigger_key(time_range: str, max_emails: int, idempotency_key: Optional[str] = None,
+                now: Optional[float] = None) -> str:
+    """觸發的冪等鍵
+
+    Args:
+        time_range: 時間範圍
+        max_emails: 最多處理幾封郵件
+        idempotency_key: 呼叫端提供的鍵（例如 GitHub Actions 的 run ID）
+        now: 目前時間（預設 time.time()）
+
+    Returns:
+        str: 冪等鍵
+    """
+    scope = trigger_scope(time_range)
+    if idempotency_key:
+        return f"key:{scope}:{idempotency_key}"
+    bucket = int((now or time.time()) // TRIGGER_DEDUP_WINDOW)
+    return f"bucket:{scope}:{max_emails}:{bucket}"
+
+
+def run_id_for_key(key: str) -> str:
+    """由冪等鍵推導固定的 run ID（同時作為 LangGraph thread ID）"""
+    return f"email-summary-{hashlib.sha256(key.encode()).hexdigest()[:12]}"
+
+
+def retry_run_id(run_id: str) -> str:
+    """同一個冪等鍵的前一次執行失敗時，重新執行使用的新 run ID（不沿用失敗的 checkpoint）"""
+    return f"{run_id}-{uuid.uuid4().hex[:6]}"
+
+
+class TriggerRegistry:
+    """記錄每個範圍執行中的 run，以及冪等鍵對應的最新 run（只能在同一個 event loop 中使用）"""
+
+    def __init__(self):
+        self._active: Dict[str, str] = {}  # 範圍 → 執行中的 run ID
+        self._retries: Dict[str, str] = {}  # 冪等鍵 → 重新執行的 run ID
+
+    def active_run(self, scope: str) -> Optional[str]:
+        return self._active.get(scope)
+
+    def acquire(self, scope: str, run_id: str) -> bool:
+        """佔用範圍；已有執行中的 run 時回傳 False"""
+        if scope in self._active:
+            return False
+        self._active[scope] = run_id
+        return True
+
+    def release(self, scope: str, run_id: str):
+        if self._active.get(scope) == run_id:
+            del self._active[scope]
+
+    def release_run(self, run_id: str):
+        """釋放 run 佔用的範圍（不知道範圍時使用）"""
+        for scope, active in list(self._active.items()):
+            if active == run_id:
+                del self._active[scope]
+
+    def run_for_key(self, key: str) -> str:
+        """冪等鍵目前對應的 run ID"""
+        return self._retries.get(key) or run_id_for_key(key)
+
+    def replace(self, key: str) -> str:
+        """前一次執行失敗：為冪等鍵配置新的 run ID"""
+        run_id = self._retries[key] = retry_run_id(run_id_for_key(key))
+        return run_id
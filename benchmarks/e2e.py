@@ -0,0 +1,267 @@
+"""
+端到端離線基準測試
+以合成信箱（benchmarks/mailbox.py）與本機假服務（benchmarks/fakes.py）執行編譯後的 agent/graph.graph，
+涵蓋抓取、正規化、分類 / 摘要 / 事件判斷、日曆比對、報告、Slack 通知（outbox）與事件確認後建立日曆事件。
+
+每個郵件量在獨立的子行程與暫存目錄中執行（checkpoints.db 等資料庫互不影響、峰值記憶體各自計算），回報：
+    - 吞吐量（封 / 秒）與整體耗時
+    - 各節點耗時（由 services/tracing.py 的 node span 計算）與外部呼叫次數 / 耗時
+    - 峰值記憶體（RSS 高水位，扣除執行前的基準）、checkpoint 資料庫大小、LLM 呼叫次數與 prompt 字元數
+    - --rerun：以新的 run ID 再執行一次相同信箱（節點快取、增量摘要生效的路徑）
+
+使用方式:
+    python benchmarks/e2e.py                                  # 10 / 100 / 1000 封，單一帳號
+    python benchmarks/e2e.py --volumes 10,100,1000,10000 --accounts 3
+    python benchmarks/e2e.py --llm-latency-ms 800 --api-latency-ms 50   # 模擬網路延遲
+    python benchmarks/e2e.py --output bench.json              # 輸出 JSON 結果（含 git commit）
+    python benchmarks/e2e.py --compare bench.json             # 與先前的結果比較
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_VOLUMES = '10,100,1000'
+
+
+def _peak_rss_mb() -> float:
+    """目前行程的 RSS 高水位（MB）"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位為 KB，macOS 為 bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _span_stats(spans: List[Dict], kind: str) -> Dict[str, Dict]:
+    stats = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'errors': 0})
+    for span in spans:
+        if span['kind'] != kind:
+            continue
+        name = span['name'].removeprefix('node.')
+        entry = stats[name]
+        entry['count'] += 1
+        entry['total_ms'] += span['duration_ms']
+        entry['max_ms'] = max(entry['max_ms'], span['duration_ms'])
+        entry['errors'] += span['status'] == 'error'
+    return {name: {**entry, 'total_ms': round(entry['total_ms'], 2), 'max_ms': round(entry['max_ms'], 2)}
+            for name, entry in sorted(stats.items(), key=lambda item: -item[1]['total_ms'])}
+
+
+# ===== 子行程：執行一個郵件量 =====
+
+def run_volume(volume: int, accounts: int, seed: int, api_latency: float, llm_latency: float,
+               llm_latency_per_kchar: float, rerun: bool) -> Dict:
+    """在目前目錄（暫存目錄）執行工作流並回傳量測結果"""
+    import contextlib
+    from benchmarks.mailbox import generate_mailboxes
+    from benchmarks.fakes import install
+
+    mailboxes = generate_mailboxes(volume, accounts, seed)
+    fakes = install(mailboxes, api_latency, llm_latency, llm_latency_per_kchar)
+
+    start = time.perf_counter()
+    from agent.graph import get_graph
+    from services import tracing
+    from services.outbox import drain
+    from agent.checkpointing import database_bytes
+    graph = get_graph()
+    compile_seconds = time.perf_counter() - start
+
+    baseline_rss = _peak_rss_mb()
+    runs = []
+    for attempt in range(2 if rerun else 1):
+        run_id = f'bench-{volume}-{attempt}'
+        config = {'configurable': {'thread_id': run_id}}
+        llm_before = fakes.llm.stats()
+
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            with tracing.span('workflow.run', kind='run', trace_id=run_id, executor='benchmark'):
+                graph.invoke({'time_range': '24h', 'max_emails': volume}, config)
+                snapshot = graph.get_state(config)
+                # 模擬在 Slack 按下「全部確認」：與 api/server.py 相同，寫入中斷節點的 state 後恢復
+                # （Command(resume=...) 會重新執行 request_confirmation，再送一次確認請求）
+                if snapshot.next and snapshot.next[0] == 'request_confirmation':
+                    event_ids = [event['id'] for event in snapshot.values.get('detected_events', [])]
+                    graph.update_state(config, {"confirmed_events": event_ids, "skipped_events": []},
+                                       as_node=snapshot.next[0])
+                    graph.invoke(None, config)
+            graph_seconds = time.perf_counter() - start
+            delivered = drain(timeout=60)
+        total_seconds = time.perf_counter() - start
+
+        tracing.flush()
+        spans = tracing.read_spans(trace_id=run_id)
+        state = graph.get_state(config).values
+        llm_after = fakes.llm.stats()
+        emails = len(state.get('email_refs', []))
+        runs.append({
+            'run_id': run_id,
+            'emails': emails,
+            'graph_seconds': round(graph_seconds, 4),
+            'total_seconds': round(total_seconds, 4),
+            'throughput_emails_per_s': round(emails / graph_seconds, 2) if graph_seconds else None,
+            'nodes': _span_stats(spans, 'node'),
+            'external_calls': _span_stats(spans, 'client'),
+            'accounts': _span_stats(spans, 'account'),
+            'llm_calls': llm_after['calls'] - llm_before['calls'],
+            'llm_prompt_chars': llm_after['prompt_chars'] - llm_before['prompt_chars'],
+            'events_detected': len(state.get('detected_events', [])),
+            'calendar_events_created': len(state.get('calendar_events_created', [])),
+            'outbox_delivered': delivered,
+        })
+
+    return {
+        'volume': volume,
+        'accounts': accounts,
+        'compile_seconds': round(compile_seconds, 4),
+        'baseline_rss_mb': round(baseline_rss, 1),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'peak_rss_delta_mb': round(_peak_rss_mb() - baseline_rss, 1),
+        'checkpoint_db_bytes': database_bytes(),
+        'services': fakes.stats(),
+        'runs': runs,
+    }
+
+
+def _child_main(args) -> int:
+    sys.path.insert(0, str(ROOT))
+    result = run_volume(args.volume, args.accounts, args.seed, args.api_latency_ms / 1000,
+                        args.llm_latency_ms / 1000, args.llm_latency_per_kchar_ms / 1000, args.rerun)
+    Path(args.result_file).write_text(json.dumps(result, ensure_ascii=False, default=str))
+    return 0
+
+
+# ===== 主行程 =====
+
+def measure_volume(volume: int, args) -> Dict:
+    """在獨立子行程與暫存目錄中執行一個郵件量"""
+    with tempfile.TemporaryDirectory(prefix='email-bench-') as workdir:
+        result_file = os.path.join(workdir, 'result.json')
+        env = dict(os.environ)
+        env.update({
+            'PYTHONPATH': str(ROOT) + os.pathsep + env.get('PYTHONPATH', ''),
+            'PYTHONDONTWRITEBYTECODE': '1',
+            'OPENAI_API_KEY': 'benchmark',
+            'GMAIL_MULTI_ACCOUNT': 'true' if args.accounts > 1 else 'false',
+            'SLACK_WEBHOOK_URL': 'https://hooks.slack.invalid/benchmark',
+            'SLACK_CHANNEL_ID': 'CBENCHMARK',
+            'TRACE_EXPORTER': 'jsonl',
+            'TRACE_FILE': os.path.join(workdir, 'traces.jsonl'),
+        })
+        env.pop('METRICS_MULTIPROC_DIR', None)
+        command = [
+            sys.executable, str(Path(__file__).resolve()), '--child',
+            '--volume', str(volume), '--accounts', str(args.accounts), '--seed', str(args.seed),
+            '--api-latency-ms', str(args.api_latency_ms), '--llm-latency-ms', str(args.llm_latency_ms),
+            '--llm-latency-per-kchar-ms', str(args.llm_latency_per_kchar_ms), '--result-file', result_file,
+        ] + (['--rerun'] if args.rerun else [])
+
+        result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True,
+                                stdin=subprocess.DEVNULL)
+        if result.returncode != 0 or not os.path.exists(result_file):
+            raise RuntimeError(f'{volume} 封郵件的基準測試失敗:\n{result.stderr[-3000:]}')
+        return json.loads(Path(result_file).read_text())
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_results(report: Dict, baseline: Optional[Dict]):
+    baseline_runs = {}
+    if baseline:
+        for result in baseline.get('results', []):
+            for i, run in enumerate(result['runs']):
+                baseline_runs[(result['volume'], result['accounts'], i)] = run
+
+    def delta(current: float, previous: Optional[float]) -> str:
+        if not previous:
+            return ''
+        return f' ({(current - previous) / previous:+.0%})'
+
+    for result in report['results']:
+        print(f"\n== {result['volume']} 封郵件，{result['accounts']} 個帳號 "
+              f"（峰值 RSS +{result['peak_rss_delta_mb']}MB，checkpoints {result['checkpoint_db_bytes'] / 1024:.0f}KB）")
+        for i, run in enumerate(result['runs']):
+            previous = baseline_runs.get((result['volume'], result['accounts'], i), {})
+            label = '首次執行' if i == 0 else '重新執行'
+            print(f"  {label}: {run['emails']} 封，graph {run['graph_seconds']:.2f}s"
+                  f"{delta(run['graph_seconds'], previous.get('graph_seconds'))}，"
+                  f"{run['throughput_emails_per_s']} 封/秒"
+                  f"{delta(run['throughput_emails_per_s'] or 0, previous.get('throughput_emails_per_s'))}，"
+                  f"LLM {run['llm_calls']} 次 / {run['llm_prompt_chars']} 字元，"
+                  f"事件 {run['events_detected']} 個")
+            for name, stats in run['nodes'].items():
+                previous_ms = previous.get('nodes', {}).get(name, {}).get('total_ms')
+                print(f"    {name:<28} {stats['total_ms']:>10.1f}ms{delta(stats['total_ms'], previous_ms):<8} "
+                      f"×{stats['count']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='端到端離線基準測試（合成信箱 + 假服務）')
+    parser.add_argument('--volumes', default=DEFAULT_VOLUMES, help=f'郵件量，逗號分隔（預設 {DEFAULT_VOLUMES}）')
+    parser.add_argument('--accounts', type=int, default=1, choices=(1, 3),
+                        help='帳號數（3 = GMAIL_MULTI_ACCOUNT 模式）')
+    parser.add_argument('--seed', type=int, default=0, help='合成信箱的亂數種子')
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help='每次 Gmail / Calendar / Slack 呼叫的延遲')
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help='每次 LLM 呼叫的固定延遲')
+    parser.add_argument('--llm-latency-per-kchar-ms', type=float, default=0.0, help='每 1000 字元 prompt 增加的 LLM 延遲')
+    parser.add_argument('--rerun', action='store_true', help='以相同信箱再執行一次（快取 / 增量摘要路徑）')
+    parser.add_argument('--json', action='store_true', help='輸出 JSON')
+    parser.add_argument('--output', help='將 JSON 結果寫入檔案')
+    parser.add_argument('--compare', help='與先前輸出的 JSON 結果比較')
+    # 內部使用：子行程執行單一郵件量
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--volume', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return _child_main(args)
+
+    volumes = [int(volume) for volume in args.volumes.split(',') if volume.strip()]
+    results = []
+    for volume in volumes:
+        if not args.json:
+            print(f'執行 {volume} 封郵件…', file=sys.stderr)
+        results.append(measure_volume(volume, args))
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': {key: value for key, value in vars(args).items()
+                     if key not in ('child', 'volume', 'result_file', 'json', 'output', 'compare')},
+        },
+        'results': results,
+    }
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2) + '\n')
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+        if baseline:
+            print(f"比較基準: {baseline['meta'].get('commit')}（{baseline['meta'].get('timestamp')}）")
+        _print_results(report, baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
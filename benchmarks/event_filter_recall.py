@@ -0,0 +1,109 @@
+"""
+事件候選過濾器 Recall 量測
+讀取 EVENT_RECORDINGS_PATH 錄製的 JSONL（建議以 EVENT_PREFILTER=false 錄製，
+讓每封郵件都經過 LLM 標註），以目前的過濾規則重新判斷，計算：
+    - recall: LLM 檢測出事件的郵件中，有多少被判為候選（不能漏掉事件）
+    - reduction: 有多少郵件不需送交 LLM
+
+錄製檔不含正文：只有郵件 ID / 正文的雜湊與日期、時間、地點附近的遮蔽摘錄，規則以摘錄重新判斷。
+未指定錄製檔時使用 benchmarks/fixtures/event_filter_synthetic.jsonl：人工撰寫並標註的合成郵件（synthetic: true），
+以錄製格式保存，用於回歸測試；過濾器在真實信箱上的 recall / reduction 需以實際錄製的資料量測。
+
+使用方式:
+    python benchmarks/event_filter_recall.py                                       # 合成資料集
+    EVENT_PREFILTER=false EVENT_RECORDINGS_PATH=event_runs.jsonl python main.py   # 錄製
+    python benchmarks/event_filter_recall.py event_runs.jsonl                      # 量測
+    python benchmarks/event_filter_recall.py event_runs.jsonl --min-recall 0.98    # CI 門檻
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.event_filter import get_candidate_reasons, recording_to_email  # noqa: E402
+
+DEFAULT_FIXTURE = Path(__file__).resolve().parent / 'fixtures' / 'event_filter_synthetic.jsonl'
+
+
+def load_records(paths) -> dict:
+    """讀取錄製檔，只保留已標註（has_event 不為 null）的記錄
+
+    同一封郵件可能出現在多次錄製中，以最後一次標註為準
+    """
+    records = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if record.get('has_event') is not None:
+                        records[record.get('email_hash') or record['id']] = record
+    return records
+
+
+def measure(records: dict) -> dict:
+    """以目前的過濾規則重新判斷已標註的記錄
+
+    Returns:
+        dict: {labeled, with_events, candidates, recall, precision, reduction, misses}
+    """
+    true_positive = false_negative = candidates = 0
+    misses = []
+    for record in records.values():
+        is_candidate = bool(get_candidate_reasons(recording_to_email(record)))
+        candidates += is_candidate
+        if record['has_event']:
+            if is_candidate:
+                true_positive += 1
+            else:
+                false_negative += 1
+                misses.append(record)
+
+    with_events = true_positive + false_negative
+    return {
+        'labeled': len(records),
+        'with_events': with_events,
+        'candidates': candidates,
+        'recall': true_positive / with_events if with_events else 1.0,
+        'precision': true_positive / candidates if candidates else 0.0,
+        'reduction': 1 - candidates / len(records) if records else 0.0,
+        'misses': misses,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='量測事件候選過濾器的 recall')
+    parser.add_argument('recordings', nargs='*', default=[str(DEFAULT_FIXTURE)], help='錄製的 JSONL 檔案')
+    parser.add_argument('--min-recall', type=float, default=None, help='recall 低於此值時以非零狀態碼結束')
+    parser.add_argument('--show-misses', action='store_true', help='列出被漏掉的事件郵件')
+    args = parser.parse_args()
+
+    records = load_records(args.recordings)
+    if not records:
+        print('沒有已標註的錄製資料（請以 EVENT_PREFILTER=false 錄製）')
+        return 1
+
+    result = measure(records)
+    recall, precision, reduction = result['recall'], result['precision'], result['reduction']
+    with_events, candidates, misses = result['with_events'], result['candidates'], result['misses']
+
+    print(f"已標註郵件: {len(records)}（含事件 {with_events} 封）")
+    print(f"候選郵件:   {candidates}")
+    print(f"Recall:     {recall:.1%}")
+    print(f"Precision:  {precision:.1%}")
+    print(f"LLM 減量:   {reduction:.1%}")
+
+    if args.show_misses:
+        for record in misses:
+            print(f"  ✗ {record.get('email_hash') or record['id']} {record.get('excerpt', record.get('subject', ''))[:60]}")
+
+    if args.min_recall is not None and recall < args.min_recall:
+        print(f"✗ Recall 低於門檻 {args.min_recall:.1%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+本機假服務（離線基準測試用）
+取代 Gmail / Calendar / Slack API 與 LLM，讓整個工作流在沒有網路與憑證的情況下執行：
+    - FakeGmailService：googleapiclient 的 users().messages().list / get、attachments().get 介面，
+      回應以 JSON 字串保存並在 execute() 時解析（模擬用戶端解碼成本）
+    - FakeCalendarService：events().list / insert / get / update / delete 與 new_batch_http_request，
+      與真實 API 相同：ID 已被使用（包含已刪除的事件）時 insert 回傳 409
+    - FakeSlackTransport：services/slack_transport 的 api_call / post_webhook
+    - FakeChatModel：with_structured_output(...) 後支援 invoke / batch / batch_as_completed，
+      依 schema 產生確定性的結果（DigestsUpdate 依 prompt 中的 DIGEST 標題回傳各摘要）
+
+每個假服務可設定固定延遲（秒）；LLM 另可依 prompt 長度增加延遲。install() 將假服務裝到 services 模組上
+"""
+import re
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+
+def _stable_fraction(value: str) -> float:
+    """由字串得到 0~1 的固定值（決定分類 / 是否產生事件）"""
+    return int(hashlib.md5(value.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+
+
+class _Request:
+    """googleapiclient HttpRequest 的替身"""
+
+    def __init__(self, response, latency: float = 0.0, decode: bool = False):
+        self._response = response
+        self._latency = latency
+        self._decode = decode
+
+    def execute(self):
+        if self._latency:
+            time.sleep(self._latency)
+        return json.loads(self._response) if self._decode else self._response
+
+
+# ===== Gmail =====
+
+class FakeGmailService:
+    """單一帳號的 Gmail API（唯讀）"""
+
+    _AFTER = re.compile(r'after:(\d+)')
+
+    def __init__(self, mailbox: Dict, latency: float = 0.0):
+        self.latency = latency
+        # 新到舊，與 Gmail 相同
+        ordered = sorted(mailbox['messages'], key=lambda m: int(m['internalDate']), reverse=True)
+        self._index = [(m['id'], m['threadId'], int(m['internalDate']) / 1000) for m in ordered]
+        self._messages = {m['id']: json.dumps(m, ensure_ascii=False) for m in ordered}
+        self._attachments = {key: json.dumps(value) for key, value in mailbox['attachments'].items()}
+        self.calls = Counter()
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def attachments(self):
+        return _GmailAttachments(self)
+
+    def list(self, userId: str = 'me', q: str = '', maxResults: int = 100, **kwargs):
+        self.calls['messages.list'] += 1
+        match = self._AFTER.search(q or '')
+        after = int(match.group(1)) if match else 0
+        found = [{'id': message_id, 'threadId': thread_id}
+                 for message_id, thread_id, timestamp in self._index if timestamp > after][:maxResults]
+        return _Request({'messages': found, 'resultSizeEstimate': len(found)}, self.latency)
+
+    def get(self, userId: str = 'me', id: str = '', format: str = 'full', **kwargs):
+        self.calls['messages.get'] += 1
+        return _Request(self._messages[id], self.latency, decode=True)
+
+
+class _GmailAttachments:
+    def __init__(self, service: FakeGmailService):
+        self.service = service
+
+    def get(self, userId: str = 'me', messageId: str = '', id: str = '', **kwargs):
+        self.service.calls['attachments.get'] += 1
+        return _Request(self.service._attachments[id], self.service.latency, decode=True)
+
+
+# ===== Calendar =====
+
+class FakeCalendarService:
+    """Calendar API：記錄建立的事件，既有事件可預先放入"""
+
+    def __init__(self, existing: Optional[List[Dict]] = None, latency: float = 0.0):
+        self.latency = latency
+        self.existing = list(existing or [])
+        self.created: Dict[str, Dict] = {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def events(self):
+        return self
+
+    def list(self, **kwargs):
+        self.calls['events.list'] += 1
+        return _Request({'items': self.existing}, self.latency)
+
+    def insert(self, calendarId: str = 'primary', body: Optional[Dict] = None, **kwargs):
+        body = body or {}
+        event_id = body.get('id') or uuid.uuid4().hex
+        return FakeCalendarInsert(self, event_id, body)
+
+    def get(self, calendarId: str = 'primary', eventId: str = '', **kwargs):
+        self.calls['events.get'] += 1
+        return _Request({'id': eventId, 'status': 'confirmed', **self.created[eventId]}, self.latency)
+
+    def update(self, calendarId: str = 'primary', eventId: str = '', body: Optional[Dict] = None, **kwargs):
+        self.calls['events.update'] += 1
+        with self._lock:
+            self.created[eventId] = dict(body or {})
+        return _Request({'id': eventId, **(body or {})}, self.latency)
+
+    def delete(self, calendarId: str = 'primary', eventId: str = '', **kwargs):
+        """刪除的事件仍佔用 ID（status 為 cancelled），與真實 API 相同"""
+        self.calls['events.delete'] += 1
+        with self._lock:
+            self.created[eventId] = {**self.created[eventId], 'status': 'cancelled'}
+        return _Request({}, self.latency)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeCalendarBatch(self, callback)
+
+
+class FakeCalendarInsert:
+    def __init__(self, service: FakeCalendarService, event_id: str, body: Dict):
+        self.service = service
+        self.event_id = event_id
+        self.body = body
+
+    def execute(self):
+        self.service.calls['events.insert'] += 1
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        with self.service._lock:
+            if self.event_id in self.service.created:
+                raise _conflict(self.event_id)
+            self.service.created[self.event_id] = self.body
+        return {'id': self.event_id, **self.body}
+
+
+def _conflict(event_id: str):
+    from httplib2 import Response
+    from googleapiclient.errors import HttpError
+    return HttpError(Response({'status': 409}), f'The requested identifier already exists: {event_id}'.encode())
+
+
+class FakeCalendarBatch:
+    def __init__(self, service: FakeCalendarService, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request: FakeCalendarInsert, request_id: Optional[str] = None):
+        # 與 googleapiclient 的 BatchHttpRequest 相同：request_id 重複時拋出 KeyError
+        if request_id is not None and any(existing == request_id for existing, _ in self.requests):
+            raise KeyError(f'A request with this ID already exists: {request_id}')
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.service.calls['batch'] += 1
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        for request_id, request in self.requests:
+            with self.service._lock:
+                exists = request.event_id in self.service.created
+                if not exists:
+                    self.service.created[request.event_id] = request.body
+            if exists:
+                self.callback(request_id, None, _conflict(request.event_id))
+            else:
+                self.callback(request_id, {'id': request.event_id}, None)
+
+
+# ===== Slack =====
+
+class FakeSlackTransport:
+    """Slack Web API / Incoming Webhook：記錄送出的 payload"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.messages: List[Dict] = []
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _record(self, kind: str, payload: Dict):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[kind] += 1
+            self.messages.append(payload)
+
+    def api_call(self, method: str, token: Optional[str] = None, **payload) -> Dict:
+        self._record(method, payload)
+        return {'ok': True, 'ts': f'{time.time():.6f}', 'channel': payload.get('channel')}
+
+    def post_webhook(self, url: str, payload: Dict) -> None:
+        self._record('webhook', payload)
+
+
+# ===== LLM =====
+
+class FakeChatModel:
+    """ChatOpenAI 的替身：依 structured output 的 schema 產生確定性的結果
+
+    延遲 = latency + prompt 字元數 / 1000 × latency_per_kchar
+    """
+
+    def __init__(self, latency: float = 0.0, latency_per_kchar: float = 0.0, event_rate: float = 0.3):
+        self.latency = latency
+        self.latency_per_kchar = latency_per_kchar
+        self.event_rate = event_rate
+        self.calls = Counter()
+        self.prompt_chars = Counter()
+        self._lock = threading.Lock()
+
+    def with_structured_output(self, schema):
+        from langchain_core.runnables import RunnableLambda
+        return RunnableLambda(lambda prompt: self._respond(schema, prompt), name=f'fake_{schema.__name__}')
+
+    def _respond(self, schema, prompt):
+        if isinstance(prompt, str):
+            text = prompt
+        else:
+            text = '\n'.join(getattr(message, 'content', str(message)) for message in prompt)
+
+        with self._lock:
+            self.calls[schema.__name__] += 1
+            self.prompt_chars[schema.__name__] += len(text)
+        delay = self.latency + len(text) / 1000 * self.latency_per_kchar
+        if delay:
+            time.sleep(delay)
+
+        email_ids = re.findall(r'^ID: (\S+)', text, re.MULTILINE)
+        name = schema.__name__
+        if name == 'EmailsClassification':
+            return schema(classifications=[
+                {'email_id': email_id, 'importance': self._importance(email_id)} for email_id in email_ids
+            ])
+        if name == 'EventsDetection':
+            return schema(events=[self._event(email_id) for email_id in email_ids
+                                  if _stable_fraction(f'event:{email_id}') < self.event_rate])
+        if name == 'EmailSummary':
+            return schema(summary=self._summary(text))
+        if name == 'DigestsUpdate':
+            return schema(digests=[
+                {'account': account, 'day': day, 'summary': self._summary(text)}
+                for account, day in re.findall(r'^DIGEST: (.+)\|(\S+)$', text, re.MULTILINE)
+            ], overall=self._summary(text))
+        raise ValueError(f'FakeChatModel 不支援的 schema: {name}')
+
+    @staticmethod
+    def _summary(text: str) -> str:
+        return f'（合成摘要）整體概況：本批輸入 {len(text)} 字元。\n\n求職相關：無\n\n紐約大學相關：無\n\n其他信件：無'
+
+    @staticmethod
+    def _importance(email_id: str) -> str:
+        value = _stable_fraction(f'importance:{email_id}')
+        return 'high' if value < 0.1 else 'medium' if value < 0.4 else 'low'
+
+    @staticmethod
+    def _event(email_id: str) -> Dict:
+        start = (datetime.now() + timedelta(days=1 + int(_stable_fraction(email_id) * 10))).replace(
+            hour=14, minute=0, second=0, microsecond=0)
+        return {
+            'id': f'{email_id}_event_1',
+            'email_id': email_id,
+            'title': f'Benchmark event {email_id}',
+            'start_time': start,
+            'end_time': start + timedelta(hours=1),
+            'location': 'Room 101',
+            'description': 'synthetic',
+            'confidence': 0.9,
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'calls': sum(self.calls.values()),
+                'prompt_chars': sum(self.prompt_chars.values()),
+                'by_schema': {name: {'calls': count, 'prompt_chars': self.prompt_chars[name]}
+                              for name, count in self.calls.items()},
+            }
+
+
+# ===== 安裝 =====
+
+class FakeServices:
+    """install() 的回傳值：各假服務的實例"""
+
+    def __init__(self, gmail: List[FakeGmailService], calendar: FakeCalendarService,
+                 slack: FakeSlackTransport, llm: FakeChatModel):
+        self.gmail = gmail
+        self.calendar = calendar
+        self.slack = slack
+        self.llm = llm
+
+    def stats(self) -> Dict:
+        gmail_calls = Counter()
+        for service in self.gmail:
+            gmail_calls.update(service.calls)
+        return {
+            'gmail': dict(gmail_calls),
+            'calendar': {**self.calendar.calls, 'created': len(self.calendar.created)},
+            'slack': dict(self.slack.calls),
+            'llm': self.llm.stats(),
+        }
+
+
+def install(mailboxes: List[Dict], api_latency: float = 0.0, llm_latency: float = 0.0,
+            llm_latency_per_kchar: float = 0.0) -> FakeServices:
+    """將假服務裝到 services 模組（取代憑證讀取與網路呼叫）
+
+    多帳號模式下，agent/graph.py 的第 N 個帳號（GMAIL_CREDENTIALS_ACCOUNT{N}_BASE64）對應 mailboxes[N-1]
+    """
+    from services import gmail_service, calendar_service, slack_transport, ai_service
+
+    gmail = [FakeGmailService(mailbox, api_latency) for mailbox in mailboxes]
+    calendar = FakeCalendarService(latency=api_latency)
+    slack = FakeSlackTransport(latency=api_latency)
+    llm = FakeChatModel(latency=llm_latency, latency_per_kchar=llm_latency_per_kchar)
+
+    def get_gmail_service(credentials_path: str = 'credentials.json', token_path: str = 'token.json',
+                          credentials_base64_env: Optional[str] = None, token_base64_env: Optional[str] = None):
+        match = re.search(r'ACCOUNT(\d+)', credentials_base64_env or credentials_path or '')
+        index = int(match.group(1)) - 1 if match else 0
+        if index >= len(gmail):
+            raise RuntimeError(f'沒有第 {index + 1} 個帳號的合成信箱')
+        return gmail[index]
+
+    gmail_service.get_gmail_service = get_gmail_service
+    calendar_service.get_default_calendar_service = lambda: calendar
+    slack_transport._transport = slack
+    ai_service.get_llm = lambda *args, **kwargs: llm
+
+    return FakeServices(gmail, calendar, slack, llm)
@@ -0,0 +1,120 @@
+"""
+Import 時間基準測試
+以獨立子行程 (`python -X importtime`) 量測各模組的冷啟動 import 時間，
+並與 import_budget.json 中的預算比較，超出預算時以非零狀態碼結束（可用於 CI）
+
+使用方式:
+    python benchmarks/import_time.py              # 量測並比對預算
+    python benchmarks/import_time.py --repeat 5   # 每個模組量測 5 次取中位數
+    python benchmarks/import_time.py --json       # 輸出 JSON 結果
+    python benchmarks/import_time.py --top 10     # 顯示每個模組最慢的 10 個子模組
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BUDGET_PATH = Path(__file__).resolve().parent / 'import_budget.json'
+
+# -X importtime 的輸出格式: "import time: self [us] | cumulative | imported package"
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def measure_module(module: str) -> dict:
+    """在乾淨的子行程中 import 模組，回傳累計時間與最慢的子模組
+
+    Args:
+        module: 模組名稱
+
+    Returns:
+        dict: {"cumulative_ms": float, "children": [(name, self_ms, cumulative_ms), ...]}
+    """
+    env = dict(os.environ)
+    # 確保不會因缺少 API key 而卡在互動輸入
+    env.setdefault('OPENAI_API_KEY', 'benchmark')
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        stdin=subprocess.DEVNULL,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} 失敗:\n{result.stderr[-2000:]}')
+
+    children = []
+    cumulative_us = 0
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cum_us, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+        children.append((name, self_us / 1000, cum_us / 1000))
+        if name == module and len(indent) <= 1:
+            cumulative_us = cum_us
+
+    children.sort(key=lambda item: item[1], reverse=True)
+    return {'cumulative_ms': cumulative_us / 1000, 'children': children}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='量測模組 import 時間')
+    parser.add_argument('modules', nargs='*', help='要量測的模組（預設為 import_budget.json 中的模組）')
+    parser.add_argument('--repeat', type=int, default=3, help='每個模組量測次數（取中位數）')
+    parser.add_argument('--top', type=int, default=0, help='顯示最慢的 N 個子模組（self time）')
+    parser.add_argument('--json', action='store_true', help='輸出 JSON')
+    parser.add_argument('--update-budget', action='store_true', help='以本次結果 ×1.5 更新預算檔')
+    args = parser.parse_args()
+
+    budget = json.loads(BUDGET_PATH.read_text()) if BUDGET_PATH.exists() else {}
+    modules = args.modules or list(budget)
+
+    results = {}
+    failures = []
+    for module in modules:
+        samples = [measure_module(module) for _ in range(args.repeat)]
+        median_ms = statistics.median(sample['cumulative_ms'] for sample in samples)
+        limit_ms = budget.get(module)
+        results[module] = {
+            'median_ms': round(median_ms, 1),
+            'budget_ms': limit_ms,
+            'samples_ms': [round(sample['cumulative_ms'], 1) for sample in samples],
+            'slowest': [
+                {'module': name, 'self_ms': round(self_ms, 1), 'cumulative_ms': round(cum_ms, 1)}
+                for name, self_ms, cum_ms in samples[-1]['children'][:args.top]
+            ],
+        }
+        if limit_ms is not None and median_ms > limit_ms:
+            failures.append(module)
+
+    if args.update_budget:
+        BUDGET_PATH.write_text(json.dumps(
+            {module: round(result['median_ms'] * 1.5) for module, result in results.items()},
+            indent=2
+        ) + '\n')
+
+    if args.json:
+        print(json.dumps({'results': results, 'regressions': failures}, indent=2, ensure_ascii=False))
+    else:
+        print(f"{'module':<32} {'median':>10} {'budget':>10}")
+        print('-' * 54)
+        for module, result in results.items():
+            budget_text = f"{result['budget_ms']}ms" if result['budget_ms'] is not None else '-'
+            flag = '  ✗ 超出預算' if module in failures else ''
+            print(f"{module:<32} {result['median_ms']:>8.1f}ms {budget_text:>10}{flag}")
+            for child in result['slowest']:
+                print(f"    {child['module']:<40} self={child['self_ms']:.1f}ms")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
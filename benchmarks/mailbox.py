@@ -0,0 +1,233 @@
+"""
+合成郵件信箱產生器
+產生與 Gmail API `messages.get(format='full')` 相同結構的郵件資源，供 benchmarks/e2e.py 的假 Gmail 服務使用：
+    - MIME 種類：純文字、HTML 電子報、multipart/alternative、含 PDF 附件的 multipart/mixed、
+      內嵌 text/calendar 邀請、以附件（attachmentId）存在的 .ics 邀請
+    - 對話串：回覆郵件沿用 threadId，正文包含引用的歷史內容與簽名
+    - 文字內容：中英文混合、追蹤網址、退訂 / 免責聲明樣板、含日期時間的活動通知（會通過事件候選過濾）
+    - 多個帳號、任意數量（10 ~ 10k），以 seed 決定內容，結果可重現
+
+使用方式:
+    python benchmarks/mailbox.py --volume 100 --accounts 3 > mailbox.json
+"""
+import json
+import base64
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Dict, List, Optional
+
+ACCOUNT_LABELS = ('個人', '工作', '紐約大學')
+
+# 郵件種類與比例
+KIND_WEIGHTS = {
+    'plain': 25,
+    'newsletter': 20,
+    'alternative': 20,
+    'attachment': 10,
+    'event': 13,
+    'invite_inline': 8,
+    'invite_attachment': 4,
+}
+REPLY_PROBABILITY = 0.3
+
+SENDERS = [
+    'Alice Chen <alice.chen@example.com>', 'Recruiting Team <jobs@acme-corp.example>',
+    'NYU Courses <courses@nyu.example.edu>', 'LinkedIn <notifications@linkedin.example>',
+    '104 人力銀行 <service@104.example.com.tw>', 'Bob Wang <bob@startup.example.io>',
+    'Airbnb <automated@airbnb.example>', 'Prof. Miller <miller@nyu.example.edu>',
+    '媽媽 <mom@family.example>', 'GitHub <noreply@github.example>',
+]
+TOPICS = [
+    ('面試邀請', 'Interview invitation'), ('專案進度更新', 'Project status update'),
+    ('課程公告', 'Course announcement'), ('帳單通知', 'Your monthly statement'),
+    ('週末聚餐', 'Weekend dinner plans'), ('黑客松報名', 'Hackathon registration'),
+    ('系統維護通知', 'Scheduled maintenance'), ('新職缺推薦', 'New jobs for you'),
+    ('作業截止提醒', 'Assignment deadline reminder'), ('訂單已出貨', 'Your order has shipped'),
+]
+SENTENCES = [
+    'Please review the attached document and let me know if you have any questions.',
+    '請在本週內回覆確認，若有任何問題歡迎隨時聯絡我們。',
+    'We have updated our terms of service, effective immediately for all accounts.',
+    '這是系統自動發送的通知，請勿直接回覆此郵件。',
+    'The team made good progress this week and the release is on track.',
+    '感謝您的耐心等候，我們已經處理完成您的申請。',
+    'Here is a quick summary of the discussion from our last meeting.',
+    '附件為本學期的課程大綱與評分標準，請同學詳閱。',
+    'Check out the latest updates: https://click.example.com/track?uid=8f3a2c&utm_source=email&utm_medium=newsletter',
+    'If you no longer wish to receive these emails, unsubscribe here: https://mail.example.com/unsubscribe?id=92831',
+]
+DISCLAIMER = ('CONFIDENTIALITY NOTICE: This e-mail and any attachments are confidential and intended solely '
+              'for the addressee. If you received this in error, please notify the sender and delete it.')
+SIGNATURE = '-- \nBest regards,\n{name}\nSent from my phone'
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def _part(mime_type: str, text: Optional[str] = None, filename: str = '',
+          attachment_id: Optional[str] = None, size: int = 0, parts: Optional[List[Dict]] = None) -> Dict:
+    part = {'mimeType': mime_type, 'filename': filename, 'headers': [{'name': 'Content-Type', 'value': mime_type}]}
+    if parts is not None:
+        part['body'] = {'size': 0}
+        part['parts'] = parts
+    elif attachment_id:
+        part['body'] = {'attachmentId': attachment_id, 'size': size}
+    else:
+        data = text or ''
+        part['body'] = {'data': _b64(data), 'size': len(data.encode('utf-8'))}
+    return part
+
+
+def _paragraphs(rng: random.Random, count: int) -> str:
+    return '\n\n'.join(
+        '\n'.join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 3))) for _ in range(count)
+    )
+
+
+def _event_text(rng: random.Random, when: datetime) -> str:
+    start = when + timedelta(days=rng.randint(1, 14))
+    return (
+        f"誠摯邀請您參加面談，時間為 {start:%Y-%m-%d} 下午{rng.randint(1, 5)}點，"
+        f"地點：總部大樓 {rng.randint(2, 20)} 樓會議室。\n"
+        f"Meeting on {start:%b} {start.day} at {rng.randint(9, 17)}:00, "
+        f"join via https://zoom.us/j/{rng.randint(10 ** 9, 10 ** 10 - 1)}\n"
+        "Please confirm your availability by replying to this email."
+    )
+
+
+def _ics(rng: random.Random, when: datetime, uid: str, summary: str) -> str:
+    start = (when + timedelta(days=rng.randint(1, 10))).replace(minute=0, second=0, microsecond=0)
+    end = start + timedelta(hours=1)
+    return '\r\n'.join([
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Benchmark//Mailbox//EN', 'METHOD:REQUEST',
+        'BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{when:%Y%m%dT%H%M%SZ}',
+        f'DTSTART:{start:%Y%m%dT%H%M%SZ}', f'DTEND:{end:%Y%m%dT%H%M%SZ}',
+        f'SUMMARY:{summary}', f'LOCATION:Room {rng.randint(100, 999)}',
+        'ORGANIZER:mailto:organizer@example.com', 'END:VEVENT', 'END:VCALENDAR', '',
+    ])
+
+
+def _html(text: str) -> str:
+    paragraphs = ''.join(f'<p>{line}</p>' for line in text.split('\n') if line)
+    return (f'<html><head><style>p{{font-family:Arial}}</style></head><body>{paragraphs}'
+            '<img src="https://track.example.com/open.gif?u=1" width="1" height="1">'
+            '<p style="font-size:10px">Unsubscribe | Privacy Policy | © 2026 Example Inc.</p></body></html>')
+
+
+def generate_mailbox(volume: int, account: str = ACCOUNT_LABELS[0], seed: int = 0,
+                     hours: float = 23.0, now: Optional[datetime] = None) -> Dict:
+    """產生單一帳號的合成信箱
+
+    Args:
+        volume: 郵件數
+        account: 帳號標籤（影響 ID 與 seed）
+        seed: 亂數種子
+        hours: 郵件分布在最近幾小時內
+        now: 目前時間（預設為現在）
+
+    Returns:
+        dict: {"messages": [Gmail message 資源], "attachments": {附件 ID: {"data", "size"}}}
+    """
+    rng = random.Random(f'{seed}:{account}')
+    now = now or datetime.now(timezone.utc)
+    kinds, weights = zip(*KIND_WEIGHTS.items())
+    prefix = f'{ACCOUNT_LABELS.index(account) if account in ACCOUNT_LABELS else account}'
+
+    messages = []
+    attachments = {}
+    threads = []  # (threadId, 主旨, 正文)
+
+    for i in range(volume):
+        message_id = f'{prefix}m{i:06x}'
+        when = now - timedelta(seconds=rng.uniform(0, hours * 3600))
+        sender = rng.choice(SENDERS)
+        kind = rng.choices(kinds, weights)[0]
+        zh, en = rng.choice(TOPICS)
+        subject = f'{zh} / {en} #{rng.randint(100, 999)}'
+        text = _paragraphs(rng, rng.randint(1, 4))
+
+        thread_id = f'{prefix}t{i:06x}'
+        if threads and rng.random() < REPLY_PROBABILITY:
+            # 回覆既有對話串：引用前一封內容並附上簽名
+            thread_id, original_subject, original_text = rng.choice(threads)
+            subject = f'Re: {original_subject}'
+            quoted = '\n'.join(f'> {line}' for line in original_text.split('\n'))
+            text = f"{text}\n\nOn {format_datetime(when - timedelta(hours=1))}, {sender} wrote:\n{quoted}"
+        if kind == 'event':
+            text = f"{_event_text(rng, when)}\n\n{text}"
+        text += '\n\n' + SIGNATURE.format(name=sender.split('<')[0].strip())
+        if rng.random() < 0.3:
+            text += '\n\n' + DISCLAIMER
+        threads.append((thread_id, subject.removeprefix('Re: '), text))
+
+        if kind == 'plain' or kind == 'event':
+            payload = _part('text/plain', text)
+        elif kind == 'newsletter':
+            payload = _part('text/html', _html(text))
+        elif kind == 'alternative':
+            payload = _part('multipart/alternative', parts=[_part('text/plain', text), _part('text/html', _html(text))])
+        elif kind == 'attachment':
+            attachment_id = f'att-{message_id}-pdf'
+            attachments[attachment_id] = {'data': _b64('%PDF-1.4 benchmark'), 'size': rng.randint(20_000, 500_000)}
+            payload = _part('multipart/mixed', parts=[
+                _part('multipart/alternative', parts=[_part('text/plain', text), _part('text/html', _html(text))]),
+                _part('application/pdf', filename='report.pdf', attachment_id=attachment_id,
+                      size=attachments[attachment_id]['size']),
+            ])
+        else:
+            ics = _ics(rng, when, f'{message_id}@benchmark', en)
+            if kind == 'invite_inline':
+                calendar_part = _part('text/calendar', ics)
+            else:
+                attachment_id = f'att-{message_id}-ics'
+                attachments[attachment_id] = {'data': _b64(ics), 'size': len(ics)}
+                calendar_part = _part('application/octet-stream', filename='invite.ics',
+                                      attachment_id=attachment_id, size=len(ics))
+            payload = _part('multipart/mixed', parts=[
+                _part('multipart/alternative', parts=[_part('text/plain', text), _part('text/html', _html(text))]),
+                calendar_part,
+            ])
+
+        payload['headers'] = [
+            {'name': 'From', 'value': sender},
+            {'name': 'To', 'value': f'me+{prefix}@example.com'},
+            {'name': 'Subject', 'value': subject},
+            {'name': 'Date', 'value': format_datetime(when)},
+            {'name': 'Message-ID', 'value': f'<{message_id}@benchmark.example>'},
+            {'name': 'Content-Type', 'value': payload['mimeType']},
+        ]
+        snippet = ' '.join(text.split())[:200]
+        messages.append({
+            'id': message_id,
+            'threadId': thread_id,
+            'labelIds': ['INBOX', 'UNREAD'] if rng.random() < 0.6 else ['INBOX'],
+            'snippet': snippet,
+            'internalDate': str(int(when.timestamp() * 1000)),
+            'sizeEstimate': len(text.encode('utf-8')) * (2 if kind != 'plain' else 1) + 800,
+            'payload': payload,
+        })
+
+    return {'account': account, 'messages': messages, 'attachments': attachments}
+
+
+def generate_mailboxes(volume: int, accounts: int = 1, seed: int = 0, **kwargs) -> List[Dict]:
+    """產生多個帳號的信箱，總郵件數為 volume（平均分配）"""
+    labels = ACCOUNT_LABELS[:accounts]
+    per_account = [volume // accounts + (1 if i < volume % accounts else 0) for i in range(accounts)]
+    return [generate_mailbox(count, label, seed, **kwargs) for label, count in zip(labels, per_account)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='產生合成郵件信箱（Gmail API 格式的 JSON）')
+    parser.add_argument('--volume', type=int, default=100, help='郵件總數')
+    parser.add_argument('--accounts', type=int, default=1, choices=range(1, len(ACCOUNT_LABELS) + 1), help='帳號數')
+    parser.add_argument('--seed', type=int, default=0, help='亂數種子')
+    args = parser.parse_args()
+    print(json.dumps(generate_mailboxes(args.volume, args.accounts, args.seed), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,8 +16,27 @@ def run_email_summary():
         "max_emails": int(os.getenv("MAX_EMAILS", "20"))
     }
 
-    # 執行 graph
-    result = graph.invoke(initial_state)
+    # 執行 graph 期間在背景執行緒送出 outbox（優先提醒在分類完成時就送出，不等整個 graph 結束）
+    import threading
+    from services.outbox import drain, run_worker
+    stop = threading.Event()
+    worker = threading.Thread(target=run_worker, args=(stop,), name="outbox-worker", daemon=True)
+    worker.start()
+
+    # 執行 graph（每次執行使用獨立的 thread ID，避免與其他執行共用 checkpoint）
+    import uuid
+    run_id = f"email-summary-{uuid.uuid4().hex[:12]}"
+    from services.tracing import span
+    try:
+        with span("workflow.run", kind="run", trace_id=run_id, executor="cli"):
+            result = graph.invoke(initial_state, {"configurable": {"thread_id": run_id}})
+        print(f"執行追蹤: python trace_cli.py show {run_id}")
+    finally:
+        stop.set()
+        worker.join()
+
+    # 結束前送出 outbox 中剩餘的通知（失敗的項目會保留在 outbox.db，下次執行時重試）
+    drain(timeout=float(os.getenv("OUTBOX_DRAIN_TIMEOUT", "60")))
 
     return result
 
@@ -1,16 +1,31 @@
 # AI API 服務
 # 處理與 AI API 的交互，包含分類和摘要功能
-import os, getpass
-from langchain_openai import ChatOpenAI
+import os, sys, getpass
 from pydantic import BaseModel, Field
-from typing import List, Literal
-from langchain_core.messages import HumanMessage, SystemMessage
+from typing import Callable, List, Literal, Optional
+from services.text_service import get_email_text
+from services.metrics import track_call
+
+# langchain_openai / langchain_core 匯入成本高（約 1 秒），延遲到第一次呼叫 LLM 時才載入
 
 def _set_env(var: str):
-    if not os.environ.get(var):
+    """確保環境變數存在
+
+    只有在互動式終端機中才會以 getpass 詢問；
+    伺服器 / CI 環境（沒有 TTY）直接拋出錯誤，避免卡在輸入提示
+    """
+    if os.environ.get(var):
+        return
+    if sys.stdin is not None and sys.stdin.isatty():
         os.environ[var] = getpass.getpass(f"{var}: ")
+    else:
+        raise RuntimeError(f"環境變數 {var} 未設定")
 
-_set_env("OPENAI_API_KEY")
+def get_llm(model: str = "gpt-4o"):
+    """建立 ChatOpenAI 實例（第一次呼叫時才載入 langchain_openai 並檢查 API key）"""
+    _set_env("OPENAI_API_KEY")
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model)
 
 # ===== 郵件分類相關 =====
 
@@ -23,19 +38,37 @@ class EmailsClassification(BaseModel):
     """多封郵件的分類結果"""
     classifications: List[EmailImportance]
 
-def classify_importance(emails: list[dict]) -> dict:
+# 優先通知：分類依新到舊切成多個批次平行送出，每個批次完成就回報其中的高重要性郵件
+CLASSIFY_CHUNK_SIZE = int(os.getenv('CLASSIFY_CHUNK_SIZE', '10'))
+CLASSIFY_CONCURRENCY = int(os.getenv('CLASSIFY_CONCURRENCY', '4'))
+
+def sort_newest_first(emails: list[dict]) -> list[dict]:
+    """依郵件 Date header 由新到舊排序（無法解析的日期排在最後，保持原順序）"""
+    from email.utils import parsedate_to_datetime
+
+    def timestamp(email: dict) -> float:
+        try:
+            return parsedate_to_datetime(email.get('date') or '').timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return float('-inf')
+
+    return sorted(emails, key=timestamp, reverse=True)
+
+def classify_importance(emails: list[dict], on_high: Optional[Callable[[list[dict]], None]] = None) -> dict:
     """分類郵件重要性
 
+    郵件依新到舊切成每批 CLASSIFY_CHUNK_SIZE 封，最新的批次最先送出；
+    每個批次完成時，以其中的高重要性郵件呼叫 on_high（優先通知），不必等全部分類完成
+
     Args:
         emails: 郵件列表
+        on_high: 批次完成時的回呼，參數為該批次的高重要性郵件
 
     Returns:
-        dict: {"high": [...], "medium": [], "low": [...]}
+        dict: {"high": [...], "medium": [], "low": [...]}（各等級內由新到舊）
     """
-    raw_emails = emails
-
     # 如果沒有郵件，直接返回空分類
-    if not raw_emails:
+    if not emails:
         return {"high": [], "medium": [], "low": []}
 
     prompt = """
@@ -47,29 +80,53 @@ def classify_importance(emails: list[dict]) -> dict:
         - Low: The email is not important, such as newsletters or promotional content, or emails from Airbnb and Binance or other similar companies, or random people who want to connect with me on LinkedIn.
         """
 
-    llm = ChatOpenAI(model="gpt-4o")
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    llm = get_llm()
     structured_llm = llm.with_structured_output(EmailsClassification)
 
-    emails_text = "\n\n".join([
-        f"ID: {email['id']}\n主旨: {email['subject']}\n寄件者: {email['from']}\n內容: {email['snippet']}"
-        for email in raw_emails
-    ])
+    ordered = sort_newest_first(emails)
+    size = CLASSIFY_CHUNK_SIZE if CLASSIFY_CHUNK_SIZE > 0 else len(ordered)
+    chunks = [ordered[i:i + size] for i in range(0, len(ordered), size)]
 
-    result = structured_llm.invoke(
-        [
+    def build_messages(chunk: list[dict]) -> list:
+        emails_text = "\n\n".join([
+            f"ID: {email['id']}\n主旨: {email['subject']}\n寄件者: {email['from']}\n內容: {get_email_text(email, 'snippet')}"
+            for email in chunk
+        ])
+        return [
             SystemMessage(content="You are a helpful personal assistant."),
             HumanMessage(content=f"Classify the importance of the following emails:\n\n{emails_text}\n\n{prompt}")
         ]
-    )
 
     classified = {"high": [], "medium": [], "low": []}
-    for classification in result.classifications:
-        # 使用 next 的 default 參數避免 StopIteration
-        email = next((e for e in raw_emails if e['id'] == classification.email_id), None)
-        if email:
-            classified[classification.importance].append(email)
-
-    return classified
+    with track_call('openai', 'classify_importance') as call:
+        call.set('emails', len(emails)).set('chunks', len(chunks))
+        # 批次依序開始（最新的先送），完成一批處理一批
+        for index, result in structured_llm.batch_as_completed(
+            [build_messages(chunk) for chunk in chunks],
+            config={"max_concurrency": CLASSIFY_CONCURRENCY}
+        ):
+            chunk = chunks[index]
+            high = []
+            for classification in result.classifications:
+                # 使用 next 的 default 參數避免 StopIteration
+                email = next((e for e in chunk if e['id'] == classification.email_id), None)
+                if email:
+                    classified[classification.importance].append(email)
+                    if classification.importance == "high":
+                        high.append(email)
+
+            if high and on_high is not None:
+                try:
+                    on_high(high)
+                except Exception as e:
+                    # 優先通知失敗不影響分類，完整摘要仍會送出
+                    print(f"優先通知失敗: {e}")
+
+    # 批次完成順序不固定，恢復由新到舊的順序
+    position = {id(email): i for i, email in enumerate(ordered)}
+    return {level: sorted(items, key=lambda e: position[id(e)]) for level, items in classified.items()}
 
 
 # ===== 郵件總結相關 =====
@@ -90,24 +147,8 @@ class EmailSummary(BaseModel):
     """總結當日信件狀況"""
     summary: str = Field(description="整體摘要文字")
 
-def summarize_emails(emails: list[dict], classified_emails: dict) -> dict:
-    """總結當日信件狀況
-
-    Args:
-        emails: 原始郵件列表
-        classified_emails: 分類後的郵件 {"high": [...], "medium": [...], "low": [...]}
-
-    Returns:
-        dict: {
-            "summary": str,
-            "importance_count": {"high": int, "medium": int, "low": int},
-            "important_emails": [{"to": str, "from": str, "subject": str}]
-        }
-    """
-    llm = ChatOpenAI(model="gpt-4o")
-    structured_llm = llm.with_structured_output(EmailSummary)
-
-    prompt = """你是一個專業的郵件摘要助手。請分析以下郵件內容，提供簡潔的每日郵件摘要報告。
+# 摘要格式（單次摘要、增量合併、多日 / 多帳號彙整共用）
+SUMMARY_PROMPT = """你是一個專業的郵件摘要助手。請分析以下郵件內容，提供簡潔的每日郵件摘要報告。
 
 ## 摘要格式要求：
 
@@ -141,20 +182,212 @@ def summarize_emails(emails: list[dict], classified_emails: dict) -> dict:
 ## 範例風格：
 求職相關：今天收到最重要的是 A 公司邀請你在 1/25 與他們進行簡短的線上面試。另外有幾封求職網站的自動回覆信件，但不是特別重要。此外，有來自 LinkedIn 的系統訊息，有人想與你建立連結。"""
 
-    emails_text = "\n".join([email.get('snippet', '') for email in emails])
+def summarize_emails(emails: list[dict]) -> dict:
+    """總結當日信件狀況（只依賴原始郵件，可與 classify_importance 平行執行）
 
-    summary_part = structured_llm.invoke(
-        [
-            SystemMessage(content="You are a helpful personal assistant."),
-            HumanMessage(content=f"""Please summarize the following classified emails:
+    Args:
+        emails: 原始郵件列表
+
+    Returns:
+        dict: {
+            "summary": str,
+            "importance_count": {"high": int, "medium": int, "low": int},
+            "important_emails": [{"to": str, "from": str, "subject": str}]
+        }
+    """
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    llm = get_llm()
+    structured_llm = llm.with_structured_output(EmailSummary)
+
+    emails_text = "\n".join([get_email_text(email, 'snippet') for email in emails])
+
+    with track_call('openai', 'summarize') as call:
+        call.set('emails', len(emails)).set('prompt_chars', len(emails_text))
+        summary_part = structured_llm.invoke(
+            [
+                SystemMessage(content="You are a helpful personal assistant."),
+                HumanMessage(content=f"""Please summarize the following emails:
 
 郵件內容：
 {emails_text}
 
-{prompt}""")
-        ]
-    )
+{SUMMARY_PROMPT}""")
+            ]
+        )
 
     return {
         "summary": summary_part.summary
-    }
\ No newline at end of file
+    }
+
+
+# ===== 增量摘要（services/digest_store.py）=====
+
+DIGEST_CONCURRENCY = int(os.getenv('DIGEST_CONCURRENCY', '4'))
+
+def _digest_messages(request: dict) -> list:
+    """單一帳號 / 單日摘要的 prompt：沒有既有摘要時與 summarize_emails 相同，否則只送新郵件與既有摘要"""
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    emails_text = "\n".join([get_email_text(email, 'snippet') for email in request['emails']])
+    if not request.get('previous'):
+        content = f"""Please summarize the following emails:
+
+郵件內容：
+{emails_text}
+
+{SUMMARY_PROMPT}"""
+    else:
+        content = f"""以下是帳號「{request['account']}」在 {request['day']} 已有的郵件摘要，以及之後新收到的郵件。
+請將新郵件的內容整合進既有摘要，輸出一份完整的更新後摘要（不要只描述新郵件，也不要遺漏既有摘要中的重要資訊）。
+
+既有摘要：
+{request['previous']}
+
+新郵件內容：
+{emails_text}
+
+{SUMMARY_PROMPT}"""
+    return [SystemMessage(content="You are a helpful personal assistant."), HumanMessage(content=content)]
+
+class DigestUpdate(BaseModel):
+    """單一帳號 / 單日的更新後摘要"""
+    account: str = Field(description="帳號（照抄 DIGEST 標題中的帳號）")
+    day: str = Field(description="日期 YYYY-MM-DD（照抄 DIGEST 標題中的日期）")
+    summary: str = Field(description="更新後的完整摘要")
+
+class DigestsUpdate(BaseModel):
+    """一次更新多份摘要，並彙整為整個期間的摘要"""
+    digests: list[DigestUpdate] = Field(description="每個 DIGEST 標題一份更新後摘要")
+    overall: str = Field(description="涵蓋所有帳號與日期的彙整摘要")
+
+def _digest_section(request: dict) -> str:
+    emails_text = "\n".join([get_email_text(email, 'snippet') for email in request['emails']])
+    previous = request.get('previous') or "（尚無摘要）"
+    return f"""DIGEST: {request['account']}|{request['day']}
+既有摘要：
+{previous}
+
+新郵件內容：
+{emails_text}"""
+
+def update_digests(requests: list[dict], unchanged: list[dict]) -> tuple[dict, str | None]:
+    """以一次 LLM 呼叫將所有新郵件合併進各自的摘要，並產生整個期間的彙整摘要
+
+    只有一份摘要時與 summarize_emails 相同（單一摘要即彙整結果）
+
+    Args:
+        requests: 有新郵件的摘要 [{"account": str, "day": str, "previous": str | None, "emails": [...]}]
+        unchanged: 本次範圍內沒有新郵件的摘要 [{"account": str, "day": str, "summary": str}]，只供彙整
+
+    Returns:
+        tuple: ({(account, day): 更新後摘要}, 彙整摘要)；
+        模型漏掉的摘要不在結果中，此時彙整摘要為 None（由呼叫端另行合併與彙整）
+    """
+    if not requests:
+        return {}, None
+
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    llm = get_llm()
+
+    if len(requests) == 1 and not unchanged:
+        request = requests[0]
+        with track_call('openai', 'merge_digest') as call:
+            call.set('digests', 1).set('emails', len(request['emails']))
+            result = llm.with_structured_output(EmailSummary).invoke(_digest_messages(request))
+        return {(request['account'], request['day']): result.summary}, result.summary
+
+    sections = "\n\n".join(_digest_section(request) for request in requests)
+    context = "\n\n".join(
+        f"### {digest['day']}（{digest['account']}）\n{digest['summary']}" for digest in unchanged
+    )
+    content = f"""以下是依帳號與日期分組的郵件摘要。每個 DIGEST 區塊包含該帳號該日的既有摘要與之後新收到的郵件。
+
+1. digests：為每個 DIGEST 區塊輸出一份更新後的完整摘要（account 與 day 照抄標題；將新郵件整合進既有摘要，不要遺漏既有摘要中的重要資訊）
+2. overall：將所有更新後的摘要{"與下方「其他日期的摘要」" if unchanged else ""}彙整為涵蓋整個期間的一份摘要，同一主題跨多天時合併描述，並保留重要郵件的日期
+
+{sections}
+"""
+    if unchanged:
+        content += f"""
+其他日期的摘要（沒有新郵件，只用於 overall）：
+
+{context}
+"""
+    content += f"\n{SUMMARY_PROMPT}"
+
+    with track_call('openai', 'update_digests') as call:
+        call.set('digests', len(requests)).set('emails', sum(len(r['emails']) for r in requests))
+        call.set('prompt_chars', len(content))
+        result = llm.with_structured_output(DigestsUpdate).invoke(
+            [SystemMessage(content="You are a helpful personal assistant."), HumanMessage(content=content)]
+        )
+
+    requested = {(request['account'], request['day']) for request in requests}
+    summaries = {
+        (digest.account, digest.day): digest.summary
+        for digest in result.digests if (digest.account, digest.day) in requested
+    }
+    return summaries, result.overall if len(summaries) == len(requested) else None
+
+def merge_digests(requests: list[dict]) -> list[str]:
+    """將新郵件合併進各帳號 / 各日的既有摘要（每個摘要一次 LLM 呼叫，平行送出）
+
+    Args:
+        requests: [{"account": str, "day": str, "previous": str | None, "emails": [...]}]
+            emails 只包含尚未摘要過的郵件
+
+    Returns:
+        List[str]: 與 requests 順序相同的更新後摘要
+    """
+    if not requests:
+        return []
+
+    llm = get_llm()
+    structured_llm = llm.with_structured_output(EmailSummary)
+
+    with track_call('openai', 'merge_digest') as call:
+        call.set('digests', len(requests)).set('emails', sum(len(r['emails']) for r in requests))
+        results = structured_llm.batch(
+            [_digest_messages(request) for request in requests],
+            config={"max_concurrency": DIGEST_CONCURRENCY}
+        )
+    return [result.summary for result in results]
+
+def combine_digests(digests: list[dict]) -> str:
+    """將多個帳號 / 多日的摘要彙整為一份（只讀取摘要，不讀取原始郵件）
+
+    Args:
+        digests: [{"account": str, "day": str, "summary": str}]
+
+    Returns:
+        str: 彙整後的摘要（只有一份摘要時直接回傳）
+    """
+    if not digests:
+        return ""
+    if len(digests) == 1:
+        return digests[0]['summary']
+
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    llm = get_llm()
+    structured_llm = llm.with_structured_output(EmailSummary)
+
+    digests_text = "\n\n".join(
+        f"### {digest['day']}（{digest['account']}）\n{digest['summary']}" for digest in digests
+    )
+    with track_call('openai', 'combine_digests') as call:
+        call.set('digests', len(digests)).set('prompt_chars', len(digests_text))
+        result = structured_llm.invoke(
+            [
+                SystemMessage(content="You are a helpful personal assistant."),
+                HumanMessage(content=f"""以下是依帳號與日期分別整理的郵件摘要，請彙整為涵蓋整個期間的一份摘要。
+同一主題跨多天時合併描述，並保留重要郵件的日期。
+
+{digests_text}
+
+{SUMMARY_PROMPT}""")
+            ]
+        )
+    return result.summary
@@ -5,8 +5,11 @@ Google Calendar API 服務
 import os
 import pickle
 import base64
-from datetime import datetime
-from typing import Optional
+import hashlib
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict
+from zoneinfo import ZoneInfo
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -14,9 +17,14 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from services.metrics import track_call
+
 # Calendar API 權限範圍
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# 建立事件使用的時區（LLM 回傳的時間沒有時區資訊，視為此時區）
+CALENDAR_TIMEZONE = 'Asia/Taipei'
+
 
 def authenticate_calendar(
     credentials_path: str = 'credentials/calendar_credentials.json',
@@ -111,42 +119,210 @@ def get_calendar_service(
         raise
 
 
-def create_calendar_event(event_data: dict) -> str:
+def get_default_calendar_service():
+    """依環境變量決定 token 來源並建立 Calendar 服務（優先使用 GOOGLE_CALENDAR_TOKEN_BASE64）"""
+    token_base64_env = os.getenv('GOOGLE_CALENDAR_TOKEN_BASE64')
+    return get_calendar_service(
+        token_base64_env='GOOGLE_CALENDAR_TOKEN_BASE64' if token_base64_env else None
+    )
+
+
+def to_datetime(value) -> datetime:
+    """將事件時間（datetime 或 ISO 字串）轉為有時區的 datetime"""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=ZoneInfo(CALENDAR_TIMEZONE))
+    return value
+
+
+def _parse_calendar_time(value: Dict) -> Optional[datetime]:
+    """解析 Calendar API 的 start / end（dateTime 或全天事件的 date）"""
+    if 'dateTime' in value:
+        return to_datetime(value['dateTime'])
+    if 'date' in value:
+        day = datetime.strptime(value['date'], '%Y-%m-%d')
+        return day.replace(tzinfo=ZoneInfo(value.get('timeZone') or CALENDAR_TIMEZONE))
+    return None
+
+
+def list_events_between(service, time_min: datetime, time_max: datetime,
+                        calendar_id: str = 'primary') -> List[Dict]:
     """
-    創建 Google Calendar 事件
+    以單一 events.list 查詢取得時間範圍內的所有事件（自動處理分頁）
 
     Args:
-        event_data: {
-            'id': str (事件 ID),
-            'title': str (事件標題),
-            'start_time': datetime (開始時間),
-            'end_time': datetime (結束時間),
-            'location': str (地點，可選),
-            'description': str (描述，可選)
-        }
+        service: Calendar API 服務實例
+        time_min: 範圍開始
+        time_max: 範圍結束
+        calendar_id: 日曆 ID
 
     Returns:
-        str: 創建的 Calendar 事件 ID
+        List[Dict]: Calendar API 事件列表（已展開重複事件）
     """
-    # 優先從環境變量讀取 token
-    token_base64_env = os.getenv('GOOGLE_CALENDAR_TOKEN_BASE64')
-    service = get_calendar_service(
-        token_base64_env='GOOGLE_CALENDAR_TOKEN_BASE64' if token_base64_env else None
-    )
+    events = []
+    page_token = None
 
-    # 格式化事件
-    event = {
-        'summary': event_data.get('title', '未命名事件'),
-        'location': event_data.get('location', ''),
-        'description': event_data.get('description', ''),
-        'start': {
+    while True:
+        with track_call('calendar', 'events.list') as call:
+            response = service.events().list(
+                calendarId=calendar_id,
+                timeMin=to_datetime(time_min).isoformat(),
+                timeMax=to_datetime(time_max).isoformat(),
+                singleEvents=True,
+                orderBy='startTime',
+                maxResults=2500,
+                pageToken=page_token
+            ).execute()
+            call.set('results', len(response.get('items', [])))
+
+        events.extend(response.get('items', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return events
+
+
+class EventIntervalIndex:
+    """已存在日曆事件的區間索引（依開始時間排序，支援重疊查詢）"""
+
+    def __init__(self, calendar_events: List[Dict]):
+        intervals = []
+        for event in calendar_events:
+            if event.get('status') == 'cancelled':
+                continue
+            start = _parse_calendar_time(event.get('start', {}))
+            end = _parse_calendar_time(event.get('end', {}))
+            if start is None or end is None:
+                continue
+            intervals.append((start, end, event))
+
+        intervals.sort(key=lambda item: item[0])
+        self._intervals = intervals
+        self._starts = [item[0] for item in intervals]
+        # 最長事件長度：查詢時只需往前看這麼遠
+        self._max_duration = max((end - start for start, end, _ in intervals), default=timedelta(0))
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Dict]:
+        """找出與 [start, end) 重疊的事件"""
+        lo = bisect_left(self._starts, start - self._max_duration)
+        hi = bisect_left(self._starts, end)
+        return [
+            event for event_start, event_end, event in self._intervals[lo:hi]
+            if event_end > start
+        ]
+
+
+def _normalize_title(title: str) -> str:
+    return ''.join((title or '').lower().split())
+
+
+def annotate_with_existing_events(events: List[Dict], service=None) -> List[Dict]:
+    """
+    與日曆中既有的事件比對：移除已存在的事件，並為其餘事件標註衝突
+
+    只發出一次 events.list 查詢（涵蓋所有檢測事件的時間範圍），
+    再以記憶體中的區間索引逐一比對
+
+    Args:
+        events: 檢測到的事件列表（DetectedEvent dict）
+        service: Calendar API 服務實例（預設依環境變量建立）
+
+    Returns:
+        List[Dict]: 未重複的事件，每個事件加入 conflicts: [{title, start_time, end_time}]
+    """
+    if not events:
+        return []
+
+    service = service or get_default_calendar_service()
+
+    time_min = min(to_datetime(event['start_time']) for event in events)
+    time_max = max(to_datetime(event['end_time']) for event in events)
+    index = EventIntervalIndex(list_events_between(service, time_min, time_max))
+
+    remaining = []
+    for event in events:
+        start, end = to_datetime(event['start_time']), to_datetime(event['end_time'])
+        overlaps = index.overlapping(start, end)
+
+        duplicate = next((
+            existing for existing in overlaps
+            if existing.get('id') == calendar_event_id(event['id'])
+            or (_normalize_title(existing.get('summary')) == _normalize_title(event.get('title'))
+                and abs(_parse_calendar_time(existing['start']) - start) < timedelta(minutes=1))
+        ), None)
+        if duplicate:
+            print(f"略過已存在的 Calendar 事件: {event.get('title')}")
+            continue
+
+        # 標記為「空閒」的事件不算衝突
+        event['conflicts'] = [
+            {
+                'title': existing.get('summary', '（無標題）'),
+                'start_time': _parse_calendar_time(existing['start']).isoformat(),
+                'end_time': _parse_calendar_time(existing['end']).isoformat(),
+            }
+            for existing in overlaps
+            if existing.get('transparency') != 'transparent'
+        ]
+        remaining.append(event)
+
+    print(f"Calendar 比對: 既有 {len(index)} 個事件，{len(events) - len(remaining)} 個重複，"
+          f"{sum(1 for e in remaining if e['conflicts'])} 個有時間衝突")
+    return remaining
+
+
+def calendar_event_id(detected_event_id: str) -> str:
+    """
+    由 DetectedEvent.id 推導固定的 Calendar 事件 ID
+
+    Calendar API 允許用戶端指定事件 ID（base32hex 字元 a-v0-9，長度 5-1024），
+    同一個檢測事件永遠對應同一個 ID，重試或重複恢復工作流時 insert 會回傳 409 而不會重複建立
+
+    Args:
+        detected_event_id: DetectedEvent.id
+
+    Returns:
+        str: Calendar 事件 ID
+    """
+    digest = hashlib.sha256(detected_event_id.encode('utf-8')).digest()
+    return base64.b32hexencode(digest).decode('ascii').rstrip('=').lower()
+
+
+def _event_times(event_data: dict) -> tuple:
+    """Calendar API 的 start / end：全天事件使用 date（結束日不含當天），其他使用 dateTime"""
+    if event_data.get('all_day'):
+        tz = ZoneInfo(CALENDAR_TIMEZONE)
+        start = to_datetime(event_data['start_time']).astimezone(tz).date()
+        end = to_datetime(event_data['end_time']).astimezone(tz).date()
+        if end <= start:
+            end = start + timedelta(days=1)
+        return {'date': start.isoformat()}, {'date': end.isoformat()}
+
+    return (
+        {
             'dateTime': event_data['start_time'].isoformat() if isinstance(event_data['start_time'], datetime) else event_data['start_time'],
-            'timeZone': 'Asia/Taipei',
+            'timeZone': CALENDAR_TIMEZONE,
         },
-        'end': {
+        {
             'dateTime': event_data['end_time'].isoformat() if isinstance(event_data['end_time'], datetime) else event_data['end_time'],
-            'timeZone': 'Asia/Taipei',
+            'timeZone': CALENDAR_TIMEZONE,
         },
+    )
+
+
+def build_event_body(event_data: dict) -> dict:
+    """將 DetectedEvent dict 轉為 Calendar API 事件格式（含固定 ID；日曆邀請的全天與重複規則一併保留）"""
+    start, end = _event_times(event_data)
+    body = {
+        'id': calendar_event_id(event_data['id']),
+        'summary': event_data.get('title', '未命名事件'),
+        'location': event_data.get('location', ''),
+        'description': event_data.get('description', ''),
+        'start': start,
+        'end': end,
         'reminders': {
             'useDefault': False,
             'overrides': [
@@ -155,13 +331,41 @@ def create_calendar_event(event_data: dict) -> str:
             ],
         },
     }
+    if event_data.get('recurrence'):
+        body['recurrence'] = list(event_data['recurrence'])
+    return body
+
+
+def create_calendar_event(event_data: dict) -> str:
+    """
+    創建 Google Calendar 事件（冪等：事件已存在時直接回傳其 ID）
+
+    Args:
+        event_data: {
+            'id': str (事件 ID),
+            'title': str (事件標題),
+            'start_time': datetime (開始時間),
+            'end_time': datetime (結束時間),
+            'location': str (地點，可選),
+            'description': str (描述，可選)
+        }
+
+    Returns:
+        str: 創建的 Calendar 事件 ID
+    """
+    # 優先從環境變量讀取 token
+    service = get_default_calendar_service()
+
+    # 格式化事件
+    event = build_event_body(event_data)
 
     try:
         # 創建事件
-        created_event = service.events().insert(
-            calendarId='primary',
-            body=event
-        ).execute()
+        with track_call('calendar', 'events.insert'):
+            created_event = service.events().insert(
+                calendarId='primary',
+                body=event
+            ).execute()
 
         print(f"✓ Calendar 事件創建成功: {event_data.get('title')}")
         print(f"  事件 ID: {created_event['id']}")
@@ -170,5 +374,121 @@ def create_calendar_event(event_data: dict) -> str:
         return created_event['id']
 
     except HttpError as error:
+        if error.resp.status == 409:
+            if _restore_if_cancelled(service, event_data):
+                print(f"✓ Calendar 事件已恢復（先前被刪除）: {event_data.get('title')}")
+            else:
+                print(f"Calendar 事件已存在: {event_data.get('title')}")
+            return event['id']
         print(f'創建 Calendar 事件失敗: {error}')
         raise
+
+
+def _restore_if_cancelled(service, event_data: dict) -> bool:
+    """insert 回傳 409 時確認固定 ID 的事件是否真的在日曆上
+
+    用戶刪除過的事件仍佔用該 ID（status 為 cancelled），insert 同樣回傳 409；
+    此時以 update 寫回事件內容並恢復為 confirmed
+
+    Returns:
+        bool: 是否恢復了被刪除的事件（False 表示事件確實存在）
+    """
+    event_id = calendar_event_id(event_data['id'])
+    with track_call('calendar', 'events.get'):
+        existing = service.events().get(calendarId='primary', eventId=event_id).execute()
+    if existing.get('status') != 'cancelled':
+        return False
+
+    with track_call('calendar', 'events.update'):
+        service.events().update(
+            calendarId='primary', eventId=event_id, body={**build_event_body(event_data), 'status': 'confirmed'}
+        ).execute()
+    return True
+
+
+# Calendar batch 端點單次請求的建議上限
+BATCH_SIZE = 50
+
+
+def create_calendar_events_batch(events: List[Dict], service=None) -> Dict[str, Dict]:
+    """
+    以 Calendar batch 端點一次建立多個事件（冪等）
+
+    每個事件使用由 DetectedEvent.id 推導的固定 ID，
+    重試或同時恢復的工作流重複送出時會得到 409，視為已存在而非重複建立；
+    409 的事件若是被用戶刪除過的（status 為 cancelled），改為恢復該事件並回報 created；
+    列表中 ID 重複的事件只建立一次
+
+    Args:
+        events: DetectedEvent dict 列表
+        service: Calendar API 服務實例（預設依環境變量建立）
+
+    Returns:
+        Dict[str, Dict]: {DetectedEvent.id: {"status": "created" | "exists" | "failed",
+                                             "calendar_event_id": str, "error": str | None}}
+    """
+    if not events:
+        return {}
+
+    # 同一個事件出現多次（例如重複確認）時只送出一次：batch 的 request_id 不可重複
+    unique = {}
+    for event_data in events:
+        unique.setdefault(calendar_event_id(event_data['id']), event_data)
+    if len(unique) < len(events):
+        print(f"Calendar 批次建立: 略過 {len(events) - len(unique)} 個重複事件")
+    events = list(unique.values())
+
+    service = service or get_default_calendar_service()
+    results = {}
+    conflicts = []
+
+    def _callback(request_id, response, exception):
+        event_id = request_id
+        calendar_id = calendar_event_id(event_id)
+        if exception is None:
+            results[event_id] = {'status': 'created', 'calendar_event_id': response['id'], 'error': None}
+        elif isinstance(exception, HttpError) and exception.resp.status == 409:
+            conflicts.append(unique[calendar_id])
+            results[event_id] = {'status': 'exists', 'calendar_event_id': calendar_id, 'error': None}
+        else:
+            results[event_id] = {'status': 'failed', 'calendar_event_id': calendar_id, 'error': str(exception)}
+
+    for i in range(0, len(events), BATCH_SIZE):
+        chunk = events[i:i + BATCH_SIZE]
+        batch = service.new_batch_http_request(callback=_callback)
+        for event_data in chunk:
+            batch.add(
+                service.events().insert(calendarId='primary', body=build_event_body(event_data)),
+                request_id=event_data['id']
+            )
+        try:
+            with track_call('calendar', 'events.insert_batch') as call:
+                call.set('events', len(chunk))
+                batch.execute()
+        except HttpError as error:
+            # 整批請求失敗（例如認證錯誤），將未回報的事件標記為失敗
+            for event_data in chunk:
+                results.setdefault(event_data['id'], {
+                    'status': 'failed',
+                    'calendar_event_id': calendar_event_id(event_data['id']),
+                    'error': str(error),
+                })
+
+    # 409：固定 ID 已被使用，但可能是用戶刪除過的事件（不在日曆上），需逐一確認
+    restored = 0
+    for event_data in conflicts:
+        try:
+            if _restore_if_cancelled(service, event_data):
+                results[event_data['id']]['status'] = 'created'
+                restored += 1
+        except HttpError as error:
+            results[event_data['id']].update(status='failed', error=str(error))
+    if restored:
+        print(f"Calendar 批次建立: 恢復 {restored} 個先前被刪除的事件")
+
+    created = sum(1 for r in results.values() if r['status'] == 'created')
+    existing = sum(1 for r in results.values() if r['status'] == 'exists')
+    failed = sum(1 for r in results.values() if r['status'] == 'failed')
+    print(f"Calendar 批次建立: {created} 個成功，{existing} 個已存在，{failed} 個失敗")
+
+    return results
@@ -0,0 +1,308 @@
+"""
+增量摘要（每個帳號每天一份滾動摘要）
+每次執行不再從頭摘要整個時間範圍的郵件：
+    - 郵件依（帳號, 日期）分組，每組對應 digests.db 中的一份摘要與已摘要過的郵件 ID
+    - 只有尚未摘要過的郵件會送給 LLM，與既有摘要合併後寫回（LLM 工作量只與新郵件數量成正比）
+    - 所有新郵件在一次 LLM 呼叫中合併進各自的摘要，並同時產生報告的彙整摘要（與不使用增量摘要時一樣只呼叫一次）
+    - 沒有新郵件時，報告的摘要由各日摘要彙整而成（例如 7d 執行由七天的每日摘要組成，不重新讀取原始郵件）；
+      相同的摘要組合只彙整一次
+    - 同時執行的兩個 run 更新同一份摘要時以版本號偵測衝突，重新讀取後只合併仍未摘要的郵件
+
+注意：報告涵蓋時間範圍觸及的完整日期，可能包含範圍外、但先前的執行已摘要過的同日郵件；
+digest_emails 回傳涵蓋的日期與這類郵件的數量，報告中會註明
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+DIGEST_DB_PATH = os.getenv('DIGEST_DB_PATH', 'digests.db')
+DIGEST_RETENTION_DAYS = float(os.getenv('DIGEST_RETENTION_DAYS', '30'))
+DIGEST_TIMEZONE = os.getenv('DIGEST_TIMEZONE')  # 例如 Asia/Taipei；未設定時使用系統時區
+MAX_MERGE_ATTEMPTS = 3
+PRUNE_INTERVAL = 3600.0
+
+# 摘要格式或合併邏輯改變時遞增，讓舊的彙整結果失效
+DIGEST_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    account TEXT NOT NULL,
+    day TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    email_ids TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (account, day)
+);
+CREATE TABLE IF NOT EXISTS digest_rollups (
+    key TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+DigestKey = Tuple[str, str]  # (帳號, YYYY-MM-DD)
+
+_local = threading.local()
+_last_prune = 0.0
+
+
+class DigestConflict(RuntimeError):
+    """多次重試後仍無法寫入摘要（其他執行持續更新同一份摘要）"""
+
+
+# ===== 資料庫 =====
+
+def _connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """取得目前執行緒的連線（每個執行緒各自一個連線）"""
+    db_path = db_path or DIGEST_DB_PATH
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        connections[db_path] = conn
+    return conn
+
+
+def digest_key(email: Dict) -> DigestKey:
+    """郵件所屬的摘要：（帳號, 郵件日期）；無法解析日期時歸入今天"""
+    from email.utils import parsedate_to_datetime
+
+    tz = None
+    if DIGEST_TIMEZONE:
+        from zoneinfo import ZoneInfo
+        tz = ZoneInfo(DIGEST_TIMEZONE)
+
+    try:
+        day = parsedate_to_datetime(email.get('date') or '').astimezone(tz)
+    except (TypeError, ValueError, IndexError, OverflowError):
+        day = datetime.now(tz)
+    return email.get('account') or 'default', day.strftime('%Y-%m-%d')
+
+
+def get_digest(account: str, day: str, db_path: Optional[str] = None) -> Optional[Dict]:
+    """讀取一份摘要
+
+    Returns:
+        dict | None: {"account", "day", "summary", "email_ids": set, "version"}
+    """
+    row = _connect(db_path).execute(
+        'SELECT summary, email_ids, version FROM digests WHERE account = ? AND day = ?', (account, day)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"account": account, "day": day, "summary": row[0], "email_ids": set(json.loads(row[1])), "version": row[2]}
+
+
+def save_digest(account: str, day: str, summary: str, email_ids, expected_version: int,
+                db_path: Optional[str] = None) -> bool:
+    """寫入摘要（版本號不符時不寫入，回傳 False）
+
+    Args:
+        expected_version: 讀取時的版本號；新摘要為 0
+    """
+    conn = _connect(db_path)
+    ids = json.dumps(sorted(email_ids))
+    now = time.time()
+    if expected_version == 0:
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO digests VALUES (?, ?, ?, ?, 1, ?)', (account, day, summary, ids, now)
+        )
+    else:
+        cursor = conn.execute(
+            'UPDATE digests SET summary = ?, email_ids = ?, version = version + 1, updated_at = ? '
+            'WHERE account = ? AND day = ? AND version = ?',
+            (summary, ids, now, account, day, expected_version)
+        )
+    return cursor.rowcount == 1
+
+
+# ===== 增量摘要 =====
+
+def _merge_new_emails(groups: "OrderedDict[DigestKey, List[Dict]]",
+                      db_path: Optional[str]) -> Tuple[int, Optional[str], Dict[DigestKey, int]]:
+    """將各組尚未摘要的郵件合併進摘要
+
+    第一輪以一次 LLM 呼叫（update_digests）更新所有有新郵件的摘要並產生彙整摘要；
+    模型漏掉的摘要與版本衝突後的重試改為每份摘要各一次呼叫（merge_digests），此時不提供彙整摘要
+
+    Returns:
+        tuple: (送給 LLM 的郵件數, 彙整摘要或 None, 彙整摘要依據的各摘要版本)
+    """
+    from services.ai_service import merge_digests, update_digests
+
+    merged = 0
+    overall = None
+    versions: Dict[DigestKey, int] = {}
+    pending = list(groups)
+    for attempt in range(MAX_MERGE_ATTEMPTS):
+        requests = []
+        unchanged = []
+        for account, day in pending:
+            digest = get_digest(account, day, db_path)
+            seen = digest['email_ids'] if digest else set()
+            fresh = [email for email in groups[(account, day)] if email['id'] not in seen]
+            if fresh:
+                requests.append({
+                    "account": account,
+                    "day": day,
+                    "previous": digest['summary'] if digest else None,
+                    "emails": fresh,
+                    "email_ids": seen | {email['id'] for email in fresh},
+                    "version": digest['version'] if digest else 0,
+                })
+            elif digest:
+                unchanged.append(digest)
+        if not requests:
+            return merged, overall, versions
+
+        if attempt == 0:
+            summaries, overall = update_digests(requests, unchanged)
+            missing = [r for r in requests if (r['account'], r['day']) not in summaries]
+            if missing:
+                print(f"模型遺漏 {len(missing)} 份摘要，個別合併")
+                summaries.update(zip(((r['account'], r['day']) for r in missing), merge_digests(missing)))
+            versions = {(digest['account'], digest['day']): digest['version'] for digest in unchanged}
+        else:
+            summaries = dict(zip(((r['account'], r['day']) for r in requests), merge_digests(requests)))
+            overall = None
+        merged += sum(len(request['emails']) for request in requests)
+
+        # 寫入時版本已被其他執行更新：下一輪重新讀取，只合併仍未摘要的郵件
+        pending = []
+        for request in requests:
+            key = (request['account'], request['day'])
+            if save_digest(request['account'], request['day'], summaries[key], request['email_ids'],
+                           request['version'], db_path):
+                versions[key] = request['version'] + 1
+            else:
+                pending.append(key)
+        if not pending:
+            return merged, overall, versions
+        print(f"摘要版本衝突，重新合併 {len(pending)} 份摘要")
+
+    raise DigestConflict(f"無法更新摘要: {', '.join(f'{account}/{day}' for account, day in pending)}")
+
+
+def _rollup_key(digests: List[Dict]) -> str:
+    return hashlib.sha256(json.dumps(
+        [DIGEST_VERSION] + [[digest['account'], digest['day'], digest['version']] for digest in digests]
+    ).encode()).hexdigest()
+
+
+def _rollup(digests: List[Dict], db_path: Optional[str]) -> str:
+    """彙整多份摘要（相同的摘要版本組合只呼叫一次 LLM）"""
+    from services.ai_service import combine_digests
+
+    if len(digests) <= 1:
+        return combine_digests(digests)
+
+    key = _rollup_key(digests)
+    conn = _connect(db_path)
+    row = conn.execute('SELECT summary FROM digest_rollups WHERE key = ?', (key,)).fetchone()
+    if row is not None:
+        return row[0]
+
+    summary = combine_digests(digests)
+    conn.execute('INSERT OR REPLACE INTO digest_rollups VALUES (?, ?, ?)', (key, summary, time.time()))
+    return summary
+
+
+def digest_emails(emails: List[Dict], db_path: Optional[str] = None) -> Dict:
+    """增量摘要：只摘要尚未摘要過的郵件，回傳涵蓋這些郵件所屬日期的摘要
+
+    有新郵件時只呼叫一次 LLM（合併與彙整在同一個請求中）；沒有新郵件時沿用已彙整的結果
+
+    Args:
+        emails: 本次執行的郵件（需有 id、date，多帳號時有 account）
+        db_path: 資料庫路徑
+
+    Returns:
+        dict: {"summary": str, "digests": 涉及的摘要數, "new_emails": 本次送給 LLM 的郵件數,
+               "days": [第一天, 最後一天], "outside_window": 摘要中不屬於本次郵件的數量}
+    """
+    if not emails:
+        return {"summary": "此期間沒有郵件。", "digests": 0, "new_emails": 0, "days": [], "outside_window": 0}
+
+    groups: "OrderedDict[DigestKey, List[Dict]]" = OrderedDict()
+    for email in emails:
+        groups.setdefault(digest_key(email), []).append(email)
+    # 依日期排序，彙整時由舊到新
+    groups = OrderedDict(sorted(groups.items(), key=lambda item: (item[0][1], item[0][0])))
+
+    new_emails, overall, versions = _merge_new_emails(groups, db_path)
+    digests = [get_digest(account, day, db_path) for account, day in groups]
+
+    # 彙整摘要依據的版本仍是最新時直接使用（並存入彙整快取），否則（其他執行同時更新）重新彙整
+    if overall is not None and all(versions.get((d['account'], d['day'])) == d['version'] for d in digests):
+        summary = overall
+        if len(digests) > 1:
+            _connect(db_path).execute('INSERT OR REPLACE INTO digest_rollups VALUES (?, ?, ?)',
+                                      (_rollup_key(digests), summary, time.time()))
+    else:
+        summary = _rollup(digests, db_path)
+
+    # 摘要以整天為單位：先前的執行已摘要、但不在本次郵件中的（例如時間範圍開始前的同日郵件）也包含在內
+    run_ids = {email['id'] for email in emails}
+    outside_window = sum(len(digest['email_ids'] - run_ids) for digest in digests)
+
+    print(f"增量摘要: {len(emails)} 封郵件中 {new_emails} 封為新郵件，涉及 {len(digests)} 份每日摘要")
+    _maybe_prune(db_path)
+    return {
+        "summary": summary,
+        "digests": len(digests),
+        "new_emails": new_emails,
+        "days": [digests[0]['day'], digests[-1]['day']],
+        "outside_window": outside_window,
+    }
+
+
+# ===== 清除 =====
+
+def prune(db_path: Optional[str] = None, older_than_days: float = DIGEST_RETENTION_DAYS) -> int:
+    """刪除超過保留期限未再更新的摘要與彙整結果
+
+    Returns:
+        int: 刪除的摘要數
+    """
+    cutoff = time.time() - older_than_days * 86400
+    conn = _connect(db_path)
+    conn.execute('DELETE FROM digest_rollups WHERE created_at < ?', (cutoff,))
+    return conn.execute('DELETE FROM digests WHERE updated_at < ?', (cutoff,)).rowcount
+
+
+def _maybe_prune(db_path: Optional[str]):
+    global _last_prune
+    if time.time() - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = time.time()
+    try:
+        deleted = prune(db_path)
+        if deleted:
+            print(f"已清除 {deleted} 份過期的摘要")
+    except sqlite3.Error as e:
+        print(f"清除摘要失敗: {e}")
+
+
+# ===== 統計 =====
+
+def stats(db_path: Optional[str] = None) -> Dict[str, int]:
+    """摘要數量、已摘要的郵件數與彙整結果數量"""
+    conn = _connect(db_path)
+    digests, emails = conn.execute(
+        'SELECT COUNT(*), COALESCE(SUM(json_array_length(email_ids)), 0) FROM digests'
+    ).fetchone()
+    rollups = conn.execute('SELECT COUNT(*) FROM digest_rollups').fetchone()[0]
+    return {"digests": digests, "emails": emails, "rollups": rollups}
@@ -0,0 +1,193 @@
+"""
+郵件內容儲存（content-addressed）
+完整的郵件內容（正文、正規化文字、ics）只寫入一次，graph state 只保存參照（內容雜湊）：
+    - checkpoint 不再於每個節點後重複序列化整批郵件，寫入量與恢復時間大幅下降
+    - 相同內容的郵件（重複觸發、同一封信再次抓取）只存一份
+    - 讀取時依參照解析，行程內以 LRU 快取避免重複讀取與解壓縮
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+EMAIL_STORE_DB_PATH = os.getenv('EMAIL_STORE_DB_PATH', 'emails.db')
+EMAIL_CACHE_SIZE = int(os.getenv('EMAIL_CACHE_SIZE', '1000'))
+EMAIL_RETENTION_DAYS = float(os.getenv('EMAIL_RETENTION_DAYS', '30'))
+PRUNE_INTERVAL = 3600.0
+_QUERY_CHUNK = 500  # SQLite 參數數量上限
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_blobs (
+    ref TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_email_blobs_used ON email_blobs (last_used_at);
+"""
+
+_local = threading.local()
+_cache: "OrderedDict[str, Dict]" = OrderedDict()
+_cache_lock = threading.Lock()
+_last_prune = 0.0
+
+
+class EmailNotFound(KeyError):
+    """參照的郵件內容不存在（已被清除或資料庫不同）"""
+
+
+# ===== 資料庫 =====
+
+def _connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """取得目前執行緒的連線（每個執行緒各自一個連線）"""
+    db_path = db_path or EMAIL_STORE_DB_PATH
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        connections[db_path] = conn
+    return conn
+
+
+def _encode(email: Dict) -> bytes:
+    return json.dumps(email, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+# ===== 快取 =====
+
+def _cache_put(ref: str, email: Dict):
+    with _cache_lock:
+        _cache[ref] = email
+        _cache.move_to_end(ref)
+        while len(_cache) > EMAIL_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _cache_get(ref: str) -> Optional[Dict]:
+    with _cache_lock:
+        email = _cache.get(ref)
+        if email is not None:
+            _cache.move_to_end(ref)
+        return email
+
+
+# ===== 寫入 / 讀取 =====
+
+def put_emails(emails: List[Dict], db_path: Optional[str] = None) -> List[str]:
+    """儲存郵件內容，回傳與輸入順序相同的參照列表（已存在的內容不會重複寫入）
+
+    Args:
+        emails: 郵件列表（寫入後不應再修改）
+        db_path: 資料庫路徑
+
+    Returns:
+        List[str]: 各郵件的參照
+    """
+    now = time.time()
+    refs = []
+    rows = []
+    for email in emails:
+        data = _encode(email)
+        # 參照：正規化 JSON 的 SHA-256
+        ref = hashlib.sha256(data).hexdigest()[:32]
+        refs.append(ref)
+        rows.append((ref, zlib.compress(data), len(data), now, now))
+        _cache_put(ref, email)
+
+    if rows:
+        conn = _connect(db_path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT OR IGNORE INTO email_blobs VALUES (?, ?, ?, ?, ?)', rows)
+            # 已存在的內容更新使用時間，避免被清除
+            conn.executemany('UPDATE email_blobs SET last_used_at = ? WHERE ref = ?', [(now, row[0]) for row in rows])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    _maybe_prune(db_path)
+    return refs
+
+
+def get_emails(refs: List[str], db_path: Optional[str] = None) -> List[Dict]:
+    """依參照取得郵件內容（順序與 refs 相同）
+
+    回傳的 dict 由快取共用，呼叫端不應修改
+
+    Raises:
+        EmailNotFound: 參照不存在
+    """
+    found = {}
+    missing = []
+    for ref in refs:
+        email = _cache_get(ref)
+        if email is None:
+            missing.append(ref)
+        else:
+            found[ref] = email
+
+    if missing:
+        conn = _connect(db_path)
+        unique = list(dict.fromkeys(missing))
+        for start in range(0, len(unique), _QUERY_CHUNK):
+            chunk = unique[start:start + _QUERY_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            for ref, data in conn.execute(
+                f'SELECT ref, data FROM email_blobs WHERE ref IN ({placeholders})', chunk
+            ):
+                email = json.loads(zlib.decompress(data))
+                found[ref] = email
+                _cache_put(ref, email)
+
+    lost = [ref for ref in refs if ref not in found]
+    if lost:
+        raise EmailNotFound(f"找不到 {len(lost)} 封郵件的內容: {', '.join(lost[:3])}")
+    return [found[ref] for ref in refs]
+
+
+# ===== 清除 =====
+
+def prune(db_path: Optional[str] = None, older_than_days: float = EMAIL_RETENTION_DAYS) -> int:
+    """刪除超過保留期限未再使用的郵件內容
+
+    Returns:
+        int: 刪除的筆數
+    """
+    cutoff = time.time() - older_than_days * 86400
+    return _connect(db_path).execute('DELETE FROM email_blobs WHERE last_used_at < ?', (cutoff,)).rowcount
+
+
+def _maybe_prune(db_path: Optional[str]):
+    global _last_prune
+    if time.time() - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = time.time()
+    try:
+        deleted = prune(db_path)
+        if deleted:
+            print(f"已清除 {deleted} 封過期的郵件內容")
+    except sqlite3.Error as e:
+        print(f"清除郵件內容失敗: {e}")
+
+
+# ===== 統計 =====
+
+def stats(db_path: Optional[str] = None) -> Dict[str, int]:
+    """儲存的郵件數量與大小（未壓縮 / 壓縮後位元組）"""
+    count, raw_bytes, stored_bytes = _connect(db_path).execute(
+        'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM email_blobs'
+    ).fetchone()
+    return {"emails": count, "bytes": raw_bytes, "stored_bytes": stored_bytes}
@@ -0,0 +1,132 @@
+"""
+事件檢測的上下文視窗服務
+取代固定的 body[:500] 截斷：在日期 / 時間 / 地點出現的位置周圍擷取片段，
+在 token 預算內組成摘錄，並將多封郵件打包成有 token 上限的批次
+"""
+import os
+from typing import Dict, List
+
+from services.text_service import estimate_tokens, get_email_text
+from services.event_filter import find_event_mentions
+
+# 每封郵件摘錄的 token 預算
+EXCERPT_TOKEN_BUDGET = int(os.getenv('EVENT_EXCERPT_TOKENS', '200'))
+# 每個 LLM 批次的 token 上限（不含 prompt）
+BATCH_TOKEN_BUDGET = int(os.getenv('EVENT_BATCH_TOKENS', '3000'))
+# 同時送出的批次數
+BATCH_CONCURRENCY = int(os.getenv('EVENT_BATCH_CONCURRENCY', '4'))
+
+# 每個命中位置前後擷取的字元數
+_WINDOW_BEFORE = 120
+_WINDOW_AFTER = 180
+_SEPARATOR = ' … '
+
+
+def _merge_windows(windows: List[List]) -> List[List]:
+    """合併重疊的視窗，保留每個視窗命中的類型"""
+    merged = []
+    for start, end, kinds in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+            merged[-1][2] |= kinds
+        else:
+            merged.append([start, end, set(kinds)])
+    return merged
+
+
+def _fit_to_budget(text: str, budget: int) -> str:
+    """以 token 預算截斷文字（估算後按比例截斷，再逐步修正）"""
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    cut = max(1, int(len(text) * budget / tokens))
+    while cut > 1 and estimate_tokens(text[:cut]) > budget:
+        cut = int(cut * 0.9)
+    return text[:cut]
+
+
+def build_event_excerpt(email: Dict, token_budget: int = EXCERPT_TOKEN_BUDGET) -> str:
+    """為單封郵件建立事件檢測用的摘錄
+
+    以日期 / 時間 / 星期 / 地點 / 會議連結出現的位置為中心擷取視窗，
+    合併重疊的視窗，優先保留同時包含日期與時間的視窗，直到用完 token 預算。
+    沒有任何命中時退回郵件開頭。
+
+    Args:
+        email: 郵件 dict
+        token_budget: token 預算
+
+    Returns:
+        str: 摘錄文字（視窗以 " … " 連接，依原文順序排列）
+    """
+    text = get_email_text(email, 'body')
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    mentions = find_event_mentions(text)
+    if not mentions:
+        return _fit_to_budget(text, token_budget)
+
+    windows = _merge_windows([
+        [max(0, start - _WINDOW_BEFORE), min(len(text), end + _WINDOW_AFTER), {kind}]
+        for start, end, kind in mentions
+    ])
+
+    # 資訊量高的視窗優先：日期+時間 > 命中類型數 > 出現位置較前
+    def _score(window):
+        kinds = window[2]
+        return (('date' in kinds) and bool({'time', 'weekday'} & kinds), len(kinds), -window[0])
+
+    selected = []
+    used = 0
+    for window in sorted(windows, key=_score, reverse=True):
+        snippet = text[window[0]:window[1]].strip()
+        cost = estimate_tokens(snippet) + (1 if selected else 0)
+        if used + cost > token_budget:
+            remaining = token_budget - used
+            # 剩餘預算足以容納有意義的片段時才截斷放入
+            if remaining >= 30:
+                selected.append((window[0], _fit_to_budget(snippet, remaining)))
+            break
+        selected.append((window[0], snippet))
+        used += cost
+
+    selected.sort()
+    return _SEPARATOR.join(snippet for _, snippet in selected)
+
+
+def format_email_for_detection(email: Dict, token_budget: int = EXCERPT_TOKEN_BUDGET) -> str:
+    """格式化單封郵件供事件檢測 prompt 使用"""
+    return (
+        f"ID: {email['id']}\n主旨: {email.get('subject', '')}\n寄件者: {email.get('from', '')}\n"
+        f"日期: {email.get('date', '')}\n內容: {build_event_excerpt(email, token_budget)}"
+    )
+
+
+def pack_batches(entries: List[str], batch_token_budget: int = BATCH_TOKEN_BUDGET) -> List[List[str]]:
+    """將郵件文字打包成 token 有上限的批次（依序貪婪裝箱）
+
+    單一郵件超過上限時自成一批
+
+    Args:
+        entries: 已格式化的郵件文字列表
+        batch_token_budget: 每批 token 上限
+
+    Returns:
+        List[List[str]]: 批次列表
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+
+    for entry in entries:
+        tokens = estimate_tokens(entry)
+        if current and current_tokens + tokens > batch_token_budget:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(entry)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
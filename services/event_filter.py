@@ -0,0 +1,253 @@
+"""
+事件候選過濾服務
+在呼叫 LLM 之前，以本地規則快速判斷郵件是否可能包含可排程的事件
+（日期 / 時間 / 星期、日曆邀請 MIME 類型、線上會議連結）
+"""
+import os
+import re
+import json
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from services.text_service import get_email_text
+
+# ===== 規則 =====
+
+_MONTHS = r'(Jan(uary)?|Feb(ruary)?|Mar(ch)?|Apr(il)?|May|June?|July?|Aug(ust)?|Sep(t(ember)?)?|Oct(ober)?|Nov(ember)?|Dec(ember)?)'
+
+# 日期
+DATE_PATTERNS = [
+    re.compile(rf'\b{_MONTHS}\.?\s+\d{{1,2}}(st|nd|rd|th)?\b', re.IGNORECASE),           # Jan 5, January 5th
+    re.compile(rf'\b\d{{1,2}}(st|nd|rd|th)?\s+(of\s+)?{_MONTHS}\b', re.IGNORECASE),        # 5 Jan, 5th of January
+    re.compile(r'\b\d{4}[-/.]\d{1,2}[-/.]\d{1,2}\b'),                                       # 2024-01-25
+    re.compile(r'\b\d{1,2}/\d{1,2}(/\d{2,4})?\b'),                                          # 1/25, 1/25/2024
+    re.compile(r'\d{1,2}\s*月\s*\d{1,2}\s*[日號号]'),                                        # 1月25日
+    re.compile(r'\d{4}\s*年\s*\d{1,2}\s*月'),                                                # 2024年1月
+]
+
+# 時間
+TIME_PATTERNS = [
+    re.compile(r'\b\d{1,2}(:\d{2})?\s*(a\.?m\.?|p\.?m\.?)(?![a-z])', re.IGNORECASE),       # 3pm, 3:30 PM
+    re.compile(r'\b([01]?\d|2[0-3]):[0-5]\d\b'),                                            # 15:00
+    re.compile(r'(上午|下午|早上|中午|晚上|傍晚)\s*\d{1,2}\s*([點点時时:：])'),                # 下午3點
+    re.compile(r'\d{1,2}\s*[點点]\s*(半|\d{1,2}\s*分)?'),                                     # 3點半
+    re.compile(r'\b(noon|midnight)\b', re.IGNORECASE),
+]
+
+# 星期 / 相對日期
+WEEKDAY_PATTERNS = [
+    re.compile(r'\b(Mon|Tues?|Wed(nes)?|Thu(rs?)?|Fri|Sat(ur)?|Sun)(day)?\b\.?', re.IGNORECASE),
+    re.compile(r'\b(tomorrow|tonight|next (week|month|monday|tuesday|wednesday|thursday|friday|saturday|sunday))\b', re.IGNORECASE),
+    re.compile(r'(星期|禮拜|礼拜|週|周)[一二三四五六日天]'),
+    re.compile(r'(明天|後天|后天|今晚|明晚|下週|下周|下星期|下禮拜)'),
+]
+
+# 線上會議連結
+MEETING_LINK_PATTERNS = [
+    re.compile(r'([a-z0-9-]+\.)?zoom\.us/(j|my|w|meeting)/', re.IGNORECASE),
+    re.compile(r'meet\.google\.com/[a-z]{3}-[a-z]{4}-[a-z]{3}', re.IGNORECASE),
+    re.compile(r'teams\.(microsoft|live)\.com/(l/meetup-join|meet)', re.IGNORECASE),
+    re.compile(r'([a-z0-9-]+\.)?webex\.com/(meet|join|[a-z0-9-]+/j\.php)', re.IGNORECASE),
+    re.compile(r'calendly\.com/', re.IGNORECASE),
+]
+
+# 地點
+LOCATION_PATTERNS = [
+    re.compile(r'\b(location|venue|address|room|where)\s*[:：]', re.IGNORECASE),
+    re.compile(r'\b(room|building|hall|floor)\s+[A-Z0-9][\w-]*', re.IGNORECASE),
+    re.compile(r'(地點|地址|會議室|会议室|教室|場地)\s*[:：]?'),
+]
+
+# 邀約 / 活動用語：單獨的時間、日期或星期只是弱訊號，需與這類用語或地點搭配
+EVENT_WORD_PATTERNS = [
+    re.compile(r'\b(meet(ing|up)?|call|sync|interview|coffee|lunch|dinner|breakfast|drinks?|demo|webinar|'
+               r'workshop|class|session|appointment|conference|party|kickoff|stand-?up|all-hands|office hours|'
+               r'flight|movie|pick (me|you) up|land|arriv(e|ing)|rsvp|(re)?schedul(e|ed|ing))\b',
+               re.IGNORECASE),
+    re.compile(r'(開會|會議|会议|面試|面试|面談|聚餐|吃飯|見面|集合|討論|約|課程|上課|活動|講座|報到)'),
+]
+
+# 郵件標頭行（轉寄 / 引用中的 "Sent: Wed, ..."）中的日期時間不是事件
+_HEADER_LINE = re.compile(r'^\s*(Sent|Date|From|To|Cc|Subject|寄件日期|日期|寄件者|收件者)\s*[:：].*$',
+                          re.IGNORECASE | re.MULTILINE)
+
+# 日曆邀請
+CALENDAR_MIME_TYPES = {'text/calendar', 'application/ics', 'application/x-ics'}
+_INVITE_SUBJECT = re.compile(r'^\s*(Invitation|Updated invitation|Accepted|New event|邀請|更新的邀請)\s*[:：]', re.IGNORECASE)
+
+# 錄製時的遮蔽：每個命中位置前後保留的字元數與摘錄上限，電子郵件地址一律遮蔽
+_RECORD_WINDOW = 60
+_RECORD_MAX_CHARS = 2000
+_EMAIL_ADDRESS = re.compile(r'[\w.+-]+@[\w-]+(\.[\w-]+)+')
+
+
+# ===== 候選判斷 =====
+
+def find_event_mentions(text: str) -> List[Tuple[int, int, str]]:
+    """找出文字中所有日期 / 時間 / 星期 / 會議連結 / 地點的位置
+
+    Args:
+        text: 文字內容
+
+    Returns:
+        List[Tuple[int, int, str]]: [(start, end, kind), ...]，依位置排序；
+        kind 為 'date' / 'time' / 'weekday' / 'meeting_link' / 'location'
+    """
+    mentions = []
+    for kind, patterns in (
+        ('date', DATE_PATTERNS),
+        ('time', TIME_PATTERNS),
+        ('weekday', WEEKDAY_PATTERNS),
+        ('meeting_link', MEETING_LINK_PATTERNS),
+        ('location', LOCATION_PATTERNS),
+    ):
+        for pattern in patterns:
+            mentions.extend((m.start(), m.end(), kind) for m in pattern.finditer(text))
+
+    mentions.sort()
+    return mentions
+
+
+def get_candidate_reasons(email: Dict) -> List[str]:
+    """判斷郵件為事件候選的原因
+
+    Args:
+        email: 郵件 dict
+
+    強訊號單獨即可：日曆邀請、邀請主旨、會議連結、日期 + 時間 / 星期、星期 + 時間；
+    弱訊號（日期、時間、星期、地點、邀約用語）需至少兩個，且其中之一是日期 / 時間 / 星期。
+    郵件標頭行（"Sent: Wed, ..."）中的日期時間不計
+
+    Returns:
+        List[str]: 命中的規則（空列表表示不是候選）；弱訊號組合以 '+' 連接，例如 'event_word+time'
+    """
+    reasons = []
+
+    mime_types = set(email.get('mime_types', []))
+    if mime_types & CALENDAR_MIME_TYPES or email.get('ics'):
+        reasons.append('calendar_mime')
+
+    subject = email.get('subject', '') or ''
+    if _INVITE_SUBJECT.search(subject):
+        reasons.append('invite_subject')
+
+    text = _HEADER_LINE.sub('', f"{subject}\n{get_email_text(email, 'body')}")
+    kinds = {kind for _, _, kind in find_event_mentions(text)}
+
+    if 'meeting_link' in kinds:
+        reasons.append('meeting_link')
+    if 'date' in kinds and ({'time', 'weekday'} & kinds):
+        reasons.append('date_time')
+    elif 'time' in kinds and 'weekday' in kinds:
+        reasons.append('weekday_time')
+    else:
+        # 單獨的時間 / 日期 / 星期（"delivered at 2:14 PM"、"Posted Friday"）很常見，
+        # 需另有地點或邀約用語（"coffee at 10:30"、"drinks tonight"）才算候選
+        signals = kinds & {'date', 'time', 'weekday', 'location'}
+        if any(pattern.search(text) for pattern in EVENT_WORD_PATTERNS):
+            signals.add('event_word')
+        if len(signals) >= 2 and signals & {'date', 'time', 'weekday'}:
+            reasons.append('+'.join(sorted(signals)))
+
+    return reasons
+
+
+def is_event_candidate(email: Dict) -> bool:
+    """郵件是否可能包含可排程事件"""
+    return bool(get_candidate_reasons(email))
+
+
+def filter_event_candidates(emails: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """將郵件分為事件候選與非候選
+
+    設定 EVENT_PREFILTER=false 可停用過濾（所有郵件都視為候選）
+
+    Args:
+        emails: 郵件列表
+
+    Returns:
+        Tuple[List[Dict], List[Dict]]: (candidates, skipped)
+    """
+    if os.getenv('EVENT_PREFILTER', 'true').lower() != 'true':
+        return list(emails), []
+
+    candidates, skipped = [], []
+    for email in emails:
+        (candidates if is_event_candidate(email) else skipped).append(email)
+
+    if emails:
+        print(f"事件候選過濾: {len(candidates)}/{len(emails)} 封郵件送交 LLM")
+    return candidates, skipped
+
+
+# ===== 錄製（用於量測 recall） =====
+
+def redact_for_recording(email: Dict) -> str:
+    """錄製用的遮蔽摘錄：只保留日期 / 時間 / 地點 / 會議連結附近的片段，電子郵件地址以 <email> 取代
+
+    過濾規則只依這些命中判斷，因此以摘錄重新執行規則的結果與原文相同
+    """
+    text = f"{email.get('subject', '') or ''}\n{get_email_text(email, 'body')}"
+    windows = []
+    for start, end, _ in find_event_mentions(text):
+        start, end = max(0, start - _RECORD_WINDOW), min(len(text), end + _RECORD_WINDOW)
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+    excerpt = ' … '.join(text[start:end].strip() for start, end in windows)
+    return _EMAIL_ADDRESS.sub('<email>', excerpt)[:_RECORD_MAX_CHARS]
+
+
+def recording_to_email(record: Dict) -> Dict:
+    """將錄製的記錄還原為可交給 get_candidate_reasons 的郵件 dict"""
+    if 'excerpt' not in record:
+        # 舊格式（含完整正文）
+        return record
+    return {
+        'id': record['email_hash'],
+        'subject': 'Invitation:' if record.get('invite_subject') else '',
+        'clean_body': record['excerpt'],
+        'mime_types': record.get('mime_types', []),
+        'ics': record.get('has_ics', False),
+    }
+
+
+def record_detection_run(emails: List[Dict], events: List[Dict], sent_to_llm: List[Dict],
+                         path: Optional[str] = None) -> None:
+    """將本次事件檢測結果附加到 JSONL 錄製檔
+
+    每封郵件一行，包含候選判斷與 LLM 是否檢測出事件；
+    未送交 LLM 的郵件 has_event 為 null。設定 EVENT_RECORDINGS_PATH 啟用。
+    不寫入正文與寄件者：郵件 ID 與正文只存雜湊，內容只保留遮蔽後的摘錄（redact_for_recording）。
+    以 EVENT_PREFILTER=false 錄製的資料可作為完整標註集，
+    供 benchmarks/event_filter_recall.py 量測過濾器的 recall
+
+    Args:
+        emails: 本次檢測的所有郵件
+        events: 檢測到的事件
+        sent_to_llm: 實際送交 LLM 的郵件
+        path: 錄製檔路徑（預設讀取 EVENT_RECORDINGS_PATH）
+    """
+    path = path or os.getenv('EVENT_RECORDINGS_PATH')
+    if not path:
+        return
+
+    labeled_ids = {email['id'] for email in sent_to_llm}
+    event_email_ids = {event['email_id'] for event in events}
+    recorded_at = datetime.now().isoformat()
+
+    with open(path, 'a', encoding='utf-8') as f:
+        for email in emails:
+            f.write(json.dumps({
+                'recorded_at': recorded_at,
+                'email_hash': hashlib.sha256(email['id'].encode('utf-8')).hexdigest()[:16],
+                'body_sha256': hashlib.sha256((email.get('body', '') or '').encode('utf-8')).hexdigest(),
+                'invite_subject': bool(_INVITE_SUBJECT.search(email.get('subject', '') or '')),
+                'excerpt': redact_for_recording(email),
+                'mime_types': email.get('mime_types', []),
+                'has_ics': bool(email.get('ics')),
+                'candidate_reasons': get_candidate_reasons(email),
+                'has_event': (email['id'] in event_email_ids) if email['id'] in labeled_ids else None,
+            }, ensure_ascii=False) + '\n')
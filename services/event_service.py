@@ -1,8 +1,11 @@
 # services/event_service.py
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
+from services.event_context import format_email_for_detection, pack_batches, BATCH_CONCURRENCY
+from services.event_filter import filter_event_candidates, record_detection_run
+from services.ics_service import events_from_email, is_cancellation
+from services.metrics import track_call, inc
 
 class DetectedEvent(BaseModel):
     """檢測到的事件"""
@@ -15,6 +18,11 @@ class DetectedEvent(BaseModel):
     description: Optional[str] = None
     confidence: float = Field(ge=0.0, le=1.0)  # 置信度 0-1
 
+class InviteEvent(DetectedEvent):
+    """由日曆邀請（ICS）解析的事件：另外保留全天與重複規則（不在 LLM 的輸出格式中）"""
+    all_day: bool = False
+    recurrence: Optional[list[str]] = None  # RRULE / RDATE / EXDATE 行，原樣交給 Calendar API
+
 class EventsDetection(BaseModel):
     """事件檢測結果"""
     events: list[DetectedEvent]
@@ -31,7 +39,31 @@ def detect_events_from_emails(emails: list[dict]) -> list[dict]:
     if not emails:
         return []
 
-    llm = ChatOpenAI(model="gpt-4o")
+    # 含日曆邀請（text/calendar）的郵件直接解析，不經過 LLM
+    ics_events = []
+    prose_emails = []
+    for email in emails:
+        parsed = events_from_email(email) if email.get('ics') else []
+        if parsed:
+            ics_events.extend(parsed)
+        elif email.get('ics') and is_cancellation(email):
+            # 取消的邀請不需要再交給 LLM 判斷
+            continue
+        else:
+            prose_emails.append(email)
+
+    if ics_events:
+        print(f"日曆邀請解析: {len(ics_events)} 個事件（{len(emails) - len(prose_emails)} 封郵件略過 LLM）")
+
+    # 本地規則先過濾，只有可能包含事件的郵件才送交 LLM
+    candidates, _ = filter_event_candidates(prose_emails)
+    if not candidates:
+        record_detection_run(emails, ics_events, [])
+        return [InviteEvent(**event).model_dump() for event in ics_events]
+
+    from services.ai_service import get_llm
+
+    llm = get_llm()
     structured_llm = llm.with_structured_output(EventsDetection)
 
     prompt = """你是一個專業的行程助手。請分析以下郵件，檢測其中的事件/行程資訊。
@@ -55,20 +87,59 @@ def detect_events_from_emails(emails: list[dict]) -> list[dict]:
     - description: 詳細說明
     - confidence: 置信度分數
 
+    ## 注意：
+    郵件內容為摘錄，只保留日期、時間、地點附近的片段，片段之間以「…」分隔；
+    相對日期（如「明天」、「下週三」）請依郵件的日期推算。
+
     ## 待分析郵件：
     """
 
-    emails_text = "\n\n".join([
-        f"ID: {email['id']}\n主旨: {email['subject']}\n寄件者: {email['from']}\n內容: {email['body'][:500]}"
-        for email in emails
-    ])
+    # 每封郵件只取日期 / 時間 / 地點附近的摘錄，並打包成有 token 上限的批次平行送出
+    entries = [format_email_for_detection(email) for email in candidates]
+    batches = pack_batches(entries)
+
+    prompts = [prompt + "\n\n".join(batch) for batch in batches]
+    with track_call('openai', 'detect_events') as call:
+        call.set('emails', len(candidates)).set('batches', len(batches))
+        call.set('prompt_chars', sum(len(text) for text in prompts))
+        results = structured_llm.batch(
+            prompts, config={"max_concurrency": BATCH_CONCURRENCY}, return_exceptions=True
+        )
+        # 失敗的批次（例如個別被限流）立即重送一次
+        failed = [i for i, result in enumerate(results) if isinstance(result, Exception)]
+        if failed:
+            print(f"事件檢測: {len(failed)}/{len(batches)} 個批次失敗，重新送出")
+            call.set('retried_batches', len(failed))
+            retried = structured_llm.batch(
+                [prompts[i] for i in failed], config={"max_concurrency": BATCH_CONCURRENCY}, return_exceptions=True
+            )
+            for i, result in zip(failed, retried):
+                results[i] = result
+    # batch 不會拋出例外，個別失敗的批次另外計數
+    for result in results:
+        inc('email_summary_external_calls_total',
+            {'service': 'openai', 'operation': 'detect_events.batch', 'status': 'error' if isinstance(result, Exception) else 'ok'})
+    print(f"事件檢測: {len(candidates)} 封郵件分為 {len(batches)} 個批次")
+
+    # 重送後仍有批次失敗時拋出：部分結果不回傳也不被快取，由節點的重試政策處理
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        print(f"事件檢測: {len(errors)}/{len(batches)} 個批次重送後仍失敗")
+        raise errors[0]
+
+    # 合併各批次結果，過濾低置信度與重複事件
+    filtered_events = []
+    seen = set()
+    for result in results:
+        for e in result.events:
+            key = (e.email_id, e.title.strip().lower(), e.start_time)
+            if e.confidence < 0.7 or e.id in seen or key in seen:
+                continue
+            seen.update((e.id, key))
+            filtered_events.append(e.model_dump())
 
-    result = structured_llm.invoke(prompt + emails_text)
+    filtered_events = [InviteEvent(**event).model_dump() for event in ics_events] + filtered_events
 
-    # 過濾低置信度事件
-    filtered_events = [
-        e.model_dump() for e in result.events
-        if e.confidence >= 0.7
-    ]
+    record_detection_run(emails, filtered_events, candidates)
 
     return filtered_events
\ No newline at end of file
@@ -15,6 +15,9 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from services.metrics import track_call
+from services.tracing import span
+
 # Gmail API 權限範圍
 # 如果修改這些範圍，需要刪除 token.json 重新授權
 SCOPES = [
@@ -218,6 +221,82 @@ def get_message_body(payload: Dict) -> str:
     return body.strip()
 
 
+def get_mime_types(payload: Dict) -> List[str]:
+    """
+    列出郵件中所有部分的 MIME 類型（含附件）
+
+    Args:
+        payload: 郵件 payload
+
+    Returns:
+        List[str]: MIME 類型列表（不重複）
+    """
+    mime_types = []
+    stack = [payload]
+
+    while stack:
+        part = stack.pop()
+        mime_type = part.get('mimeType', '')
+        if mime_type and mime_type not in mime_types:
+            mime_types.append(mime_type)
+        # .ics 附件常被標成 application/octet-stream
+        if part.get('filename', '').lower().endswith('.ics') and 'text/calendar' not in mime_types:
+            mime_types.append('text/calendar')
+        stack.extend(part.get('parts', []))
+
+    return mime_types
+
+
+CALENDAR_MIME_TYPES = ('text/calendar', 'application/ics', 'application/x-ics')
+
+
+def get_calendar_parts(payload: Dict, service=None, message_id: str = None) -> List[str]:
+    """
+    提取郵件中的 iCalendar (text/calendar) 內容
+
+    內嵌的部分直接解碼；以附件形式（attachmentId）存在的部分，
+    若提供 service 與 message_id 則另外下載
+
+    Args:
+        payload: 郵件 payload
+        service: Gmail API 服務實例（下載附件用，可選）
+        message_id: 郵件 ID（下載附件用，可選）
+
+    Returns:
+        List[str]: iCalendar 文字列表
+    """
+    calendars = []
+    stack = [payload]
+
+    while stack:
+        part = stack.pop()
+        stack.extend(part.get('parts', []))
+
+        mime_type = part.get('mimeType', '').lower()
+        filename = part.get('filename', '').lower()
+        if mime_type not in CALENDAR_MIME_TYPES and not filename.endswith('.ics'):
+            continue
+
+        body = part.get('body', {})
+        if 'data' in body:
+            calendars.append(decode_message_part(part))
+        elif body.get('attachmentId') and service is not None and message_id:
+            try:
+                with track_call('gmail', 'attachments.get') as call:
+                    attachment = service.users().messages().attachments().get(
+                        userId='me',
+                        messageId=message_id,
+                        id=body['attachmentId']
+                    ).execute()
+                    call.set('bytes', attachment.get('size'))
+                data = base64.urlsafe_b64decode(attachment.get('data', ''))
+                calendars.append(data.decode('utf-8', errors='ignore'))
+            except HttpError as error:
+                print(f'下載日曆附件失敗 {message_id}: {error}')
+
+    return [calendar for calendar in calendars if 'BEGIN:VEVENT' in calendar.upper()]
+
+
 def get_header_value(headers: List[Dict], name: str) -> str:
     """
     從郵件標頭中提取指定欄位的值
@@ -264,11 +343,13 @@ def fetch_emails(service,
         print(f"搜尋郵件: {search_query}")
 
         # 獲取郵件 ID 列表
-        results = service.users().messages().list(
-            userId='me',
-            q=search_query,
-            maxResults=max_emails
-        ).execute()
+        with track_call('gmail', 'messages.list') as call:
+            results = service.users().messages().list(
+                userId='me',
+                q=search_query,
+                maxResults=max_emails
+            ).execute()
+            call.set('results', len(results.get('messages', [])))
 
         messages = results.get('messages', [])
 
@@ -282,11 +363,13 @@ def fetch_emails(service,
         emails = []
         for i, message in enumerate(messages, 1):
             try:
-                msg = service.users().messages().get(
-                    userId='me',
-                    id=message['id'],
-                    format='full'
-                ).execute()
+                with track_call('gmail', 'messages.get') as call:
+                    msg = service.users().messages().get(
+                        userId='me',
+                        id=message['id'],
+                        format='full'
+                    ).execute()
+                    call.set('bytes', msg.get('sizeEstimate'))
 
                 # 提取郵件資訊
                 headers = msg['payload']['headers']
@@ -301,6 +384,8 @@ def fetch_emails(service,
                     'body': get_message_body(msg['payload']),
                     'snippet': msg.get('snippet', ''),
                     'labels': msg.get('labelIds', []),
+                    'mime_types': get_mime_types(msg['payload']),
+                    'ics': get_calendar_parts(msg['payload'], service, msg['id']),
                 }
 
                 emails.append(email_data)
@@ -427,17 +512,19 @@ def fetch_emails_from_multiple_accounts(
             print(f"   使用文件: {credentials_path}, {token_path}")
 
         try:
-            # 獲取該帳號的郵件
-            emails = fetch_emails_from_gmail(
-                time_range=time_range,
-                max_emails=max_emails_per_account,
-                query=query,
-                credentials_path=credentials_path,
-                token_path=token_path,
-                account_label=label,
-                credentials_base64_env=credentials_base64_env,
-                token_base64_env=token_base64_env
-            )
+            # 獲取該帳號的郵件（每個帳號一個 span，失敗時記錄錯誤）
+            with span('gmail.account', kind='account', account=label) as account_span:
+                emails = fetch_emails_from_gmail(
+                    time_range=time_range,
+                    max_emails=max_emails_per_account,
+                    query=query,
+                    credentials_path=credentials_path,
+                    token_path=token_path,
+                    account_label=label,
+                    credentials_base64_env=credentials_base64_env,
+                    token_base64_env=token_base64_env
+                )
+                account_span.set('emails', len(emails))
 
             all_emails.extend(emails)
             print(f"✓ 帳號 [{label}] 獲取成功: {len(emails)} 封郵件\n")
@@ -0,0 +1,254 @@
+"""
+iCalendar (text/calendar) 解析服務
+直接從日曆邀請中讀取 DTSTART / DTEND / LOCATION，不需經過 LLM
+"""
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# 與 calendar_service 建立事件時使用的時區一致
+LOCAL_TIMEZONE = 'Asia/Taipei'
+
+_DURATION = re.compile(
+    r'^(?P<sign>[+-])?P((?P<weeks>\d+)W)?((?P<days>\d+)D)?'
+    r'(T((?P<hours>\d+)H)?((?P<minutes>\d+)M)?((?P<seconds>\d+)S)?)?$'
+)
+
+# 重複事件的屬性（Calendar API 的 recurrence 欄位接受相同格式）
+_RECURRENCE_PROPERTIES = ('RRULE', 'RDATE', 'EXDATE')
+
+# Windows 時區名稱（Outlook 邀請常見）對應 IANA
+_WINDOWS_TIMEZONES = {
+    'Taipei Standard Time': 'Asia/Taipei',
+    'China Standard Time': 'Asia/Shanghai',
+    'Tokyo Standard Time': 'Asia/Tokyo',
+    'Eastern Standard Time': 'America/New_York',
+    'Central Standard Time': 'America/Chicago',
+    'Mountain Standard Time': 'America/Denver',
+    'Pacific Standard Time': 'America/Los_Angeles',
+    'GMT Standard Time': 'Europe/London',
+    'UTC': 'UTC',
+}
+
+
+# ===== 低階解析 =====
+
+def unfold_lines(ics_text: str) -> List[str]:
+    """展開 RFC 5545 折行（以空白或 tab 開頭的行接續上一行）"""
+    lines = []
+    for raw in ics_text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        if raw[:1] in (' ', '\t') and lines:
+            lines[-1] += raw[1:]
+        elif raw:
+            lines.append(raw)
+    return lines
+
+
+def parse_property(line: str) -> tuple:
+    """解析單一屬性行
+
+    Args:
+        line: 例如 "DTSTART;TZID=Asia/Taipei:20240115T150000"
+
+    Returns:
+        tuple: (name, params, value)
+    """
+    # 冒號可能出現在參數的引號內（例如 TZID="..."），需略過
+    in_quotes = False
+    split_at = -1
+    for i, ch in enumerate(line):
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif ch == ':' and not in_quotes:
+            split_at = i
+            break
+    if split_at < 0:
+        return line.upper(), {}, ''
+
+    head, value = line[:split_at], line[split_at + 1:]
+    name, *raw_params = head.split(';')
+    params = {}
+    for raw_param in raw_params:
+        key, _, param_value = raw_param.partition('=')
+        params[key.upper()] = param_value.strip('"')
+    return name.upper(), params, value
+
+
+def unescape_text(value: str) -> str:
+    """還原 TEXT 值的跳脫字元"""
+    return (value.replace('\\n', '\n').replace('\\N', '\n')
+            .replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\'))
+
+
+def _resolve_timezone(tzid: Optional[str]):
+    if not tzid:
+        return None
+    tzid = _WINDOWS_TIMEZONES.get(tzid, tzid)
+    try:
+        return ZoneInfo(tzid)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def parse_datetime(value: str, params: Dict) -> Optional[datetime]:
+    """解析 DTSTART / DTEND 值，統一轉為本地時區
+
+    Args:
+        value: 例如 "20240115T150000Z"、"20240115T150000"、"20240115"
+        params: 屬性參數（TZID、VALUE）
+
+    Returns:
+        Optional[datetime]: 解析後的時間（無法解析時回傳 None）
+    """
+    value = value.strip()
+    local_tz = ZoneInfo(LOCAL_TIMEZONE)
+
+    try:
+        if params.get('VALUE') == 'DATE' or re.fullmatch(r'\d{8}', value):
+            day = datetime.strptime(value[:8], '%Y%m%d').date()
+            return datetime(day.year, day.month, day.day, tzinfo=local_tz)
+
+        if value.endswith('Z'):
+            parsed = datetime.strptime(value[:-1], '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc)
+        else:
+            parsed = datetime.strptime(value[:15], '%Y%m%dT%H%M%S')
+            tz = _resolve_timezone(params.get('TZID'))
+            # 浮動時間（沒有 TZID）視為本地時間
+            parsed = parsed.replace(tzinfo=tz or local_tz)
+    except ValueError:
+        return None
+
+    return parsed.astimezone(local_tz)
+
+
+def parse_duration(value: str) -> Optional[timedelta]:
+    """解析 DURATION 值（例如 PT1H30M）"""
+    match = _DURATION.match(value.strip())
+    if not match:
+        return None
+    parts = {k: int(v) for k, v in match.groupdict().items() if v and k != 'sign'}
+    duration = timedelta(**parts)
+    return -duration if match.group('sign') == '-' else duration
+
+
+# ===== VEVENT =====
+
+def parse_ics_events(ics_text: str) -> List[Dict]:
+    """解析 iCalendar 文字中的所有 VEVENT
+
+    取消的邀請（METHOD:CANCEL 或 STATUS:CANCELLED）會被略過。
+    全天事件（VALUE=DATE）的 start_time / end_time 為本地午夜，all_day 為 True，end_time 不含當天（與 DTEND 相同）；
+    重複事件的 RRULE / RDATE / EXDATE 行原樣放在 recurrence，由 Calendar API 展開（start_time 為第一次發生的時間）
+
+    Args:
+        ics_text: text/calendar 內容
+
+    Returns:
+        List[Dict]: [{uid, title, start_time, end_time, location, description, all_day, recurrence}, ...]
+    """
+    events = []
+    method = ''
+    current = None
+
+    for line in unfold_lines(ics_text):
+        name, params, value = parse_property(line)
+
+        if name == 'METHOD':
+            method = value.strip().upper()
+        elif name == 'BEGIN' and value.upper() == 'VEVENT':
+            current = {}
+        elif name == 'END' and value.upper() == 'VEVENT':
+            if current is not None:
+                events.append(current)
+            current = None
+        elif current is not None and name in _RECURRENCE_PROPERTIES:
+            # 重複規則可能有多行（多個 EXDATE），整行保留
+            current.setdefault('RECURRENCE', []).append(line)
+        elif current is not None and name not in current:
+            # 同名屬性只取第一個（例如多個 DESCRIPTION 語系）
+            current[name] = (params, value)
+
+    if method == 'CANCEL':
+        return []
+
+    parsed_events = []
+    for props in events:
+        if props.get('STATUS', ({}, ''))[1].upper() == 'CANCELLED' or 'DTSTART' not in props:
+            continue
+
+        start_params, start_value = props['DTSTART']
+        start_time = parse_datetime(start_value, start_params)
+        if start_time is None:
+            continue
+        all_day = start_params.get('VALUE') == 'DATE' or len(start_value.strip()) == 8
+
+        end_time = None
+        if 'DTEND' in props:
+            end_time = parse_datetime(props['DTEND'][1], props['DTEND'][0])
+        elif 'DURATION' in props:
+            duration = parse_duration(props['DURATION'][1])
+            end_time = start_time + duration if duration else None
+        if end_time is None or end_time < start_time:
+            end_time = start_time + (timedelta(days=1) if all_day else timedelta(hours=1))
+
+        location = unescape_text(props['LOCATION'][1]).strip() if 'LOCATION' in props else None
+
+        parsed_events.append({
+            'uid': props.get('UID', ({}, ''))[1].strip() or None,
+            'title': unescape_text(props.get('SUMMARY', ({}, ''))[1]).strip() or '未命名事件',
+            'start_time': start_time,
+            'end_time': end_time,
+            'location': location or None,
+            'description': unescape_text(props['DESCRIPTION'][1]).strip() if 'DESCRIPTION' in props else None,
+            'all_day': all_day,
+            'recurrence': props.get('RECURRENCE'),
+        })
+
+    return parsed_events
+
+
+def is_cancellation(email: Dict) -> bool:
+    """郵件中的日曆邀請是否為取消通知（METHOD:CANCEL 或 STATUS:CANCELLED）"""
+    for ics_text in email.get('ics', []):
+        for line in unfold_lines(ics_text):
+            name, _, value = parse_property(line)
+            if (name, value.strip().upper()) in (('METHOD', 'CANCEL'), ('STATUS', 'CANCELLED')):
+                return True
+    return False
+
+
+def events_from_email(email: Dict) -> List[Dict]:
+    """將郵件中的 text/calendar 部分轉換為 DetectedEvent 格式
+
+    Args:
+        email: 郵件 dict（需包含 ics: list[str]）
+
+    Returns:
+        List[Dict]: DetectedEvent 格式的事件列表（confidence 1.0，另含 all_day 與 recurrence）
+    """
+    detected = []
+    seen = set()
+
+    for ics_text in email.get('ics', []):
+        for event in parse_ics_events(ics_text):
+            # 同一邀請常同時以內嵌與附件形式出現
+            key = (event['uid'], event['start_time'])
+            if key in seen:
+                continue
+            seen.add(key)
+
+            detected.append({
+                'id': f"{email['id']}_event_{len(detected) + 1}",
+                'email_id': email['id'],
+                'title': event['title'],
+                'start_time': event['start_time'],
+                'end_time': event['end_time'],
+                'location': event['location'],
+                'description': event['description'],
+                'confidence': 1.0,
+                'all_day': event['all_day'],
+                'recurrence': event['recurrence'],
+            })
+
+    return detected
@@ -0,0 +1,257 @@
+"""
+工作流 Job Queue
+API 服務只負責寫入 job，由獨立的 worker 行程（worker.py）領取並執行工作流：
+    - 以 lease 標記執行中的 job，worker 定期 heartbeat 延長；worker 中斷時 lease 到期即可由其他 worker 接手
+    - 同一個 run 的 job 依寫入順序執行（首次執行 → 各次恢復），不同 run 可由多個 worker 平行處理
+    - worker 將節點進度寫入 job_events，API 服務據此更新 /runs 狀態
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+JOB_QUEUE_DB_PATH = os.getenv('JOB_QUEUE_DB_PATH', 'jobs.db')
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+LEASE_SECONDS = 60.0          # 沒有 heartbeat 超過此時間，視為 worker 中斷
+HEARTBEAT_INTERVAL = 15.0
+EVENT_RETENTION_SECONDS = 86400.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_until REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_run ON jobs (run_id, id);
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+_local = threading.local()
+
+
+# ===== 資料庫 =====
+
+def _connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """取得目前執行緒的連線（每個執行緒各自一個連線）"""
+    db_path = db_path or JOB_QUEUE_DB_PATH
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        connections[db_path] = conn
+    return conn
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job['payload'] = json.loads(job['payload'])
+    return job
+
+
+# ===== 寫入（API 服務） =====
+
+def enqueue_job(kind: str, run_id: str, payload: Dict, db_path: Optional[str] = None) -> int:
+    """寫入一個待執行的 job
+
+    Args:
+        kind: 'run'（首次執行）或 'resume'（確認後恢復）
+        run_id: 執行 ID（LangGraph thread ID）
+        payload: JSON 可序列化的參數
+        db_path: job queue 資料庫路徑
+
+    Returns:
+        int: job ID
+    """
+    cursor = _connect(db_path).execute(
+        'INSERT INTO jobs (kind, run_id, payload, created_at) VALUES (?, ?, ?, ?)',
+        (kind, run_id, json.dumps(payload, ensure_ascii=False), time.time())
+    )
+    return cursor.lastrowid
+
+
+def cancel_jobs(run_id: str, db_path: Optional[str] = None) -> int:
+    """取消 run 的 job：排隊中的直接取消，執行中的由 worker 在下一個節點前中止
+
+    Returns:
+        int: 受影響的 job 數量
+    """
+    conn = _connect(db_path)
+    now = time.time()
+    queued = conn.execute(
+        "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE run_id = ? AND status = 'queued'",
+        (now, run_id)
+    ).rowcount
+    running = conn.execute(
+        "UPDATE jobs SET cancel_requested = 1 WHERE run_id = ? AND status = 'running'",
+        (run_id,)
+    ).rowcount
+    return queued + running
+
+
+# ===== 領取與執行（worker） =====
+
+def claim_job(worker_id: str, db_path: Optional[str] = None) -> Optional[Dict]:
+    """領取下一個可執行的 job
+
+    可執行：狀態為 queued，或 running 但 lease 已到期（worker 中斷）；
+    且同一個 run 沒有更早、尚未完成的 job
+
+    Returns:
+        Optional[Dict]: job（payload 已解析），沒有可執行的 job 時回傳 None
+    """
+    conn = _connect(db_path)
+    now = time.time()
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # lease 到期且已達重試上限的 job 標記為失敗，並寫入 finish 事件
+        # （API 服務據此更新 /runs 狀態並釋放觸發範圍；worker 已中斷，不會自己寫入）
+        expired = conn.execute(
+            "SELECT id, run_id FROM jobs WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+            (now, JOB_MAX_ATTEMPTS)
+        ).fetchall()
+        for job in expired:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, lease_until = NULL, "
+                "error = 'worker lease expired' WHERE id = ?",
+                (now, job['id'])
+            )
+            _insert_event(conn, job['run_id'], 'finish',
+                          {"status": "failed", "error": "worker lease expired", "at": now})
+        row = conn.execute(
+            """
+            SELECT j.* FROM jobs j
+            WHERE (j.status = 'queued' OR (j.status = 'running' AND j.lease_until < ?))
+              AND NOT EXISTS (
+                  SELECT 1 FROM jobs prev
+                  WHERE prev.run_id = j.run_id AND prev.id < j.id
+                    AND prev.status IN ('queued', 'running')
+              )
+            ORDER BY j.id
+            LIMIT 1
+            """,
+            (now,)
+        ).fetchone()
+
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?, attempts = attempts + 1, "
+            "started_at = COALESCE(started_at, ?) WHERE id = ?",
+            (worker_id, now + LEASE_SECONDS, now, row['id'])
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    job = _row_to_job(row)
+    job['attempts'] += 1
+    return job
+
+
+def heartbeat(job_id: int, worker_id: str, db_path: Optional[str] = None) -> bool:
+    """延長 lease
+
+    Returns:
+        bool: 是否已要求取消（或 job 已被其他 worker 接手）
+    """
+    conn = _connect(db_path)
+    conn.execute(
+        "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+        (time.time() + LEASE_SECONDS, job_id, worker_id)
+    )
+    row = conn.execute('SELECT worker_id, status, cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return row is None or bool(row['cancel_requested']) or row['worker_id'] != worker_id or row['status'] != 'running'
+
+
+def finish_job(job_id: int, status: str, error: Optional[str] = None, db_path: Optional[str] = None) -> None:
+    """標記 job 結束（done / failed / cancelled）"""
+    _connect(db_path).execute(
+        'UPDATE jobs SET status = ?, finished_at = ?, lease_until = NULL, error = ? WHERE id = ?',
+        (status, time.time(), error[:1000] if error else None, job_id)
+    )
+
+
+# ===== 進度事件 =====
+
+def add_event(run_id: str, event: str, data: Dict, db_path: Optional[str] = None) -> None:
+    """記錄 run 的進度事件（start / node_start / node_end / finish）"""
+    _insert_event(_connect(db_path), run_id, event, data)
+
+
+def _insert_event(conn: sqlite3.Connection, run_id: str, event: str, data: Dict) -> None:
+    conn.execute(
+        'INSERT INTO job_events (run_id, event, data, created_at) VALUES (?, ?, ?, ?)',
+        (run_id, event, json.dumps(data, ensure_ascii=False, default=str), time.time())
+    )
+
+
+def read_events(after_id: int = 0, limit: int = 500, db_path: Optional[str] = None) -> List[Dict]:
+    """讀取 after_id 之後的進度事件"""
+    rows = _connect(db_path).execute(
+        'SELECT * FROM job_events WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit)
+    ).fetchall()
+    return [{**dict(row), 'data': json.loads(row['data'])} for row in rows]
+
+
+def last_event_id(db_path: Optional[str] = None) -> int:
+    return _connect(db_path).execute('SELECT COALESCE(MAX(id), 0) FROM job_events').fetchone()[0]
+
+
+def finish_recorded(run_id: str, after_id: int = 0, db_path: Optional[str] = None) -> bool:
+    """after_id 之後是否已記錄 run 的 finish 事件"""
+    row = _connect(db_path).execute(
+        "SELECT 1 FROM job_events WHERE id > ? AND run_id = ? AND event = 'finish' LIMIT 1", (after_id, run_id)
+    ).fetchone()
+    return row is not None
+
+
+def prune(db_path: Optional[str] = None, older_than: float = EVENT_RETENTION_SECONDS) -> None:
+    """刪除過期的進度事件與已結束的 job"""
+    cutoff = time.time() - older_than
+    conn = _connect(db_path)
+    conn.execute('DELETE FROM job_events WHERE created_at < ?', (cutoff,))
+    conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?", (cutoff,))
+
+
+# ===== 統計 =====
+
+def stats(db_path: Optional[str] = None) -> Dict:
+    """各狀態的 job 數量與活躍的 worker"""
+    conn = _connect(db_path)
+    counts = {status: count for status, count in conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')}
+    workers = [
+        row[0] for row in conn.execute(
+            "SELECT DISTINCT worker_id FROM jobs WHERE status = 'running' AND lease_until >= ?", (time.time(),)
+        )
+    ]
+    return {"jobs": counts, "queued": counts.get('queued', 0), "busy_workers": workers}
@@ -0,0 +1,292 @@
+"""
+Prometheus 指標
+輕量的行程內指標（counter / gauge / histogram），由各服務的 hook 更新，
+API 服務的 /metrics 以 Prometheus 文字格式輸出：
+    - 各 graph 節點耗時
+    - Gmail / Calendar / Slack / OpenAI 呼叫次數、延遲與錯誤
+    - 每次執行處理的郵件數、佇列深度、checkpoint 寫入大小
+
+worker 行程（worker.py）設定 METRICS_MULTIPROC_DIR 時會定期把指標寫到該目錄，
+API 服務輸出時合併所有行程的 counter 與 histogram；已結束行程的檔案併入 metrics-dead.json 後刪除
+"""
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+FLUSH_INTERVAL = 5.0
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# 名稱: (類型, 說明, buckets)
+METRICS = {
+    'email_summary_node_duration_seconds': ('histogram', 'Graph node execution time', DURATION_BUCKETS),
+    'email_summary_runs_total': ('counter', 'Workflow runs by final status', None),
+    'email_summary_run_emails': ('histogram', 'Emails fetched per run', COUNT_BUCKETS),
+    'email_summary_external_calls_total': ('counter', 'External API calls by service, operation and status', None),
+    'email_summary_external_call_duration_seconds': ('histogram', 'External API call latency', DURATION_BUCKETS),
+    'email_summary_checkpoint_write_bytes': ('histogram', 'Serialized checkpoint blob size', BYTES_BUCKETS),
+    'email_summary_checkpoint_written_bytes_total': ('counter', 'Total serialized checkpoint bytes', None),
+    'email_summary_checkpoint_write_seconds': ('histogram', 'Checkpoint write time', DURATION_BUCKETS),
+    'email_summary_checkpoint_db_bytes': ('gauge', 'Checkpoint database size on disk', None),
+    'email_summary_queue_depth': ('gauge', 'Queued items by queue', None),
+    'email_summary_runs_in_progress': ('gauge', 'Workflows currently executing', None),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_values: Dict[Tuple[str, LabelKey], float] = {}
+_histograms: Dict[Tuple[str, LabelKey], list] = {}  # [各 bucket 計數..., sum, count]
+_last_flush = 0.0
+
+_PROCESS_FILE = re.compile(r'^metrics-(\d+)\.json$')
+DEAD_PROCESSES_FILE = 'metrics-dead.json'
+
+
+def _key(name: str, labels: Optional[Dict[str, str]]) -> Tuple[str, LabelKey]:
+    if name not in METRICS:
+        raise KeyError(f'未定義的指標: {name}')
+    return name, tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+# ===== 記錄 =====
+
+def inc(name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0) -> None:
+    """counter 增加"""
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0.0) + value
+    _maybe_flush()
+
+
+def set_gauge(name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+    """設定 gauge（只在目前行程有效）"""
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = float(value)
+
+
+def observe(name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+    """histogram 記錄一個觀測值"""
+    key = _key(name, labels)
+    buckets = METRICS[name][2]
+    with _lock:
+        state = _histograms.get(key)
+        if state is None:
+            state = _histograms[key] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += value
+        state[-1] += 1
+    _maybe_flush()
+
+
+@contextmanager
+def track_call(service: str, operation: str):
+    """記錄外部 API 呼叫的次數、延遲與成功 / 失敗，並在目前的 trace 中建立 span
+
+    用法：
+        with track_call('gmail', 'messages.get') as call:
+            message = service.users().messages().get(...).execute()
+            call.set('bytes', message.get('sizeEstimate'))
+    """
+    from services.tracing import span
+
+    start = time.perf_counter()
+    status = 'ok'
+    with span(f'{service}.{operation}', kind='client', service=service, operation=operation) as call_span:
+        try:
+            yield call_span
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            labels = {'service': service, 'operation': operation}
+            observe('email_summary_external_call_duration_seconds', time.perf_counter() - start, labels)
+            inc('email_summary_external_calls_total', {**labels, 'status': status})
+
+
+# ===== 多行程 =====
+
+def _snapshot() -> Dict:
+    with _lock:
+        return {
+            'values': [[name, list(labels), value] for (name, labels), value in _values.items()
+                       if METRICS[name][0] == 'counter'],
+            'histograms': [[name, list(labels), list(state)] for (name, labels), state in _histograms.items()],
+        }
+
+
+def flush() -> None:
+    """將目前行程的 counter / histogram 寫到 METRICS_MULTIPROC_DIR（未設定時不做任何事）"""
+    global _last_flush
+    if not METRICS_MULTIPROC_DIR:
+        return
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    path = os.path.join(METRICS_MULTIPROC_DIR, f'metrics-{os.getpid()}.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp_path, path)
+    _last_flush = time.time()
+
+
+def _maybe_flush():
+    if METRICS_MULTIPROC_DIR and time.time() - _last_flush > FLUSH_INTERVAL:
+        try:
+            flush()
+        except OSError as e:
+            print(f"寫入指標失敗: {e}")
+
+
+def _read_snapshot(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(values: Dict, histograms: Dict, snapshot: Dict) -> None:
+    """將一個行程的 snapshot 加總到 values / histograms"""
+    for name, labels, value in snapshot.get('values', []):
+        if name in METRICS:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            values[key] = values.get(key, 0.0) + value
+    for name, labels, state in snapshot.get('histograms', []):
+        if name in METRICS:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            current = histograms.get(key)
+            histograms[key] = state if current is None else [a + b for a, b in zip(current, state)]
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def mark_process_dead(pid: int) -> None:
+    """將已結束行程的 counter / histogram 併入 metrics-dead.json，並刪除該行程的檔案
+
+    與 prometheus_client 的 mark_process_dead 相同用途：counter 不會因 worker 行程結束而倒退，
+    目錄中的檔案數也不會隨著重啟的 worker 無限增加。只應由 API 服務呼叫（單一寫入者）
+
+    Args:
+        pid: 已結束的行程 ID
+    """
+    path = os.path.join(METRICS_MULTIPROC_DIR, f'metrics-{pid}.json')
+    snapshot = _read_snapshot(path)
+    if snapshot is not None:
+        dead_path = os.path.join(METRICS_MULTIPROC_DIR, DEAD_PROCESSES_FILE)
+        values, histograms = {}, {}
+        _merge(values, histograms, _read_snapshot(dead_path) or {})
+        _merge(values, histograms, snapshot)
+        tmp_path = f'{dead_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'values': [[name, list(labels), value] for (name, labels), value in values.items()],
+                'histograms': [[name, list(labels), state] for (name, labels), state in histograms.items()],
+            }, f)
+        os.replace(tmp_path, dead_path)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def cleanup_dead_processes() -> int:
+    """處理 METRICS_MULTIPROC_DIR 中已結束行程留下的檔案（API 服務啟動時與每次輸出前呼叫）
+
+    以 PID 判斷行程是否存在，因此 worker 需與 API 服務在同一台主機上
+
+    Returns:
+        int: 處理的檔案數
+    """
+    if not METRICS_MULTIPROC_DIR or not os.path.isdir(METRICS_MULTIPROC_DIR):
+        return 0
+
+    cleaned = 0
+    for filename in os.listdir(METRICS_MULTIPROC_DIR):
+        match = _PROCESS_FILE.match(filename)
+        if not match or int(match.group(1)) == os.getpid() or _process_alive(int(match.group(1))):
+            continue
+        try:
+            mark_process_dead(int(match.group(1)))
+            cleaned += 1
+        except OSError as e:
+            print(f"清理已結束行程的指標失敗（{filename}）: {e}")
+    return cleaned
+
+
+def _collect() -> Tuple[Dict, Dict]:
+    """目前行程的指標 + 其他行程（含已結束的行程）寫入的 counter / histogram"""
+    with _lock:
+        values = dict(_values)
+        histograms = {key: list(state) for key, state in _histograms.items()}
+
+    if not METRICS_MULTIPROC_DIR or not os.path.isdir(METRICS_MULTIPROC_DIR):
+        return values, histograms
+
+    cleanup_dead_processes()
+    own = f'metrics-{os.getpid()}.json'
+    for filename in os.listdir(METRICS_MULTIPROC_DIR):
+        if not filename.endswith('.json') or filename == own:
+            continue
+        snapshot = _read_snapshot(os.path.join(METRICS_MULTIPROC_DIR, filename))
+        if snapshot is not None:
+            _merge(values, histograms, snapshot)
+    return values, histograms
+
+
+# ===== 輸出 =====
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = [f'{k}="{_escape(str(v))}"' for k, v in labels]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """Prometheus 文字格式（text/plain; version=0.0.4）"""
+    values, histograms = _collect()
+    lines = []
+
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+        if kind == 'histogram':
+            for (metric, labels), state in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(buckets, state):
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", _format_number(bound)),))} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {state[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(state[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {state[-1]}')
+        else:
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+
+    return '\n'.join(lines) + '\n'
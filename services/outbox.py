@@ -0,0 +1,324 @@
+"""
+持久化通知 Outbox
+將 Slack / Calendar 等外部副作用寫入本地 SQLite，由背景 worker 依序送出並重試：
+    - graph 只負責寫入 outbox，不再被外部 API 延遲阻塞
+    - 失敗時以指數退避重試，超過上限才標記為 dead（不會默默遺失）
+    - 同一個 stream 內嚴格依寫入順序送出（前一筆未成功，後面的不會超車）
+    - FastAPI 服務在 event loop 上執行 worker（run_async_worker）：Slack 項目以非同步用戶端送出，
+      不同 stream 的項目並行送出，不佔用執行緒
+    - CLI 在執行 graph 期間以背景執行緒執行 worker（run_worker），結束前再 drain 一次
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, date
+from typing import Awaitable, Callable, Dict, List, Optional
+
+OUTBOX_DB_PATH = os.getenv('OUTBOX_DB_PATH', 'outbox.db')
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '10'))
+BASE_RETRY_DELAY = 5.0       # 第一次重試等待秒數
+MAX_RETRY_DELAY = 600.0      # 重試等待上限
+LEASE_SECONDS = 120.0        # 送出中的項目超過此時間未完成，視為 worker 中斷，可重新領取
+POLL_INTERVAL = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    stream TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_stream_status ON outbox (stream, status, id);
+"""
+
+_handlers: Dict[str, Callable[[Dict], None]] = {}
+_async_handlers: Dict[str, Callable[[Dict], Awaitable[None]]] = {}
+_local = threading.local()
+_wake = threading.Event()
+
+
+# ===== 資料庫 =====
+
+def _connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """取得目前執行緒的連線（每個執行緒各自一個連線）"""
+    db_path = db_path or OUTBOX_DB_PATH
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        connections[db_path] = conn
+    return conn
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'無法序列化 {type(value).__name__}')
+
+
+# ===== 寫入 =====
+
+def enqueue(kind: str, payload: Dict, stream: Optional[str] = None, db_path: Optional[str] = None) -> int:
+    """寫入一筆待送出的副作用
+
+    Args:
+        kind: 處理器名稱（例如 'slack_report'）
+        payload: JSON 可序列化的內容（datetime 會轉成 ISO 字串）
+        stream: 順序保證的範圍，同一 stream 依序送出（預設為 kind）
+        db_path: outbox 資料庫路徑
+
+    Returns:
+        int: outbox 項目 ID
+    """
+    now = time.time()
+    cursor = _connect(db_path).execute(
+        'INSERT INTO outbox (kind, stream, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)',
+        (kind, stream or kind, json.dumps(payload, ensure_ascii=False, default=_json_default), now, now)
+    )
+    _wake.set()
+    return cursor.lastrowid
+
+
+def register_handler(kind: str, handler: Callable[[Dict], None]) -> None:
+    """註冊處理器：handler(payload) 失敗時拋出例外即會重試"""
+    _handlers[kind] = handler
+
+
+def register_async_handler(kind: str, handler: Callable[[Dict], Awaitable[None]]) -> None:
+    """註冊非同步處理器（run_async_worker / adrain 使用；沒有非同步處理器的項目在執行緒中以同步處理器送出）"""
+    _async_handlers[kind] = handler
+
+
+# ===== 送出 =====
+
+def _claim_next(conn: sqlite3.Connection) -> List[sqlite3.Row]:
+    """領取每個 stream 最前面、已到期的一筆（以 lease 標記，避免多個 worker 重複送出）"""
+    now = time.time()
+    heads = conn.execute(
+        """
+        SELECT o.* FROM outbox o
+        JOIN (
+            SELECT stream, MIN(id) AS id FROM outbox
+            WHERE status IN ('pending', 'sending')
+            GROUP BY stream
+        ) head ON head.id = o.id
+        WHERE o.next_attempt_at <= ?
+          AND (o.status = 'pending' OR o.lease_until < ?)
+        ORDER BY o.id
+        """,
+        (now, now)
+    ).fetchall()
+
+    claimed = []
+    for row in heads:
+        updated = conn.execute(
+            "UPDATE outbox SET status = 'sending', lease_until = ? "
+            "WHERE id = ? AND (status = 'pending' OR lease_until < ?)",
+            (now + LEASE_SECONDS, row['id'], now)
+        ).rowcount
+        if updated:
+            claimed.append(row)
+    return claimed
+
+
+def _run_handler(row: sqlite3.Row) -> None:
+    handler = _handlers.get(row['kind'])
+    if handler is None:
+        raise RuntimeError(f"沒有註冊 {row['kind']} 的處理器")
+    handler(json.loads(row['payload']))
+
+
+def _finish(conn: sqlite3.Connection, row: sqlite3.Row, error: Optional[Exception]) -> bool:
+    """記錄送出結果：成功標記 sent；失敗時退避後重試，超過上限標記 dead"""
+    attempts = row['attempts'] + 1
+
+    if error is not None:
+        if attempts >= MAX_ATTEMPTS:
+            status, next_attempt = 'dead', time.time()
+            print(f"✗ Outbox #{row['id']} ({row['kind']}) 重試 {attempts} 次後放棄: {error}")
+        else:
+            status = 'pending'
+            next_attempt = time.time() + min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2 ** (attempts - 1))
+            print(f"Outbox #{row['id']} ({row['kind']}) 第 {attempts} 次送出失敗，稍後重試: {error}")
+        conn.execute(
+            'UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, lease_until = NULL, last_error = ? '
+            'WHERE id = ?',
+            (status, attempts, next_attempt, str(error)[:1000], row['id'])
+        )
+        return False
+
+    conn.execute(
+        "UPDATE outbox SET status = 'sent', attempts = ?, sent_at = ?, lease_until = NULL, last_error = NULL "
+        "WHERE id = ?",
+        (attempts, time.time(), row['id'])
+    )
+    return True
+
+
+def _process(conn: sqlite3.Connection, row: sqlite3.Row) -> bool:
+    try:
+        _run_handler(row)
+    except Exception as e:
+        return _finish(conn, row, e)
+    return _finish(conn, row, None)
+
+
+def drain(db_path: Optional[str] = None, timeout: Optional[float] = None) -> Dict[str, int]:
+    """送出所有已到期的項目
+
+    Args:
+        db_path: outbox 資料庫路徑
+        timeout: 若指定，持續等待重試直到 outbox 清空或逾時（CLI 結束前使用）
+
+    Returns:
+        Dict[str, int]: {"sent": n, "failed": n}
+    """
+    _register_default_handlers()
+    conn = _connect(db_path)
+    deadline = time.time() + timeout if timeout else None
+    result = {'sent': 0, 'failed': 0}
+
+    while True:
+        rows = _claim_next(conn)
+        for row in rows:
+            result['sent' if _process(conn, row) else 'failed'] += 1
+
+        if rows:
+            continue
+        if deadline is None or time.time() >= deadline or pending_count(db_path) == 0:
+            return result
+        time.sleep(POLL_INTERVAL)
+
+
+def run_worker(stop: threading.Event, db_path: Optional[str] = None) -> None:
+    """在目前的執行緒持續送出 outbox，直到 stop 被設定（CLI 執行 graph 期間的背景執行緒）
+
+    寫入新項目時立即喚醒，優先提醒等項目不必等到 graph 結束才送出
+    """
+    while not stop.is_set():
+        _wake.clear()
+        try:
+            drain(db_path)
+        except Exception as e:
+            print(f"Outbox worker 錯誤: {e}")
+        _wake.wait(POLL_INTERVAL)
+
+
+def pending_count(db_path: Optional[str] = None) -> int:
+    """尚未送出的項目數量"""
+    return _connect(db_path).execute(
+        "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')"
+    ).fetchone()[0]
+
+
+def stats(db_path: Optional[str] = None) -> Dict[str, int]:
+    """各狀態的項目數量"""
+    rows = _connect(db_path).execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall()
+    return {status: count for status, count in rows}
+
+
+# ===== 背景 worker（FastAPI 服務的 event loop）=====
+
+async def _aprocess(row: sqlite3.Row, db_path: Optional[str]) -> bool:
+    error = None
+    try:
+        handler = _async_handlers.get(row['kind'])
+        if handler is not None:
+            await handler(json.loads(row['payload']))
+        else:
+            await asyncio.to_thread(_run_handler, row)
+    except Exception as e:
+        error = e
+    return await asyncio.to_thread(lambda: _finish(_connect(db_path), row, error))
+
+
+async def adrain(db_path: Optional[str] = None) -> Dict[str, int]:
+    """非同步送出所有已到期的項目：每個 stream 的最前一筆並行送出（同一 stream 仍依序）
+
+    Returns:
+        Dict[str, int]: {"sent": n, "failed": n}
+    """
+    _register_default_handlers()
+    result = {'sent': 0, 'failed': 0}
+
+    while True:
+        rows = await asyncio.to_thread(lambda: _claim_next(_connect(db_path)))
+        if not rows:
+            return result
+        for ok in await asyncio.gather(*(_aprocess(row, db_path) for row in rows)):
+            result['sent' if ok else 'failed'] += 1
+
+
+async def run_async_worker(db_path: Optional[str] = None) -> None:
+    """在目前的 event loop 上持續送出 outbox（取消 task 即停止）"""
+    while True:
+        try:
+            await adrain(db_path)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Outbox worker 錯誤: {e}")
+        await asyncio.to_thread(_wake.wait, POLL_INTERVAL)
+        _wake.clear()
+
+
+# ===== 預設處理器 =====
+
+def _send_slack_report(payload: Dict) -> None:
+    from services.slack_service import deliver_slack_report
+    deliver_slack_report(payload['report'])
+
+
+def _send_slack_message(payload: Dict) -> None:
+    from services.slack_service import deliver_slack_message
+    deliver_slack_message(payload)
+
+
+def _call_slack_api(payload: Dict) -> None:
+    from services.slack_transport import get_slack_transport
+    get_slack_transport().api_call(payload['method'], **payload['args'])
+
+
+async def _asend_slack_message(payload: Dict) -> None:
+    from services.slack_service import adeliver_slack_message
+    await adeliver_slack_message(payload)
+
+
+async def _acall_slack_api(payload: Dict) -> None:
+    from services.slack_transport import get_async_slack_transport
+    await get_async_slack_transport().api_call(payload['method'], **payload['args'])
+
+
+def _create_calendar_events(payload: Dict) -> None:
+    from services.calendar_service import create_calendar_events_batch
+    results = create_calendar_events_batch(payload['events'])
+    failed = [event_id for event_id, result in results.items() if result['status'] == 'failed']
+    if failed:
+        # 固定的事件 ID 讓整批重送也不會重複建立
+        raise RuntimeError(f"{len(failed)} 個 Calendar 事件建立失敗: {', '.join(failed)}")
+
+
+def _register_default_handlers():
+    _handlers.setdefault('slack_report', _send_slack_report)
+    _handlers.setdefault('slack_message', _send_slack_message)
+    _handlers.setdefault('slack_api', _call_slack_api)
+    _handlers.setdefault('calendar_create', _create_calendar_events)
+    _async_handlers.setdefault('slack_message', _asend_slack_message)
+    _async_handlers.setdefault('slack_api', _acall_slack_api)
@@ -0,0 +1,189 @@
+"""
+Slack Block Kit 渲染
+單次掃描將 Markdown 報告轉為 Block Kit，並依 Slack 限制自動分頁：
+    - 每個 section 文字最多 3000 字元、header 最多 150 字元
+    - 每則訊息最多 50 個 blocks
+"""
+import re
+from typing import Dict, List
+
+MAX_BLOCKS_PER_MESSAGE = 50
+MAX_SECTION_CHARS = 3000
+MAX_HEADER_CHARS = 150
+# 每則訊息 blocks 的總文字量上限（保守值，避免整則訊息過大被拒）
+MAX_MESSAGE_CHARS = 12000
+
+_BOLD = re.compile(r'\*\*(.+?)\*\*')
+
+
+def escape_mrkdwn(text: str) -> str:
+    """跳脫 Slack mrkdwn 的控制字元（&、<、>）"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _inline(text: str) -> str:
+    """行內 Markdown → mrkdwn（**粗體** → *粗體*）"""
+    return _BOLD.sub(r'*\1*', escape_mrkdwn(text))
+
+
+def _section(text: str) -> Dict:
+    return {"type": "section", "text": {"type": "mrkdwn", "text": text}}
+
+
+def _header(text: str) -> Dict:
+    if len(text) > MAX_HEADER_CHARS:
+        text = text[:MAX_HEADER_CHARS - 1] + '…'
+    return {"type": "header", "text": {"type": "plain_text", "text": text, "emoji": True}}
+
+
+# 切段時不可切開的片段：HTML 實體、<連結|文字>、*粗體*
+_ATOMIC = re.compile(r'&(?:amp|lt|gt);|<[^<>\n]+>|\*[^*\n]+\*')
+_BREAK_AFTER = ' ，。、；,.;'
+
+
+def _split_long_line(line: str, limit: int = MAX_SECTION_CHARS) -> List[str]:
+    """單行超過上限時切成多段，不切開 &amp; 等實體、連結與 *粗體*
+
+    優先在空白或標點之後切開；找不到時才在實體 / 連結邊界硬切，
+    硬切點落在粗體內時兩段各自補上 *，讓兩段都仍是完整的粗體
+    """
+    pieces = []
+    while len(line) > limit:
+        atomic = [m for m in _ATOMIC.finditer(line) if m.start() < limit]
+
+        def _inside(pos: int) -> bool:
+            return any(m.start() < pos < m.end() for m in atomic)
+
+        cut = next((pos for pos in range(limit, limit // 2, -1)
+                    if line[pos - 1] in _BREAK_AFTER and not _inside(pos)), None)
+        if cut is None:
+            cut = limit - 1  # 保留補上 * 的空間
+            for m in atomic:
+                if m.group()[0] != '*' and m.start() < cut < m.end() and m.start() > 0:
+                    cut = m.start()
+            bold = next((m for m in atomic if m.group()[0] == '*' and m.start() < cut < m.end()), None)
+            if bold and cut - bold.start() < 2 and bold.start() > 0:
+                cut, bold = bold.start(), None
+            if bold:
+                pieces.append(line[:cut] + '*')
+                line = '*' + line[cut:]
+                continue
+        pieces.append(line[:cut])
+        line = line[cut:]
+    pieces.append(line)
+    return pieces
+
+
+def render_report_blocks(markdown_text: str) -> List[Dict]:
+    """單次掃描將 Markdown 報告轉為 Block Kit blocks
+
+    - "# " → header
+    - "## " / "### " → divider + 粗體 section（與其後內容合併）
+    - 其餘行累積到同一個 section，超過 3000 字元時在行邊界切成新的 section
+
+    Args:
+        markdown_text: Markdown 格式的報告
+
+    Returns:
+        List[Dict]: Block Kit blocks
+    """
+    blocks = []
+    buffer = []
+    buffer_len = 0
+
+    def flush():
+        nonlocal buffer, buffer_len
+        text = '\n'.join(buffer).strip('\n')
+        if text.strip():
+            blocks.append(_section(text))
+        buffer, buffer_len = [], 0
+
+    for raw_line in markdown_text.split('\n'):
+        if raw_line.startswith('# '):
+            flush()
+            blocks.append(_header(raw_line[2:].strip()))
+            continue
+
+        if raw_line.startswith('## ') or raw_line.startswith('### '):
+            flush()
+            if blocks:
+                blocks.append({"type": "divider"})
+            line = f"*{_inline(raw_line.lstrip('#').strip())}*"
+        else:
+            line = _inline(raw_line)
+
+        for piece in _split_long_line(line):
+            if buffer_len + len(piece) + 1 > MAX_SECTION_CHARS:
+                flush()
+            buffer.append(piece)
+            buffer_len += len(piece) + 1
+
+    flush()
+    return blocks
+
+
+def _block_chars(block: Dict) -> int:
+    text = block.get('text')
+    return len(text.get('text', '')) if isinstance(text, dict) else 0
+
+
+def paginate_blocks(blocks: List[Dict], max_blocks: int = MAX_BLOCKS_PER_MESSAGE,
+                    max_chars: int = MAX_MESSAGE_CHARS) -> List[List[Dict]]:
+    """將 blocks 切成多則訊息（每則盡量裝滿，以減少 API 呼叫次數）
+
+    不會讓 divider 成為一頁的最後一個 block，也不會把 section 與其前面的 header 拆開
+
+    Args:
+        blocks: Block Kit blocks
+        max_blocks: 每則訊息的 block 上限
+        max_chars: 每則訊息的文字總量上限
+
+    Returns:
+        List[List[Dict]]: 每則訊息的 blocks
+    """
+    pages = []
+    current = []
+    current_chars = 0
+
+    for block in blocks:
+        chars = _block_chars(block)
+        if current and (len(current) + 1 > max_blocks or current_chars + chars > max_chars):
+            # 結尾的 header / divider 移到下一頁
+            carry = []
+            while current and current[-1]['type'] in ('header', 'divider'):
+                carry.insert(0, current.pop())
+            if current:
+                pages.append(current)
+            current = [b for b in carry if b['type'] != 'divider']
+            current_chars = sum(_block_chars(b) for b in current)
+        current.append(block)
+        current_chars += chars
+
+    if current:
+        pages.append(current)
+    return pages
+
+
+def render_report_messages(markdown_text: str) -> List[Dict]:
+    """將報告渲染為一或多則 Slack 訊息 payload（含分頁標示與 fallback text）
+
+    Args:
+        markdown_text: Markdown 格式的報告
+
+    Returns:
+        List[Dict]: [{"text": fallback, "blocks": [...]}, ...]
+    """
+    blocks = render_report_blocks(markdown_text)
+    # 保留一個 block 給分頁標示
+    pages = paginate_blocks(blocks, max_blocks=MAX_BLOCKS_PER_MESSAGE - 1)
+
+    title = next((line[2:].strip() for line in markdown_text.split('\n') if line.startswith('# ')), '郵件摘要')
+    messages = []
+    for i, page in enumerate(pages, 1):
+        if len(pages) > 1:
+            page = page + [{"type": "context", "elements": [{"type": "mrkdwn", "text": f"({i}/{len(pages)})"}]}]
+        messages.append({
+            "text": title if len(pages) == 1 else f"{title} ({i}/{len(pages)})",
+            "blocks": page,
+        })
+    return messages
@@ -1,46 +1,49 @@
 # Slack 通知服務
 # 處理 Slack Webhook 通知發送
 import os
-import requests
+import json
 from typing import Optional
 
+from services.slack_transport import get_slack_transport, get_async_slack_transport, SlackTransportError
+from services.slack_blocks import render_report_messages, escape_mrkdwn, MAX_BLOCKS_PER_MESSAGE
 
-def _convert_markdown_to_slack(markdown_text: str) -> str:
-    """將標準 Markdown 轉換為 Slack mrkdwn 格式
 
-    Args:
-        markdown_text: 標準 Markdown 文字
+# 報告、優先通知與事件確認請求共用的 outbox stream：依寫入順序送達
+# （確認按鈕不會早於其所屬的報告出現）
+NOTIFICATION_STREAM = 'slack:webhook'
 
-    Returns:
-        str: Slack mrkdwn 格式的文字
+
+def _get_webhook_url() -> str:
+    webhook_url = os.getenv('SLACK_WEBHOOK_URL')
+    if not webhook_url:
+        raise SlackTransportError("SLACK_WEBHOOK_URL 未設定")
+    return webhook_url
+
+def deliver_slack_message(message: dict) -> None:
+    """發送單則 Block Kit 訊息到 Slack Webhook（失敗時拋出例外，供 outbox 重試）
+
+    Args:
+        message: {"text": fallback, "blocks": [...]}
     """
-    # Slack mrkdwn 格式規則：
-    # - 標題 # 改為 *粗體*
-    # - **粗體** 改為 *粗體*
-    # - 列表保持不變
-
-    lines = markdown_text.split('\n')
-    converted_lines = []
-
-    for line in lines:
-        # 處理一級標題 (# )
-        if line.startswith('# '):
-            converted_lines.append(f"*{line[2:]}*")
-        # 處理二級標題 (## )
-        elif line.startswith('## '):
-            converted_lines.append(f"*{line[3:]}*")
-        # 處理三級標題 (### )
-        elif line.startswith('### '):
-            converted_lines.append(f"*{line[4:]}*")
-        else:
-            # 處理行內 **粗體** 轉換為 *粗體*
-            converted_line = line.replace('**', '*')
-            converted_lines.append(converted_line)
+    # 共用連線池，429 時依 Retry-After 重試
+    get_slack_transport().post_webhook(_get_webhook_url(), message)
 
-    return '\n'.join(converted_lines)
+async def adeliver_slack_message(message: dict) -> None:
+    """deliver_slack_message 的非同步版本（服務的 outbox worker 在 event loop 上使用）"""
+    await get_async_slack_transport().post_webhook(_get_webhook_url(), message)
+
+def deliver_slack_report(report: str) -> None:
+    """發送報告到 Slack Webhook（自動分頁為多則訊息，失敗時拋出例外）
+
+    Args:
+        report: Markdown 格式的報告內容
+    """
+    _get_webhook_url()
+    for message in render_report_messages(report):
+        deliver_slack_message(message)
 
 def send_slack_notification(report: str) -> bool:
-    """發送 Slack 通知
+    """發送 Slack 通知（同步）
 
     Args:
         report: Markdown 格式的報告內容
@@ -48,40 +51,213 @@ def send_slack_notification(report: str) -> bool:
     Returns:
         bool: 發送成功返回 True，失敗返回 False
     """
-    webhook_url = os.getenv('SLACK_WEBHOOK_URL')
+    try:
+        deliver_slack_report(report)
+        return True
 
-    if not webhook_url:
+    except SlackTransportError as e:
+        print(f"Slack 通知發送失敗: {e}")
         return False
 
-    # 將 Markdown 轉換為 Slack mrkdwn 格式
-    slack_text = _convert_markdown_to_slack(report)
+def queue_slack_notification(report: str) -> list[int]:
+    """將 Slack 通知寫入 outbox，由背景 worker 送出（失敗會自動重試）
 
-    # 構建 Slack 訊息
-    payload = {
-        "text": slack_text
-    }
+    報告先渲染為 Block Kit 並分頁，每一頁是一筆 outbox 項目：
+    同一個 stream 依序送出，重試時也不會重送已成功的頁面
 
+    Args:
+        report: Markdown 格式的報告內容
+
+    Returns:
+        list[int]: 每一頁的 outbox 項目 ID
+    """
+    from services.outbox import enqueue
+    return [
+        enqueue('slack_message', message, stream=NOTIFICATION_STREAM)
+        for message in render_report_messages(report)
+    ]
+
+# ===== 優先通知 =====
+
+PRIORITY_ALERT_SNIPPET_CHARS = 200
+
+def render_priority_alert(emails: list[dict]) -> dict:
+    """高重要性郵件的精簡通知（完整摘要稍後送出）
+
+    Args:
+        emails: 高重要性郵件
+
+    Returns:
+        dict: {"text": fallback, "blocks": [...]}
+    """
+    blocks = [{
+        "type": "header",
+        "text": {"type": "plain_text", "text": f"🚨 {len(emails)} 封重要郵件"}
+    }]
+    for email in emails[:MAX_BLOCKS_PER_MESSAGE - 2]:
+        snippet = (email.get('clean_snippet') or email.get('snippet') or '')[:PRIORITY_ALERT_SNIPPET_CHARS]
+        text = f"*{escape_mrkdwn(email.get('subject') or '無主旨')}*\n寄件者: {escape_mrkdwn(email.get('from') or '未知')}"
+        if email.get('date'):
+            text += f"\n日期: {email['date']}"
+        if snippet:
+            text += f"\n> {escape_mrkdwn(snippet)}"
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text[:3000]}})
+    blocks.append({
+        "type": "context",
+        "elements": [{"type": "mrkdwn", "text": "完整的每日摘要處理中，稍後送出"}]
+    })
+
+    return {"text": f"{len(emails)} 封重要郵件", "blocks": blocks}
+
+def queue_priority_alert(emails: list[dict]) -> Optional[int]:
+    """送出優先通知：寫入 outbox（與每日摘要同一個 stream，保證先於摘要送達）
+
+    OUTBOX_ENABLED=false 時同步發送，失敗只記錄不拋出
+
+    Returns:
+        Optional[int]: outbox 項目 ID（同步發送時為 None）
+    """
+    message = render_priority_alert(emails)
+
+    if os.getenv('OUTBOX_ENABLED', 'true').lower() != 'true':
+        try:
+            deliver_slack_message(message)
+        except SlackTransportError as e:
+            print(f"優先通知發送失敗: {e}")
+        return None
+
+    from services.outbox import enqueue
+    return enqueue('slack_message', message, stream=NOTIFICATION_STREAM)
+
+# 舊版按鈕沒有附帶 run ID，一律對應到這個固定的 thread
+LEGACY_THREAD_ID = "email-summary-run"
+
+def encode_action_value(run_id: str, event_id: str) -> str:
+    """按鈕 value：同時帶上 run（thread）ID 與事件 ID，讓回調能恢復正確的工作流"""
+    return json.dumps({"run": run_id, "event": event_id}, separators=(',', ':'))
+
+def decode_action_value(value: str) -> tuple[str, str]:
+    """解析按鈕 value，回傳 (run_id, event_id)；相容只有事件 ID 的舊格式"""
     try:
-        response = requests.post(
-            webhook_url,
-            json=payload,
-            timeout=10
-        )
+        data = json.loads(value)
+        return data['run'], data['event']
+    except (ValueError, TypeError, KeyError):
+        return LEGACY_THREAD_ID, value
 
-        # Slack Webhook 成功時返回 200
-        return response.status_code == 200
+def _event_blocks(event: dict, run_id: str) -> list[dict]:
+    """單一事件的 section + 確認 / 跳過按鈕"""
+    event_text = (
+        f"*{escape_mrkdwn(event['title'])}*\n時間: {event['start_time']} - {event['end_time']}\n"
+        f"地點: {escape_mrkdwn(event.get('location') or '無')}"
+    )
+    for conflict in event.get('conflicts', []):
+        event_text += f"\n⚠️ 時間衝突: {escape_mrkdwn(conflict['title'])}（{conflict['start_time']} - {conflict['end_time']}）"
 
-    except requests.exceptions.RequestException:
-        return False
+    return [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": event_text[:3000]
+            }
+        },
+        {
+            "type": "actions",
+            "block_id": f"event_{event['id']}",
+            "elements": [
+                {
+                    "type": "button",
+                    "text": {"type": "plain_text", "text": "確認加入"},
+                    "style": "primary",
+                    "value": encode_action_value(run_id, event['id']),
+                    "action_id": "confirm_event"
+                },
+                {
+                    "type": "button",
+                    "text": {"type": "plain_text", "text": "跳過"},
+                    "style": "danger",
+                    "value": encode_action_value(run_id, event['id']),
+                    "action_id": "skip_event"
+                }
+            ]
+        }
+    ]
+
+# 批次按鈕：套用到同一則訊息中所有尚未回應的事件
+BULK_ACTIONS_BLOCK_ID = "bulk_actions"
+ALL_EVENTS = "*"
+
+def _bulk_action_block(run_id: str) -> dict:
+    """「全部確認 / 全部跳過」按鈕"""
+    return {
+        "type": "actions",
+        "block_id": BULK_ACTIONS_BLOCK_ID,
+        "elements": [
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "全部確認"},
+                "style": "primary",
+                "value": encode_action_value(run_id, ALL_EVENTS),
+                "action_id": "confirm_all"
+            },
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "全部跳過"},
+                "value": encode_action_value(run_id, ALL_EVENTS),
+                "action_id": "skip_all"
+            }
+        ]
+    }
+
+def get_pending_event_ids(blocks: list[dict]) -> list[str]:
+    """訊息中仍有確認 / 跳過按鈕的事件 ID"""
+    return [
+        block['block_id'][len('event_'):]
+        for block in blocks
+        if block.get('type') == 'actions' and block.get('block_id', '').startswith('event_')
+    ]
+
+def apply_event_decisions(blocks: list[dict], decisions: dict[str, bool]) -> list[dict]:
+    """將已回應事件的按鈕換成狀態標示；全部回應後移除批次按鈕
+
+    Args:
+        blocks: 訊息目前的 blocks
+        decisions: {事件 ID: True（確認）/ False（跳過）}
+
+    Returns:
+        list[dict]: 更新後的 blocks
+    """
+    updated = []
+    for block in blocks:
+        block_id = block.get('block_id', '')
+        event_id = block_id[len('event_'):] if block_id.startswith('event_') else None
+        if event_id in decisions:
+            status = "✅ *已確認加入*" if decisions[event_id] else "⏭️ *已略過*"
+            updated.append({"type": "context", "elements": [{"type": "mrkdwn", "text": status}]})
+        else:
+            updated.append(block)
+
+    if not get_pending_event_ids(updated):
+        updated = [block for block in updated if block.get('block_id') != BULK_ACTIONS_BLOCK_ID]
+    return updated
+
+def render_event_confirmation_messages(events: list[dict], run_id: str = LEGACY_THREAD_ID) -> list[dict]:
+    """渲染事件確認請求（Slack 互動訊息）
 
-def send_event_confirmation_request(events: list[dict]) -> str:
-    """發送事件確認請求（Slack 互動訊息）"""
-    from slack_sdk import WebClient
+    事件超過單則訊息 50 個 blocks 的上限時自動分成多則訊息，
+    每則訊息裝滿為止，事件的說明與按鈕不會被拆開；
+    每則訊息結尾附「全部確認 / 全部跳過」按鈕
 
-    client = WebClient(token=os.getenv('SLACK_BOT_TOKEN'))
+    Args:
+        events: 待確認的事件
+        run_id: 工作流的 thread ID（放進按鈕 value，回調時用來恢復對應的工作流）
+
+    Returns:
+        list[dict]: 每則訊息的 chat.postMessage 參數 {"channel", "text", "blocks"}
+    """
     channel_id = os.getenv('SLACK_CHANNEL_ID')
 
-    blocks = [
+    pages = [[
         {
             "type": "header",
             "text": {
@@ -90,47 +266,52 @@ def send_event_confirmation_request(events: list[dict]) -> str:
             }
         },
         {"type": "divider"}
-    ]
+    ]]
 
+    # 保留一個 block 給批次按鈕
     for event in events:
-        blocks.extend([
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*{event['title']}*\n時間: {event['start_time']} - {event['end_time']}\n地點: {event.get('location', '無')}"
-                }
-            },
-            {
-                "type": "actions",
-                "block_id": f"event_{event['id']}",
-                "elements": [
-                    {
-                        "type": "button",
-                        "text": {"type": "plain_text", "text": "確認加入"},
-                        "style": "primary",
-                        "value": event['id'],
-                        "action_id": "confirm_event"
-                    },
-                    {
-                        "type": "button",
-                        "text": {"type": "plain_text", "text": "跳過"},
-                        "style": "danger",
-                        "value": event['id'],
-                        "action_id": "skip_event"
-                    }
-                ]
-            }
-        ])
+        blocks = _event_blocks(event, run_id)
+        if len(pages[-1]) + len(blocks) > MAX_BLOCKS_PER_MESSAGE - 1:
+            pages.append([])
+        pages[-1].extend(blocks)
+
+    for page in pages:
+        page.append(_bulk_action_block(run_id))
 
     # 準備 fallback text（用於通知預覽和可訪問性）
     event_titles = [event['title'] for event in events]
     fallback_text = f"檢測到 {len(events)} 個行程/事件：{', '.join(event_titles)}"
+    if len(fallback_text) > 3000:
+        fallback_text = fallback_text[:2999] + '…'
 
-    response = client.chat_postMessage(
-        channel=channel_id,
-        text=fallback_text,  # 添加 fallback text
-        blocks=blocks
-    )
+    return [
+        {
+            "channel": channel_id,
+            "text": fallback_text if len(pages) == 1 else f"{fallback_text} ({i}/{len(pages)})",
+            "blocks": blocks,
+        }
+        for i, blocks in enumerate(pages, 1)
+    ]
+
+def send_event_confirmation_request(events: list[dict], run_id: str = LEGACY_THREAD_ID) -> list[str]:
+    """發送事件確認請求（同步，OUTBOX_ENABLED=false 時使用）
 
-    return response['ts']  # message timestamp
\ No newline at end of file
+    Returns:
+        list[str]: 每則訊息的 timestamp
+    """
+    return [
+        get_slack_transport().api_call('chat.postMessage', **message)['ts']
+        for message in render_event_confirmation_messages(events, run_id)
+    ]
+
+def queue_event_confirmation_request(events: list[dict], run_id: str = LEGACY_THREAD_ID) -> list[int]:
+    """將事件確認請求寫入 outbox（與報告同一個 stream，在報告之後送達）
+
+    Returns:
+        list[int]: 每則訊息的 outbox 項目 ID
+    """
+    from services.outbox import enqueue
+    return [
+        enqueue('slack_api', {"method": "chat.postMessage", "args": message}, stream=NOTIFICATION_STREAM)
+        for message in render_event_confirmation_messages(events, run_id)
+    ]
@@ -0,0 +1,321 @@
+"""
+Slack 傳輸層
+共用連線池的 Slack Web API / Webhook 用戶端：
+    - 重用 HTTP 連線（requests.Session / httpx.AsyncClient）
+    - 429 時依 Retry-After 等待後重試；會產生訊息的請求（chat.postMessage、Webhook）不是冪等的，
+      只在 429 與連線失敗（請求未送達）時重試，5xx / 逾時不重試以免重複發送
+    - 依 Slack 方法分級（tier）節流，避免突發請求被限流或丟失
+"""
+import os
+import time
+import asyncio
+import random
+import threading
+import weakref
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.metrics import track_call
+from services.tracing import payload_size
+
+SLACK_API_URL = 'https://slack.com/api/'
+
+# Slack 速率限制（每秒請求數, 突發容量）
+# https://api.slack.com/docs/rate-limits
+TIER_LIMITS = {
+    1: (1 / 60, 1),
+    2: (20 / 60, 3),
+    3: (50 / 60, 5),
+    4: (100 / 60, 10),
+    'message': (1.0, 3),  # chat.postMessage：每個頻道約每秒 1 則
+    'webhook': (1.0, 3),  # Incoming Webhook：每秒 1 則
+}
+
+METHOD_TIERS = {
+    'chat.postMessage': 'message',
+    'chat.update': 3,
+    'chat.delete': 3,
+    'chat.getPermalink': 4,
+    'conversations.history': 3,
+    'conversations.info': 3,
+    'users.info': 4,
+    'auth.test': 4,
+}
+
+# 重送會重複產生訊息的方法（Webhook 同樣不是冪等的）
+NON_IDEMPOTENT_METHODS = {'chat.postMessage', 'chat.postEphemeral', 'chat.scheduleMessage', 'chat.meMessage'}
+
+DEFAULT_TIMEOUT = 10
+MAX_RETRIES = 3
+
+
+class SlackTransportError(Exception):
+    """Slack 請求失敗（HTTP 錯誤或 ok=false）"""
+
+    def __init__(self, message: str, error: Optional[str] = None, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.error = error
+        self.status_code = status_code
+
+
+class _TokenBucket:
+    """簡單的 token bucket：rate 為每秒補充數，burst 為容量"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """預約一個 token，回傳需要等待的秒數"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _Pacer:
+    """依 (tier, 頻道) 分別節流；429 時暫停該 tier 直到 Retry-After 結束"""
+
+    def __init__(self):
+        self._buckets: Dict[tuple, _TokenBucket] = {}
+        self._blocked_until: Dict[object, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tier_for(method: str):
+        return METHOD_TIERS.get(method, 3)
+
+    def reserve(self, tier, key: str = '') -> float:
+        with self._lock:
+            bucket = self._buckets.get((tier, key))
+            if bucket is None:
+                bucket = self._buckets[(tier, key)] = _TokenBucket(*TIER_LIMITS[tier])
+            wait = bucket.reserve()
+            blocked = self._blocked_until.get(tier, 0) - time.monotonic()
+            return max(wait, blocked)
+
+    def block(self, tier, seconds: float):
+        with self._lock:
+            self._blocked_until[tier] = max(self._blocked_until.get(tier, 0), time.monotonic() + seconds)
+
+
+def _retry_after(headers, attempt: int) -> float:
+    """429 時的等待秒數（優先使用 Retry-After，否則指數退避）"""
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return min(30.0, 2 ** attempt) + random.random()
+
+
+def _parse_api_response(method: str, status_code: int, data: Dict) -> Dict:
+    if not data.get('ok'):
+        raise SlackTransportError(f"Slack API {method} 失敗: {data.get('error')}",
+                                  error=data.get('error'), status_code=status_code)
+    return data
+
+
+# ===== 同步版本 =====
+
+class SlackTransport:
+    """同步 Slack 用戶端（執行緒安全，整個行程共用一個實例）"""
+
+    def __init__(self, token: Optional[str] = None, max_retries: int = MAX_RETRIES,
+                 timeout: float = DEFAULT_TIMEOUT, pool_size: int = 10):
+        self.token = token
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.pacer = _Pacer()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _send(self, tier, key: str, url: str, idempotent: bool = True, **kwargs) -> requests.Response:
+        """送出請求：節流、429 重試、連線錯誤與 5xx 退避重試
+
+        idempotent=False 時只在 429 與連線失敗時重試（5xx、讀取逾時時請求可能已被處理）
+        """
+        retry_errors = requests.exceptions.RequestException if idempotent else requests.exceptions.ConnectionError
+        for attempt in range(self.max_retries + 1):
+            wait = self.pacer.reserve(tier, key)
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                response = self.session.post(url, timeout=self.timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                if attempt >= self.max_retries or not isinstance(e, retry_errors):
+                    raise SlackTransportError(f"Slack 請求失敗: {e}") from e
+                time.sleep(min(10.0, 2 ** attempt))
+                continue
+
+            if response.status_code >= 500 and not idempotent:
+                raise SlackTransportError(f"Slack 請求失敗 (HTTP {response.status_code})，訊息可能已送出，不重送",
+                                          status_code=response.status_code)
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt >= self.max_retries:
+                    break
+                delay = _retry_after(response.headers, attempt)
+                if response.status_code == 429:
+                    print(f"Slack 限流 (429)，{delay:.1f} 秒後重試")
+                    self.pacer.block(tier, delay)
+                time.sleep(delay)
+                continue
+
+            return response
+
+        raise SlackTransportError(f"Slack 請求重試 {self.max_retries} 次後仍失敗 (HTTP {response.status_code})",
+                                  status_code=response.status_code)
+
+    def api_call(self, method: str, **payload) -> Dict:
+        """呼叫 Slack Web API（例如 chat.postMessage）
+
+        Args:
+            method: API 方法名稱
+            **payload: JSON 參數
+
+        Returns:
+            Dict: Slack 回應（ok=true）
+        """
+        token = self.token or os.getenv('SLACK_BOT_TOKEN')
+        with track_call('slack', method) as call:
+            call.set('request_bytes', payload_size(payload))
+            response = self._send(
+                self.pacer.tier_for(method),
+                payload.get('channel', ''),
+                SLACK_API_URL + method,
+                idempotent=method not in NON_IDEMPOTENT_METHODS,
+                json=payload,
+                headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json; charset=utf-8'},
+            )
+            return _parse_api_response(method, response.status_code, response.json())
+
+    def post_webhook(self, url: str, payload: Dict) -> None:
+        """發送 Incoming Webhook 訊息（失敗時拋出 SlackTransportError）"""
+        with track_call('slack', 'webhook') as call:
+            call.set('request_bytes', payload_size(payload))
+            response = self._send('webhook', url, url, idempotent=False, json=payload)
+            if response.status_code != 200:
+                raise SlackTransportError(f"Slack Webhook 失敗 (HTTP {response.status_code}): {response.text[:200]}",
+                                          status_code=response.status_code)
+
+
+# ===== 非同步版本 =====
+
+class AsyncSlackTransport:
+    """非同步 Slack 用戶端（httpx.AsyncClient 連線池）"""
+
+    def __init__(self, token: Optional[str] = None, max_retries: int = MAX_RETRIES,
+                 timeout: float = DEFAULT_TIMEOUT, pool_size: int = 10):
+        import httpx
+
+        self.token = token
+        self.max_retries = max_retries
+        self.pacer = _Pacer()
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def _send(self, tier, key: str, url: str, idempotent: bool = True, **kwargs):
+        """與 SlackTransport._send 相同的節流與重試規則"""
+        import httpx
+
+        retry_errors = httpx.HTTPError if idempotent else (httpx.ConnectError, httpx.ConnectTimeout)
+        for attempt in range(self.max_retries + 1):
+            wait = self.pacer.reserve(tier, key)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            try:
+                response = await self.client.post(url, **kwargs)
+            except httpx.HTTPError as e:
+                if attempt >= self.max_retries or not isinstance(e, retry_errors):
+                    raise SlackTransportError(f"Slack 請求失敗: {e}") from e
+                await asyncio.sleep(min(10.0, 2 ** attempt))
+                continue
+
+            if response.status_code >= 500 and not idempotent:
+                raise SlackTransportError(f"Slack 請求失敗 (HTTP {response.status_code})，訊息可能已送出，不重送",
+                                          status_code=response.status_code)
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt >= self.max_retries:
+                    break
+                delay = _retry_after(response.headers, attempt)
+                if response.status_code == 429:
+                    print(f"Slack 限流 (429)，{delay:.1f} 秒後重試")
+                    self.pacer.block(tier, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            return response
+
+        raise SlackTransportError(f"Slack 請求重試 {self.max_retries} 次後仍失敗 (HTTP {response.status_code})",
+                                  status_code=response.status_code)
+
+    async def api_call(self, method: str, **payload) -> Dict:
+        """呼叫 Slack Web API（非同步）"""
+        token = self.token or os.getenv('SLACK_BOT_TOKEN')
+        with track_call('slack', method) as call:
+            call.set('request_bytes', payload_size(payload))
+            response = await self._send(
+                self.pacer.tier_for(method),
+                payload.get('channel', ''),
+                SLACK_API_URL + method,
+                idempotent=method not in NON_IDEMPOTENT_METHODS,
+                json=payload,
+                headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json; charset=utf-8'},
+            )
+            return _parse_api_response(method, response.status_code, response.json())
+
+    async def post_webhook(self, url: str, payload: Dict) -> None:
+        """發送 Incoming Webhook 訊息（非同步）"""
+        with track_call('slack', 'webhook') as call:
+            call.set('request_bytes', payload_size(payload))
+            response = await self._send('webhook', url, url, idempotent=False, json=payload)
+            if response.status_code != 200:
+                raise SlackTransportError(f"Slack Webhook 失敗 (HTTP {response.status_code}): {response.text[:200]}",
+                                          status_code=response.status_code)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# ===== 共用實例 =====
+
+_transport: Optional[SlackTransport] = None
+# 以 event loop 為鍵（弱參照）：loop 結束後連同其用戶端一起回收，不會被新的 loop 誤用
+_async_transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncSlackTransport]" = weakref.WeakKeyDictionary()
+_transport_lock = threading.Lock()
+
+
+def get_slack_transport() -> SlackTransport:
+    """取得行程共用的同步 Slack 用戶端"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = SlackTransport()
+    return _transport
+
+
+def get_async_slack_transport() -> AsyncSlackTransport:
+    """取得目前 event loop 共用的非同步 Slack 用戶端（httpx 連線綁定 event loop）"""
+    loop = asyncio.get_running_loop()
+    transport = _async_transports.get(loop)
+    if transport is None:
+        transport = _async_transports[loop] = AsyncSlackTransport()
+    return transport
+
+
+async def close_async_slack_transport() -> None:
+    """關閉目前 event loop 的非同步用戶端（服務關閉時呼叫）"""
+    transport = _async_transports.pop(asyncio.get_running_loop(), None)
+    if transport is not None:
+        await transport.aclose()
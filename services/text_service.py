@@ -0,0 +1,322 @@
+"""
+郵件文字正規化服務
+在送進 AI 之前清理郵件內容，減少 prompt token 數量
+"""
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+NORMALIZE_CACHE_SIZE = int(os.getenv('NORMALIZE_CACHE_SIZE', '2000'))
+
+# ===== 正規表達式 =====
+
+# 引用的歷史回覆（"On ... wrote:"、"-----Original Message-----"、Outlook 標頭、中文回覆標頭）
+_QUOTE_HEADER_PATTERNS = [
+    re.compile(r'^\s*On .{0,200}wrote:\s*$', re.IGNORECASE | re.MULTILINE),
+    re.compile(r'^\s*-{2,}\s*Original Message\s*-{2,}\s*$', re.IGNORECASE | re.MULTILINE),
+    re.compile(r'^\s*From:\s.+\n\s*(Sent|Date):\s.+$', re.IGNORECASE | re.MULTILINE),
+    re.compile(r'^\s*在\s?.{0,100}寫道[:：]\s*$', re.MULTILINE),
+    re.compile(r'^\s*寄件者[:：].+\n\s*(寄件日期|日期|傳送時間)[:：].+$', re.MULTILINE),
+]
+
+# 轉寄的郵件（其後的內容是轉寄的正文，例如轉寄的會議邀請，不可移除）
+_FORWARD_HEADER = re.compile(
+    r'^\s*(-{2,}\s*(Forwarded message|轉寄的郵件|已轉寄的郵件)\s*-{2,}|Begin forwarded message:)\s*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# 以 ">" 開頭的引用行
+_QUOTED_LINE = re.compile(r'^\s*>.*$', re.MULTILINE)
+
+# 簽名檔分隔（"-- "、手機簽名、常見結尾敬語）
+_SIGNATURE_PATTERNS = [
+    re.compile(r'^--\s*$', re.MULTILINE),
+    re.compile(r'^_{5,}\s*$', re.MULTILINE),
+    re.compile(r'^\s*Sent from my (iPhone|iPad|Android|mobile device|Galaxy).*$', re.IGNORECASE | re.MULTILINE),
+    re.compile(r'^\s*從我的 ?(iPhone|iPad|Android).*傳送\s*$', re.MULTILINE),
+]
+
+# 法律聲明 / 取消訂閱等樣板文字（整段移除）
+_BOILERPLATE_PATTERNS = [
+    re.compile(r'(CONFIDENTIALITY NOTICE|DISCLAIMER|This (e-?mail|message)( and any attachments)? (is|are|may be) (confidential|intended (solely|only)))[^\n]*(\n(?!\s*\n)[^\n]*)*',
+               re.IGNORECASE),
+    re.compile(r'[^\n]*(unsubscribe|manage (your )?(email )?preferences|取消訂閱|退訂)[^\n]*', re.IGNORECASE),
+    re.compile(r'[^\n]*(view (this|it) in (your|a) browser|以瀏覽器檢視)[^\n]*', re.IGNORECASE),
+    re.compile(r'[^\n]*(©|\(c\)|copyright)\s*\d{4}[^\n]*', re.IGNORECASE),
+]
+
+_HTML_TAG = re.compile(r'<[^>]+>')
+_HTML_BLOCK = re.compile(r'<(script|style)[^>]*>.*?</\1>', re.IGNORECASE | re.DOTALL)
+_HTML_ENTITY = re.compile(r'&(nbsp|amp|lt|gt|quot|#39);')
+_HTML_ENTITIES = {'nbsp': ' ', 'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', '#39': "'"}
+
+_URL = re.compile(r'https?://[^\s<>"\')\]]+')
+_ZERO_WIDTH = re.compile('[\u200b\u200c\u200d\u2060\ufeff\u00ad\u034f]')
+_INLINE_SPACE = re.compile('[ \t\f\v\u00a0]+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+
+# 正規化結果快取（以郵件 ID + 原文雜湊為 key，內容變動時自動失效；LRU，最多 NORMALIZE_CACHE_SIZE 筆）
+_normalized_cache: "OrderedDict[str, Dict]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+# ===== Token 估算 =====
+
+_encoder = None
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文字的 token 數量
+
+    有 tiktoken（且編碼表可用）時精確計算，否則以字元數估算：
+    CJK 字元約 1 token/字，其他約 4 字元/token
+
+    Args:
+        text: 文字內容
+
+    Returns:
+        int: token 數量
+    """
+    global _encoder
+
+    if not text:
+        return 0
+
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding('o200k_base')
+        except Exception:
+            _encoder = False
+
+    if _encoder:
+        return len(_encoder.encode(text))
+
+    cjk = sum(1 for ch in text if '\u3000' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7af')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+# ===== 正規化步驟 =====
+
+def strip_html(text: str) -> str:
+    """移除 HTML 標籤（HTML-only 郵件的 fallback）"""
+    if '<' not in text or '>' not in text:
+        return text
+    text = _HTML_BLOCK.sub(' ', text)
+    text = re.sub(r'<(br|/p|/div|/tr|/li)[^>]*>', '\n', text, flags=re.IGNORECASE)
+    text = _HTML_TAG.sub(' ', text)
+    return _HTML_ENTITY.sub(lambda m: _HTML_ENTITIES[m.group(1)], text)
+
+
+def _has_reply_text(text: str) -> bool:
+    """移除引用行與回覆標頭後是否仍有內容"""
+    text = _QUOTED_LINE.sub('', text)
+    for pattern in _QUOTE_HEADER_PATTERNS:
+        text = pattern.sub('', text)
+    return bool(text.strip())
+
+
+def strip_quoted_history(text: str) -> str:
+    """移除引用的歷史回覆
+
+    只在回覆標頭上方有實際回覆內容時，從標頭起截斷；轉寄標頭（Forwarded message）之後的內容是
+    轉寄的正文，不會被截斷。">" 引用行只在移除後仍有其他內容時移除
+    """
+    forward = _FORWARD_HEADER.search(text)
+    end = forward.start() if forward else len(text)
+
+    cut = end
+    for pattern in _QUOTE_HEADER_PATTERNS:
+        match = pattern.search(text, 0, end)
+        if match and match.start() < cut:
+            cut = match.start()
+    if cut < end and _has_reply_text(text[:cut]):
+        return _QUOTED_LINE.sub('', text[:cut])
+
+    stripped = _QUOTED_LINE.sub('', text)
+    return stripped if _has_reply_text(stripped) else text
+
+
+def strip_signature(text: str) -> str:
+    """移除簽名檔（只在郵件後半段出現分隔符時截斷，避免誤刪正文）"""
+    half = len(text) // 2
+    for pattern in _SIGNATURE_PATTERNS:
+        for match in pattern.finditer(text):
+            if match.start() >= half:
+                text = text[:match.start()]
+                break
+    return text
+
+
+def strip_boilerplate(text: str) -> str:
+    """移除法律聲明、取消訂閱、版權等樣板文字"""
+    for pattern in _BOILERPLATE_PATTERNS:
+        text = pattern.sub('', text)
+    return text
+
+
+def shorten_urls(text: str, max_length: int = 40) -> str:
+    """縮短 URL：去除 query string / 追蹤參數，只保留網域與路徑前段"""
+    def _shorten(match: re.Match) -> str:
+        url = match.group(0)
+        base = url.split('?', 1)[0].split('#', 1)[0]
+        base = re.sub(r'^https?://(www\.)?', '', base).rstrip('/')
+        if len(base) > max_length:
+            base = base[:max_length] + '…'
+        return f'<{base}>'
+
+    return _URL.sub(_shorten, text)
+
+
+def collapse_whitespace(text: str) -> str:
+    """壓縮空白：移除零寬字元、合併連續空白與空行"""
+    text = _ZERO_WIDTH.sub('', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = _INLINE_SPACE.sub(' ', text)
+    text = '\n'.join(line.strip() for line in text.split('\n'))
+    text = _BLANK_LINES.sub('\n\n', text)
+    return text.strip()
+
+
+def normalize_text(text: str) -> str:
+    """正規化單段文字（完整流程）
+
+    Args:
+        text: 原始文字
+
+    Returns:
+        str: 正規化後的文字
+    """
+    if not text:
+        return ''
+
+    text = strip_html(text)
+    text = strip_quoted_history(text)
+    text = strip_signature(text)
+    text = strip_boilerplate(text)
+    text = shorten_urls(text)
+    normalized = collapse_whitespace(text)
+
+    # 避免清理過度：若整封信被清空，退回只做空白與 URL 處理的版本
+    if not normalized:
+        normalized = collapse_whitespace(shorten_urls(strip_html(text)))
+
+    return normalized
+
+
+# ===== 郵件層級 =====
+
+def _cache_key(email: Dict) -> str:
+    digest = hashlib.sha1(
+        (email.get('body', '') + '\x00' + email.get('snippet', '')).encode('utf-8', errors='ignore')
+    ).hexdigest()
+    return f"{email.get('id', '')}:{digest}"
+
+
+def normalize_email(email: Dict) -> Dict:
+    """正規化單封郵件，結果依郵件快取
+
+    在郵件 dict 上加入:
+        - clean_body: 正規化後的正文
+        - clean_snippet: 正規化後的預覽
+        - text_stats: {chars_before, chars_after, tokens_before, tokens_after}
+
+    Args:
+        email: 郵件 dict（需包含 body / snippet）
+
+    Returns:
+        Dict: 同一個郵件 dict（已加入正規化欄位）
+    """
+    key = _cache_key(email)
+    with _cache_lock:
+        cached = _normalized_cache.get(key)
+        if cached is not None:
+            _normalized_cache.move_to_end(key)
+
+    if cached is None:
+        body = email.get('body', '') or ''
+        snippet = email.get('snippet', '') or ''
+        clean_body = normalize_text(body)
+        clean_snippet = collapse_whitespace(shorten_urls(snippet))
+
+        cached = {
+            'clean_body': clean_body,
+            'clean_snippet': clean_snippet,
+            'text_stats': {
+                'chars_before': len(body) + len(snippet),
+                'chars_after': len(clean_body) + len(clean_snippet),
+                'tokens_before': estimate_tokens(body) + estimate_tokens(snippet),
+                'tokens_after': estimate_tokens(clean_body) + estimate_tokens(clean_snippet),
+            },
+        }
+        with _cache_lock:
+            _normalized_cache[key] = cached
+            while len(_normalized_cache) > NORMALIZE_CACHE_SIZE:
+                _normalized_cache.popitem(last=False)
+
+    email.update(cached)
+    return email
+
+
+def normalize_emails(emails: List[Dict], verbose: bool = True) -> List[Dict]:
+    """正規化郵件列表，並輸出字元 / token 縮減統計
+
+    Args:
+        emails: 郵件列表
+        verbose: 是否輸出統計
+
+    Returns:
+        List[Dict]: 正規化後的郵件列表
+    """
+    for email in emails:
+        normalize_email(email)
+
+    if verbose and emails:
+        stats = summarize_reduction(emails)
+        print(
+            f"文字正規化: {stats['chars_before']} → {stats['chars_after']} 字元 "
+            f"(-{stats['char_reduction']:.0%}), "
+            f"{stats['tokens_before']} → {stats['tokens_after']} tokens "
+            f"(-{stats['token_reduction']:.0%})"
+        )
+
+    return emails
+
+
+def summarize_reduction(emails: List[Dict]) -> Dict:
+    """彙總郵件列表的字元 / token 縮減量
+
+    Args:
+        emails: 已正規化的郵件列表
+
+    Returns:
+        Dict: {chars_before, chars_after, tokens_before, tokens_after, char_reduction, token_reduction}
+    """
+    totals = {'chars_before': 0, 'chars_after': 0, 'tokens_before': 0, 'tokens_after': 0}
+    for email in emails:
+        for key, value in email.get('text_stats', {}).items():
+            totals[key] += value
+
+    totals['char_reduction'] = 1 - totals['chars_after'] / totals['chars_before'] if totals['chars_before'] else 0.0
+    totals['token_reduction'] = 1 - totals['tokens_after'] / totals['tokens_before'] if totals['tokens_before'] else 0.0
+    return totals
+
+
+def get_email_text(email: Dict, field: str = 'body', limit: Optional[int] = None) -> str:
+    """取得 AI 使用的郵件文字（優先使用正規化版本）
+
+    Args:
+        email: 郵件 dict
+        field: 'body' 或 'snippet'
+        limit: 最多字元數
+
+    Returns:
+        str: 郵件文字
+    """
+    if f'clean_{field}' not in email and field in email:
+        normalize_email(email)
+    text = email.get(f'clean_{field}', email.get(field, '')) or ''
+    return text[:limit] if limit else text
@@ -0,0 +1,376 @@
+"""
+執行追蹤（trace / span）
+每次執行（run ID 即 trace ID）記錄一棵 span 樹，取代閱讀 print 輸出來找出慢的環節：
+    - workflow.run：整次執行（api/server.py、worker.py）
+    - node.<名稱>：每個 graph 節點（含輸出大小、中斷 / 失敗）
+    - gmail.account：多帳號抓取時的每個帳號
+    - <服務>.<操作>：每次 Gmail / Calendar / Slack / OpenAI 呼叫（由 services/metrics.track_call 建立）
+
+每個 span 包含起訖時間、耗時、狀態（ok / error / interrupted）與屬性（郵件數、payload 大小等）。
+匯出方式由 TRACE_EXPORTER 決定：
+    - jsonl（預設）：每個 span 一行寫入 TRACE_FILE
+    - otlp：以 OTLP/HTTP JSON 送到 OTEL_EXPORTER_OTLP_ENDPOINT（/v1/traces）
+    - none：不記錄
+span 結束時只寫入記憶體緩衝，匯出由背景執行緒進行（根 span 結束或緩衝滿 FLUSH_SIZE 時喚醒），
+不會在 event loop 上做檔案或網路 I/O；flush() 同步匯出剩餘的 span（行程結束時自動呼叫）
+
+以 `python trace_cli.py show <run ID>` 顯示單次執行的耗時分解
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import hashlib
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'jsonl').lower()
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318')
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'email-summary-agent')
+FLUSH_SIZE = 200  # 緩衝的 span 數量達到此值時立即匯出
+
+# OTLP span kind：INTERNAL / CLIENT
+_OTLP_KINDS = {'client': 3}
+# OTLP status code：OK / ERROR
+_OTLP_STATUS = {'ok': 1, 'error': 2}
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar('trace_span', default=None)
+_buffer: List[Dict] = []
+_buffer_lock = threading.Lock()
+_write_lock = threading.Lock()
+# 匯出在背景執行緒進行：span 結束（可能在 event loop 上）只寫入緩衝，不做檔案 / 網路 I/O
+_flush_lock = threading.Lock()
+_export_wake = threading.Event()
+_exporter: Optional[threading.Thread] = None
+_exporter_lock = threading.Lock()
+
+
+class Span:
+    """進行中的 span；以 set() 附加屬性"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'attributes',
+                 'status', 'error', 'start', '_perf_start')
+
+    def __init__(self, trace_id: str, name: str, kind: str, parent_id: Optional[str], attributes: Dict):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.status = 'ok'
+        self.error = None
+        self.start = time.time()
+        self._perf_start = time.perf_counter()
+
+    def set(self, key: str, value: Any) -> "Span":
+        if value is not None:
+            self.attributes[key] = value
+        return self
+
+    def finish(self) -> Dict:
+        duration = time.perf_counter() - self._perf_start
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "end": self.start + duration,
+            "duration_ms": round(duration * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "pid": os.getpid(),
+        }
+
+
+class _NoopSpan:
+    """不在任何 trace 中（或追蹤關閉）時使用，呼叫端不需要判斷"""
+
+    status = 'ok'
+    error = None
+
+    def set(self, key: str, value: Any) -> "_NoopSpan":
+        return self
+
+
+_NOOP = _NoopSpan()
+
+
+# ===== 記錄 =====
+
+def current_trace_id() -> Optional[str]:
+    span_ = _current.get()
+    return span_.trace_id if span_ else None
+
+
+@contextmanager
+def span(name: str, kind: str = 'internal', trace_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+    """記錄一個 span（巢狀使用時自動成為外層 span 的子 span）
+
+    不在任何 trace 中且未指定 trace_id 時不記錄（例如單獨呼叫服務函數）
+
+    Args:
+        name: span 名稱
+        kind: run / node / account / client / internal
+        trace_id: 開始新的 trace（通常為 run ID）；未指定時沿用外層 span
+        **attributes: 初始屬性
+
+    用法：
+        with span('gmail.account', kind='account', account=label) as s:
+            emails = ...
+            s.set('emails', len(emails))
+    """
+    parent = _current.get()
+    if trace_id is None and parent is not None:
+        trace_id = parent.trace_id
+    if trace_id is None or TRACE_EXPORTER == 'none':
+        yield _NOOP
+        return
+
+    parent_id = parent.span_id if parent is not None and parent.trace_id == trace_id else None
+    current = Span(trace_id, name, kind, parent_id, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        if current.status == 'ok':
+            current.status = 'error'
+            current.error = f'{type(e).__name__}: {e}'[:500]
+        raise
+    finally:
+        _current.reset(token)
+        _record(current.finish(), root=parent_id is None)
+
+
+def traced_node(name: str, func):
+    """包裝 graph 節點：每次執行記錄一個 node span（trace ID 取自 thread ID）
+
+    interrupt() 造成的中斷記為 interrupted，不視為失敗
+    """
+    from langgraph.errors import GraphBubbleUp
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        trace_id = current_trace_id()
+        if trace_id is None:
+            from langgraph.config import get_config
+            try:
+                trace_id = get_config().get('configurable', {}).get('thread_id')
+            except RuntimeError:
+                trace_id = None
+
+        with span(f'node.{name}', kind='node', trace_id=trace_id, node=name) as node_span:
+            try:
+                result = func(*args, **kwargs)
+            except GraphBubbleUp:
+                node_span.status = 'interrupted'
+                raise
+            if isinstance(result, dict):
+                node_span.set('output_keys', sorted(result))
+                node_span.set('output_bytes', payload_size(result))
+            return result
+
+    return wrapper
+
+
+def payload_size(value: Any) -> int:
+    """值序列化為 JSON 後的位元組數（span 的 payload 大小屬性）"""
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 0
+
+
+# ===== 匯出 =====
+
+def _record(record: Dict, root: bool):
+    with _buffer_lock:
+        _buffer.append(record)
+        pending = len(_buffer)
+    # 根 span 結束（一次執行結束）或緩衝已滿時，喚醒背景執行緒匯出
+    if root or pending >= FLUSH_SIZE:
+        _start_exporter()
+        _export_wake.set()
+
+
+def _start_exporter():
+    global _exporter
+    with _exporter_lock:
+        # fork 出的子行程中執行緒不存在，需要重新啟動
+        if _exporter is None or not _exporter.is_alive():
+            _exporter = threading.Thread(target=_export_loop, name='trace-exporter', daemon=True)
+            _exporter.start()
+
+
+def _export_loop():
+    while True:
+        _export_wake.wait()
+        _export_wake.clear()
+        flush()
+
+
+def flush() -> None:
+    """匯出緩衝中的 span（失敗時只印出錯誤，不影響工作流）
+
+    在呼叫端的執行緒同步匯出，並等待背景執行緒進行中的匯出完成（讀取 TRACE_FILE 前、行程結束時使用）
+    """
+    with _flush_lock:
+        with _buffer_lock:
+            records = _buffer[:]
+            _buffer.clear()
+        if not records:
+            return
+
+        try:
+            if TRACE_EXPORTER == 'otlp':
+                _export_otlp(records)
+            else:
+                export_jsonl(records)
+        except Exception as e:
+            print(f"匯出追蹤資料失敗（{len(records)} 個 span）: {e}")
+
+
+def export_jsonl(records: List[Dict], path: Optional[str] = None):
+    """span 記錄附加到 JSONL 檔（本機 collector 也使用）"""
+    data = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records)
+    with _write_lock:
+        # 多個行程（API 服務、worker）可能寫入同一個檔案：單次 append 寫入整批
+        with open(path or TRACE_FILE, 'a', encoding='utf-8') as f:
+            f.write(data)
+
+
+def _otlp_trace_id(trace_id: str) -> str:
+    """OTLP 的 trace ID 為 32 位十六進位；run ID 另存於 run_id 屬性"""
+    return hashlib.sha256(trace_id.encode()).hexdigest()[:32]
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def to_otlp(records: List[Dict]) -> Dict:
+    """span 記錄轉為 OTLP/HTTP JSON 的 ExportTraceServiceRequest"""
+    spans = []
+    for record in records:
+        otlp_span = {
+            "traceId": _otlp_trace_id(record["trace_id"]),
+            "spanId": record["span_id"],
+            "name": record["name"],
+            "kind": _OTLP_KINDS.get(record["kind"], 1),
+            "startTimeUnixNano": str(int(record["start"] * 1e9)),
+            "endTimeUnixNano": str(int(record["end"] * 1e9)),
+            "attributes": _otlp_attributes({
+                **record["attributes"],
+                "run_id": record["trace_id"],
+                "span.kind": record["kind"],
+                "process.pid": record["pid"],
+            }),
+            "status": {"code": _OTLP_STATUS.get(record["status"], 0), "message": record["error"] or ''},
+        }
+        if record["parent_id"]:
+            otlp_span["parentSpanId"] = record["parent_id"]
+        if record["status"] == 'interrupted':
+            otlp_span["attributes"].append({"key": "interrupted", "value": {"boolValue": True}})
+        spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": "email-summary"}, "spans": spans}],
+        }]
+    }
+
+
+def _export_otlp(records: List[Dict]):
+    import requests
+
+    response = requests.post(
+        OTLP_ENDPOINT.rstrip('/') + '/v1/traces',
+        json=to_otlp(records),
+        headers={'Content-Type': 'application/json'},
+        timeout=5,
+    )
+    response.raise_for_status()
+
+
+def _from_otlp_value(value: Dict) -> Any:
+    if 'arrayValue' in value:
+        return [_from_otlp_value(item) for item in value['arrayValue'].get('values', [])]
+    if 'intValue' in value:
+        return int(value['intValue'])
+    for key in ('stringValue', 'boolValue', 'doubleValue'):
+        if key in value:
+            return value[key]
+    return None
+
+
+def from_otlp(payload: Dict) -> List[Dict]:
+    """OTLP/HTTP JSON 轉回 span 記錄（本機 collector 使用，與 to_otlp 互逆）"""
+    records = []
+    for resource_spans in payload.get('resourceSpans', []):
+        for scope_spans in resource_spans.get('scopeSpans', []):
+            for otlp_span in scope_spans.get('spans', []):
+                attributes = {item['key']: _from_otlp_value(item.get('value', {}))
+                              for item in otlp_span.get('attributes', [])}
+                start = int(otlp_span['startTimeUnixNano']) / 1e9
+                end = int(otlp_span['endTimeUnixNano']) / 1e9
+                status_code = otlp_span.get('status', {}).get('code', 0)
+                status = 'interrupted' if attributes.pop('interrupted', False) else \
+                    ('error' if status_code == 2 else 'ok')
+                records.append({
+                    "trace_id": attributes.pop('run_id', otlp_span['traceId']),
+                    "span_id": otlp_span['spanId'],
+                    "parent_id": otlp_span.get('parentSpanId') or None,
+                    "name": otlp_span['name'],
+                    "kind": attributes.pop('span.kind', 'internal'),
+                    "start": start,
+                    "end": end,
+                    "duration_ms": round((end - start) * 1000, 3),
+                    "status": status,
+                    "error": otlp_span.get('status', {}).get('message') or None,
+                    "attributes": attributes,
+                    "pid": attributes.pop('process.pid', None),
+                })
+    return records
+
+
+# ===== 讀取 =====
+
+def read_spans(path: Optional[str] = None, trace_id: Optional[str] = None) -> List[Dict]:
+    """讀取 JSONL 檔中的 span（可只取某次執行）"""
+    records = []
+    with open(path or TRACE_FILE, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if trace_id is None or record.get('trace_id') == trace_id:
+                records.append(record)
+    return records
+
+
+atexit.register(flush)
@@ -0,0 +1,28 @@
+"""
+pytest 共用設定：讓測試可以直接 import 專案模組（agent / api / services），
+並提供共用的假服務 fixture（benchmarks/fakes.py 的公開替身，離線基準測試也使用同一組）
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def calendar():
+    """Calendar API 替身：與真實 API 相同，ID 已被使用時 insert 回傳 409、批次中 request_id 不可重複"""
+    from benchmarks.fakes import FakeCalendarService
+    return FakeCalendarService()
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """以確定性的 FakeChatModel 取代 services.ai_service.get_llm"""
+    from benchmarks.fakes import FakeChatModel
+    from services import ai_service
+
+    model = FakeChatModel()
+    monkeypatch.setattr(ai_service, 'get_llm', lambda *args, **kwargs: model)
+    return model
@@ -0,0 +1,104 @@
+"""
+services/calendar_service.py：批次建立事件、既有事件的區間索引
+"""
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from services.calendar_service import EventIntervalIndex, build_event_body, create_calendar_events_batch
+
+TAIPEI = ZoneInfo('Asia/Taipei')
+
+
+def _event(event_id: str) -> dict:
+    return {'id': event_id, 'title': 'Sync', 'start_time': datetime(2025, 3, 12, 14),
+            'end_time': datetime(2025, 3, 12, 15)}
+
+
+def test_duplicate_events_are_created_once(calendar):
+    results = create_calendar_events_batch([_event('e1'), _event('e1'), _event('e2')], service=calendar)
+    assert set(results) == {'e1', 'e2'}
+    assert all(result['status'] == 'created' for result in results.values())
+    assert len(calendar.created) == 2
+
+
+def test_conflicting_id_reports_existing_event(calendar):
+    create_calendar_events_batch([_event('e1')], service=calendar)
+
+    results = create_calendar_events_batch([_event('e1')], service=calendar)
+
+    assert results['e1']['status'] == 'exists'
+    assert calendar.calls['events.update'] == 0
+
+
+def test_conflicting_id_of_deleted_event_is_restored(calendar):
+    results = create_calendar_events_batch([_event('e1')], service=calendar)
+    calendar_id = results['e1']['calendar_event_id']
+    calendar.events().delete(calendarId='primary', eventId=calendar_id).execute()
+
+    results = create_calendar_events_batch([_event('e1')], service=calendar)
+
+    # 被刪除的事件仍佔用 ID（409），應恢復而不是回報已存在
+    assert results['e1']['status'] == 'created'
+    assert calendar.created[calendar_id]['status'] == 'confirmed'
+    assert calendar.created[calendar_id]['summary'] == 'Sync'
+
+
+def test_all_day_event_uses_dates_with_exclusive_end():
+    body = build_event_body({'id': 'e1', 'title': 'Offsite', 'all_day': True,
+                             'start_time': '2026-10-24T00:00:00+08:00', 'end_time': '2026-10-26T00:00:00+08:00'})
+
+    assert body['start'] == {'date': '2026-10-24'}
+    assert body['end'] == {'date': '2026-10-26'}
+
+
+def test_timed_event_keeps_recurrence():
+    body = build_event_body({**_event('e1'), 'recurrence': ['RRULE:FREQ=WEEKLY;COUNT=4']})
+
+    assert body['start'] == {'dateTime': '2025-03-12T14:00:00', 'timeZone': 'Asia/Taipei'}
+    assert body['recurrence'] == ['RRULE:FREQ=WEEKLY;COUNT=4']
+    assert 'recurrence' not in build_event_body(_event('e2'))
+
+
+def _existing(event_id: str, start: str, end: str, **extra) -> dict:
+    return {'id': event_id, 'start': {'dateTime': start}, 'end': {'dateTime': end}, **extra}
+
+
+def _at(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2026, 10, day, hour, minute, tzinfo=TAIPEI)
+
+
+def _overlapping_ids(index: EventIntervalIndex, start: datetime, end: datetime) -> list:
+    return sorted(event['id'] for event in index.overlapping(start, end))
+
+
+def test_interval_index_overlap_is_half_open():
+    index = EventIntervalIndex([
+        _existing('morning', '2026-10-20T09:00:00+08:00', '2026-10-20T10:00:00+08:00'),
+        _existing('noon', '2026-10-20T12:00:00+08:00', '2026-10-20T13:00:00+08:00'),
+    ])
+
+    assert _overlapping_ids(index, _at(20, 9, 30), _at(20, 9, 45)) == ['morning']
+    assert _overlapping_ids(index, _at(20, 9, 30), _at(20, 12, 30)) == ['morning', 'noon']
+    # 首尾相接不算重疊
+    assert _overlapping_ids(index, _at(20, 10), _at(20, 12)) == []
+
+
+def test_interval_index_finds_long_events_that_started_earlier():
+    index = EventIntervalIndex([
+        _existing('conference', '2026-10-18T09:00:00+08:00', '2026-10-22T18:00:00+08:00'),
+        _existing('short', '2026-10-20T08:00:00+08:00', '2026-10-20T08:30:00+08:00'),
+    ])
+
+    assert _overlapping_ids(index, _at(21, 14), _at(21, 15)) == ['conference']
+
+
+def test_interval_index_skips_cancelled_and_reads_all_day_events():
+    index = EventIntervalIndex([
+        _existing('cancelled', '2026-10-20T09:00:00+08:00', '2026-10-20T10:00:00+08:00', status='cancelled'),
+        {'id': 'holiday', 'start': {'date': '2026-10-21'}, 'end': {'date': '2026-10-22'}},
+        {'id': 'no-times', 'start': {}, 'end': {}},
+    ])
+
+    assert len(index) == 1
+    assert _overlapping_ids(index, _at(20, 9), _at(20, 10)) == []
+    assert _overlapping_ids(index, _at(21, 23), _at(22, 1)) == ['holiday']
@@ -0,0 +1,124 @@
+"""
+agent/checkpointing.py：保留政策（閒置 run 只留最新 checkpoint、等待確認的 run 不刪除）與空間壓縮
+"""
+import sqlite3
+import time
+from typing import TypedDict
+
+import pytest
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Command, interrupt
+
+from agent import checkpointing
+
+DAY = 86400
+
+
+class _State(TypedDict, total=False):
+    steps: int
+    answer: str
+
+
+def _build(saver):
+    def first(state):
+        return {'steps': state.get('steps', 0) + 1}
+
+    def second(state):
+        return {'steps': state['steps'] + 1}
+
+    def confirm(state):
+        return {'answer': interrupt({'question': 'ok?'})}
+
+    builder = StateGraph(_State)
+    builder.add_node('first', first)
+    builder.add_node('second', second)
+    builder.add_node('confirm', confirm)
+    builder.add_edge(START, 'first')
+    builder.add_edge('first', 'second')
+    builder.add_conditional_edges('second', lambda state: 'confirm' if state.get('steps', 0) > 10 else END)
+    builder.add_edge('confirm', END)
+    return builder.compile(checkpointer=saver)
+
+
+def _config(thread_id):
+    return {'configurable': {'thread_id': thread_id}}
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'checkpoints.db')
+
+
+@pytest.fixture
+def graph(db):
+    saver = checkpointing.create_saver(db)
+    yield _build(saver)
+    saver.conn.close()
+
+
+def _checkpoint_count(db, thread_id):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?', (thread_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_idle_thread_keeps_only_its_latest_checkpoint(db, graph):
+    graph.invoke({'steps': 0}, _config('done'))
+    assert _checkpoint_count(db, 'done') > 1
+
+    deleted = checkpointing.apply_retention(db, now=time.time() + 2 * checkpointing.IDLE_AFTER_SECONDS)
+
+    assert deleted['threads'] == 0 and deleted['checkpoints'] > 0
+    assert _checkpoint_count(db, 'done') == 1
+    assert graph.get_state(_config('done')).values == {'steps': 2}
+
+
+def test_recent_thread_is_not_pruned(db, graph):
+    graph.invoke({'steps': 0}, _config('running'))
+    before = _checkpoint_count(db, 'running')
+
+    checkpointing.apply_retention(db)
+
+    assert _checkpoint_count(db, 'running') == before
+
+
+def test_expired_thread_waiting_for_confirmation_is_kept_and_resumes(db, graph):
+    graph.invoke({'steps': 0}, _config('done'))
+    graph.invoke({'steps': 9}, _config('waiting'))
+    assert graph.get_state(_config('waiting')).next == ('confirm',)
+
+    deleted = checkpointing.apply_retention(db, retention_days=30, now=time.time() + 40 * DAY)
+
+    # 已結束的 run 整個刪除，等待確認的 run 保留最新 checkpoint 與其 interrupt
+    assert deleted['threads'] == 1
+    assert _checkpoint_count(db, 'done') == 0
+    assert _checkpoint_count(db, 'waiting') == 1
+    assert graph.get_state(_config('waiting')).next == ('confirm',)
+
+    result = graph.invoke(Command(resume='yes'), _config('waiting'))
+
+    assert result == {'steps': 11, 'answer': 'yes'}
+    assert graph.get_state(_config('waiting')).next == ()
+
+
+def test_first_compact_switches_to_incremental_auto_vacuum(db, graph):
+    graph.invoke({'steps': 0}, _config('done'))
+
+    def auto_vacuum():
+        conn = sqlite3.connect(db)
+        try:
+            return conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        finally:
+            conn.close()
+
+    assert auto_vacuum() == 0
+
+    checkpointing.compact(db)
+    assert auto_vacuum() == 2
+
+    # 之後的 compact 只做 incremental vacuum
+    checkpointing.apply_retention(db, retention_days=0, now=time.time() + 2 * checkpointing.IDLE_AFTER_SECONDS)
+    assert checkpointing.compact(db)['freed_bytes'] >= 0
+    assert auto_vacuum() == 2
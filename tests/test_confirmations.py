@@ -0,0 +1,76 @@
+"""
+api/confirmations.py：debounce 視窗內的點擊合併為一批，訊息 blocks 以最新送出的版本為準
+"""
+import asyncio
+
+from api.confirmations import ConfirmationBuffer, split_decisions
+
+DELAY = 0.02
+
+
+def _collect(actions):
+    """在 event loop 中依序執行 actions(buffer)，等待 debounce 結束後回傳送出的批次"""
+    flushed = []
+
+    async def main():
+        buffer = ConfirmationBuffer(flushed.append, delay=DELAY)
+        await actions(buffer)
+        await asyncio.sleep(DELAY * 5)
+        return buffer
+
+    buffer = asyncio.run(main())
+    return flushed, buffer
+
+
+def test_clicks_within_the_window_are_flushed_once():
+    async def actions(buffer):
+        buffer.add('run-1', {'e1': True}, 'C1', '1.0', ['original'])
+        await asyncio.sleep(DELAY / 4)
+        buffer.add('run-1', {'e2': False}, 'C1', '1.0', ['stale'])
+        buffer.add('run-1', {'e3': True}, 'C1', '2.0', ['second message'])
+        assert buffer.pending() == {'run-1': 3}
+        assert buffer.decided('run-1') == {'e1', 'e2', 'e3'}
+
+    flushed, buffer = _collect(actions)
+
+    assert len(flushed) == 1
+    batch = flushed[0]
+    assert batch.run_id == 'run-1'
+    assert batch.decisions == {'e1': True, 'e2': False, 'e3': True}
+    # 同一則訊息保留第一次點擊時的 blocks
+    assert batch.messages == {('C1', '1.0'): ['original'], ('C1', '2.0'): ['second message']}
+    assert buffer.pending() == {}
+
+
+def test_runs_are_flushed_separately():
+    async def actions(buffer):
+        buffer.add('run-1', {'e1': True}, 'C1', '1.0', [])
+        buffer.add('run-2', {'e9': True}, 'C1', '9.0', [])
+
+    flushed, _ = _collect(actions)
+
+    assert sorted(batch.run_id for batch in flushed) == ['run-1', 'run-2']
+
+
+def test_rendered_blocks_replace_stale_slack_payloads():
+    async def actions(buffer):
+        buffer.remember(('C1', '1.0'), ['updated'])
+        buffer.add('run-1', {'e2': True}, 'C1', '1.0', ['stale from slack'])
+
+    flushed, buffer = _collect(actions)
+
+    assert flushed[0].messages == {('C1', '1.0'): ['updated']}
+    assert buffer.current_blocks('C1', '1.0', ['payload']) == ['updated']
+
+    buffer.forget(('C1', '1.0'))
+    assert buffer.current_blocks('C1', '1.0', ['payload']) == ['payload']
+
+    buffer.remember(('C1', '1.0'), ['done'], done=True)
+    assert buffer.current_blocks('C1', '1.0', ['payload']) == ['payload']
+
+
+def test_split_decisions_skips_events_already_decided():
+    confirmed, skipped = split_decisions({'e1': True, 'e2': False, 'e3': True}, decided=['e3'])
+
+    assert confirmed == ['e1']
+    assert skipped == ['e2']
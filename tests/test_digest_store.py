@@ -0,0 +1,81 @@
+"""
+services/digest_store.py：增量摘要的 LLM 呼叫次數與涵蓋範圍
+"""
+import pytest
+
+from services import ai_service, digest_store
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'digests.db')
+
+
+def _email(message_id, account, day):
+    return {'id': message_id, 'account': account, 'date': f'{day} 10:00:00 +0000',
+            'subject': 'hello', 'snippet': f'note {message_id}'}
+
+
+def _emails(count, accounts=('個人', '工作', '紐約大學'), days=('Sun, 18 Oct 2026', 'Mon, 19 Oct 2026')):
+    return [_email(f'm{i}', accounts[i % len(accounts)], days[i % len(days)]) for i in range(count)]
+
+
+def test_new_emails_across_digests_use_one_llm_call(llm, db):
+    result = digest_store.digest_emails(_emails(12), db_path=db)
+
+    assert llm.stats()['calls'] == 1
+    assert result['digests'] == 6 and result['new_emails'] == 12
+    assert digest_store.stats(db)['digests'] == 6
+
+
+def test_rerun_without_new_emails_makes_no_llm_call(llm, db):
+    emails = _emails(12)
+    first = digest_store.digest_emails(emails, db_path=db)
+    second = digest_store.digest_emails(emails, db_path=db)
+
+    assert llm.stats()['calls'] == 1
+    assert second['summary'] == first['summary'] and second['new_emails'] == 0
+
+
+def test_one_changed_digest_is_merged_and_combined_in_one_call(llm, db):
+    emails = _emails(12)
+    digest_store.digest_emails(emails, db_path=db)
+    new = _email('late', '工作', 'Mon, 19 Oct 2026')
+
+    result = digest_store.digest_emails(emails + [new], db_path=db)
+
+    assert llm.stats()['calls'] == 2
+    assert result['new_emails'] == 1
+    assert 'late' in digest_store.get_digest('工作', '2026-10-19', db)['email_ids']
+
+
+def test_single_digest_uses_plain_summary(llm, db):
+    digest_store.digest_emails([_email('only', '個人', 'Mon, 19 Oct 2026')], db_path=db)
+
+    assert llm.stats()['by_schema'] == {'EmailSummary': {'calls': 1, 'prompt_chars': llm.prompt_chars['EmailSummary']}}
+
+
+def test_emails_outside_the_run_are_reported(llm, db):
+    digest_store.digest_emails([_email('early', '個人', 'Mon, 19 Oct 2026')], db_path=db)
+
+    result = digest_store.digest_emails([_email('later', '個人', 'Mon, 19 Oct 2026')], db_path=db)
+
+    assert result['days'] == ['2026-10-19', '2026-10-19']
+    assert result['outside_window'] == 1
+
+
+def test_digest_missing_from_model_output_is_merged_separately(llm, db, monkeypatch):
+    update = ai_service.update_digests
+
+    def drop_first(requests, unchanged):
+        summaries, _ = update(requests, unchanged)
+        summaries.pop((requests[0]['account'], requests[0]['day']))
+        return summaries, None
+    monkeypatch.setattr(ai_service, 'update_digests', drop_first)
+
+    result = digest_store.digest_emails(_emails(4, accounts=('個人', '工作')), db_path=db)
+
+    assert result['new_emails'] == 4
+    assert digest_store.stats(db)['digests'] == 2
+    # 一次合併 + 遺漏的摘要個別合併 + 重新彙整
+    assert llm.stats()['calls'] == 3
@@ -0,0 +1,53 @@
+"""
+services/event_service.py：事件檢測批次失敗的處理
+"""
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from services import ai_service, event_service
+from services.event_service import EventsDetection
+
+
+class _FlakyLLM:
+    """prompt 含 fail_marker 的批次在前 failures 次呼叫失敗"""
+
+    def __init__(self, fail_marker: str, failures: int):
+        self.fail_marker = fail_marker
+        self.failures = failures
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        def respond(prompt):
+            self.calls += 1
+            if self.fail_marker in prompt and self.failures > 0:
+                self.failures -= 1
+                raise TimeoutError('rate limited')
+            return EventsDetection(events=[])
+        return RunnableLambda(respond)
+
+
+def _emails():
+    return [
+        {'id': f'm{i}', 'subject': 'sync', 'from': 'a@example.com', 'date': '', 'snippet': '',
+         'body': f'Let us meet at 3pm. {marker}'}
+        for i, marker in enumerate(['first', 'second'])
+    ]
+
+
+@pytest.fixture
+def one_email_per_batch(monkeypatch):
+    monkeypatch.setattr(event_service, 'pack_batches', lambda entries: [[entry] for entry in entries])
+
+
+def test_failed_batch_is_resent(monkeypatch, one_email_per_batch):
+    llm = _FlakyLLM('second', failures=1)
+    monkeypatch.setattr(ai_service, 'get_llm', lambda *args, **kwargs: llm)
+    assert event_service.detect_events_from_emails(_emails()) == []
+    assert llm.calls == 3
+
+
+def test_batch_failing_after_resend_raises(monkeypatch, one_email_per_batch):
+    llm = _FlakyLLM('second', failures=2)
+    monkeypatch.setattr(ai_service, 'get_llm', lambda *args, **kwargs: llm)
+    with pytest.raises(TimeoutError):
+        event_service.detect_events_from_emails(_emails())
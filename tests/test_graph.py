@@ -0,0 +1,54 @@
+"""
+agent/graph.py：優先通知在節點重試時不重複送出
+"""
+from collections import OrderedDict
+
+import pytest
+
+from agent import graph
+from services import slack_service
+
+
+@pytest.fixture
+def alerts(monkeypatch):
+    """記錄送出的優先通知（每次為一批郵件的主旨）"""
+    sent = []
+    monkeypatch.setattr(graph, '_alerted', OrderedDict())
+    monkeypatch.setattr(slack_service, 'queue_priority_alert',
+                        lambda emails: sent.append([email['subject'] for email in emails]))
+    return sent
+
+
+def _emails(*subjects):
+    emails = [{'subject': subject} for subject in subjects]
+    return emails, {id(email): f'ref-{email["subject"]}' for email in emails}
+
+
+def test_retried_node_only_alerts_new_emails(alerts):
+    emails, refs = _emails('a', 'b', 'c')
+
+    graph._priority_alert_callback('run-1', refs)(emails[:2])
+    # 節點重試：新的回呼、相同的郵件參照
+    graph._priority_alert_callback('run-1', refs)(emails)
+    graph._priority_alert_callback('run-1', refs)(emails)
+
+    assert alerts == [['a', 'b'], ['c']]
+
+
+def test_alerts_are_tracked_per_run(alerts):
+    emails, refs = _emails('a')
+
+    graph._priority_alert_callback('run-1', refs)(emails)
+    graph._priority_alert_callback('run-2', refs)(emails)
+
+    assert alerts == [['a'], ['a']]
+
+
+def test_alert_history_is_bounded(alerts, monkeypatch):
+    monkeypatch.setattr(graph, '_ALERTED_LIMIT', 2)
+    emails, refs = _emails('a', 'b', 'c')
+
+    for email in emails:
+        graph._priority_alert_callback('run-1', refs)([email])
+
+    assert list(graph._alerted) == [('run-1', 'ref-b'), ('run-1', 'ref-c')]
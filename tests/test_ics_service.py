@@ -0,0 +1,80 @@
+"""
+services/ics_service.py：iCalendar 邀請解析
+"""
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from services.ics_service import events_from_email, parse_ics_events
+
+TAIPEI = ZoneInfo('Asia/Taipei')
+
+
+def _calendar(*event_lines, method='REQUEST'):
+    return '\r\n'.join(['BEGIN:VCALENDAR', 'VERSION:2.0', f'METHOD:{method}',
+                        'BEGIN:VEVENT', *event_lines, 'END:VEVENT', 'END:VCALENDAR', ''])
+
+
+def test_folded_lines_escapes_and_timezone():
+    ics = _calendar(
+        'UID:abc@example.com',
+        'SUMMARY:Design review\\, round 2',
+        'DTSTART;TZID="America/New_York":20261020T090000',
+        'DTEND;TZID="America/New_York":20261020T103000',
+        'LOCATION:Room 42\\; 3rd',
+        ' floor',
+        'DESCRIPTION:Agenda:\\nslides',
+    )
+
+    [event] = parse_ics_events(ics)
+
+    assert event['title'] == 'Design review, round 2'
+    assert event['location'] == 'Room 42; 3rdfloor'
+    assert event['description'] == 'Agenda:\nslides'
+    assert event['start_time'] == datetime(2026, 10, 20, 21, 0, tzinfo=TAIPEI)
+    assert event['end_time'] - event['start_time'] == timedelta(minutes=90)
+    assert not event['all_day']
+
+
+def test_utc_start_with_duration_and_windows_timezone():
+    [utc] = parse_ics_events(_calendar('DTSTART:20261020T010000Z', 'DURATION:PT45M'))
+    [windows] = parse_ics_events(_calendar('DTSTART;TZID=Tokyo Standard Time:20261020T100000'))
+
+    assert utc['start_time'] == datetime(2026, 10, 20, 9, 0, tzinfo=TAIPEI)
+    assert utc['end_time'] == datetime(2026, 10, 20, 9, 45, tzinfo=TAIPEI)
+    assert windows['start_time'] == datetime(2026, 10, 20, 9, 0, tzinfo=TAIPEI)
+    # 沒有 DTEND / DURATION 時預設一小時
+    assert windows['end_time'] - windows['start_time'] == timedelta(hours=1)
+
+
+def test_all_day_event_lasts_one_day():
+    [event] = parse_ics_events(_calendar('SUMMARY:Offsite', 'DTSTART;VALUE=DATE:20261024'))
+
+    assert event['all_day']
+    assert event['start_time'] == datetime(2026, 10, 24, tzinfo=TAIPEI)
+    assert event['end_time'] == datetime(2026, 10, 25, tzinfo=TAIPEI)
+
+
+def test_cancellations_are_skipped():
+    assert parse_ics_events(_calendar('DTSTART:20261020T010000Z', method='CANCEL')) == []
+    assert parse_ics_events(_calendar('DTSTART:20261020T010000Z', 'STATUS:CANCELLED')) == []
+
+
+def test_invite_sent_inline_and_as_attachment_is_one_event():
+    ics = _calendar('UID:abc@example.com', 'SUMMARY:Sync', 'DTSTART:20261020T010000Z')
+
+    events = events_from_email({'id': 'm1', 'ics': [ics, ics]})
+
+    assert [(event['id'], event['title'], event['confidence']) for event in events] == [('m1_event_1', 'Sync', 1.0)]
+
+
+def test_recurrence_lines_are_kept():
+    ics = _calendar('UID:weekly@example.com', 'SUMMARY:Standup',
+                    'DTSTART;TZID=Asia/Taipei:20261020T100000', 'RRULE:FREQ=WEEKLY;BYDAY=TU;COUNT=10',
+                    'EXDATE;TZID=Asia/Taipei:20261027T100000', 'EXDATE;TZID=Asia/Taipei:20261103T100000')
+
+    [event] = events_from_email({'id': 'm1', 'ics': [ics]})
+
+    assert event['recurrence'] == ['RRULE:FREQ=WEEKLY;BYDAY=TU;COUNT=10',
+                                   'EXDATE;TZID=Asia/Taipei:20261027T100000',
+                                   'EXDATE;TZID=Asia/Taipei:20261103T100000']
+    assert event['start_time'] == datetime(2026, 10, 20, 10, 0, tzinfo=TAIPEI)
@@ -0,0 +1,89 @@
+"""
+services/job_queue.py：lease、heartbeat 與同一 run 的執行順序
+"""
+import time
+
+import pytest
+
+from services import job_queue
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'jobs.db')
+
+
+def _expire_lease(db, job_id):
+    job_queue._connect(db).execute('UPDATE jobs SET lease_until = ? WHERE id = ?', (time.time() - 1, job_id))
+
+
+def _job(db, job_id):
+    return job_queue._connect(db).execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+
+def test_running_job_is_not_claimed_twice(db):
+    job_id = job_queue.enqueue_job('run', 'run-1', {'time_range': '24h'}, db_path=db)
+
+    job = job_queue.claim_job('w1', db_path=db)
+
+    assert (job['id'], job['attempts'], job['payload']) == (job_id, 1, {'time_range': '24h'})
+    assert job_queue.claim_job('w2', db_path=db) is None
+
+
+def test_heartbeat_extends_the_lease(db):
+    job_id = job_queue.enqueue_job('run', 'run-1', {}, db_path=db)
+    job_queue.claim_job('w1', db_path=db)
+    _expire_lease(db, job_id)
+
+    assert job_queue.heartbeat(job_id, 'w1', db_path=db) is False
+
+    assert _job(db, job_id)['lease_until'] > time.time()
+    assert job_queue.claim_job('w2', db_path=db) is None
+
+
+def test_expired_lease_is_taken_over_and_the_old_worker_is_told(db):
+    job_id = job_queue.enqueue_job('run', 'run-1', {}, db_path=db)
+    job_queue.claim_job('w1', db_path=db)
+    _expire_lease(db, job_id)
+
+    job = job_queue.claim_job('w2', db_path=db)
+
+    assert (job['id'], job['attempts']) == (job_id, 2)
+    assert job_queue.heartbeat(job_id, 'w1', db_path=db) is True
+    assert _job(db, job_id)['worker_id'] == 'w2'
+
+
+def test_cancel_request_reaches_the_running_worker(db):
+    job_id = job_queue.enqueue_job('run', 'run-1', {}, db_path=db)
+    job_queue.claim_job('w1', db_path=db)
+
+    assert job_queue.cancel_jobs('run-1', db_path=db) == 1
+    assert job_queue.heartbeat(job_id, 'w1', db_path=db) is True
+
+
+def test_jobs_of_one_run_run_in_order(db):
+    first = job_queue.enqueue_job('run', 'run-1', {}, db_path=db)
+    resume = job_queue.enqueue_job('resume', 'run-1', {}, db_path=db)
+    other = job_queue.enqueue_job('run', 'run-2', {}, db_path=db)
+
+    assert job_queue.claim_job('w1', db_path=db)['id'] == first
+    # run-1 的恢復要等首次執行結束，其他 run 不受影響
+    assert job_queue.claim_job('w2', db_path=db)['id'] == other
+    assert job_queue.claim_job('w3', db_path=db) is None
+
+    job_queue.finish_job(first, 'done', db_path=db)
+    assert job_queue.claim_job('w3', db_path=db)['id'] == resume
+
+
+def test_expired_lease_after_last_attempt_fails_job_and_emits_finish(db, monkeypatch):
+    monkeypatch.setattr(job_queue, 'JOB_MAX_ATTEMPTS', 1)
+    job_id = job_queue.enqueue_job('run', 'run-1', {}, db_path=db)
+    assert job_queue.claim_job('w1', db_path=db)['id'] == job_id
+    _expire_lease(db, job_id)
+
+    assert job_queue.claim_job('w2', db_path=db) is None
+
+    job = _job(db, job_id)
+    assert (job['status'], job['error']) == ('failed', 'worker lease expired')
+    events = job_queue.read_events(db_path=db)
+    assert [(e['run_id'], e['event'], e['data']['status']) for e in events] == [('run-1', 'finish', 'failed')]
@@ -0,0 +1,34 @@
+"""
+services/metrics.py：多行程 flush 與已結束行程的清理
+"""
+import json
+import os
+import subprocess
+import sys
+
+from services import metrics
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def _write(directory, filename, count):
+    with open(directory / filename, 'w') as f:
+        json.dump({'values': [['email_summary_runs_total', [['status', 'completed']], count]],
+                   'histograms': []}, f)
+
+
+def test_dead_process_files_are_merged_and_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_MULTIPROC_DIR', str(tmp_path))
+    dead = [_dead_pid(), _dead_pid()]
+    for pid in dead:
+        _write(tmp_path, f'metrics-{pid}.json', 2)
+    _write(tmp_path, f'metrics-{os.getppid()}.json', 5)  # 仍在執行的行程
+
+    assert metrics.cleanup_dead_processes() == 2
+
+    assert sorted(os.listdir(tmp_path)) == sorted([metrics.DEAD_PROCESSES_FILE, f'metrics-{os.getppid()}.json'])
+    assert 'email_summary_runs_total{status="completed"} 9' in metrics.render()
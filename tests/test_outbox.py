@@ -0,0 +1,121 @@
+"""
+services/outbox.py：stream 內的順序、重試退避與 dead-letter
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services import outbox
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'outbox.db')
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """測試用處理器：payload 的 fail 次數內拋出例外，成功時記錄 payload 的 n"""
+    delivered = []
+    failures = {}
+
+    def handler(payload):
+        failures[payload['n']] = failures.get(payload['n'], 0) + 1
+        if failures[payload['n']] <= payload.get('fail', 0):
+            raise ConnectionError(f"item {payload['n']} failed")
+        delivered.append(payload['n'])
+
+    monkeypatch.setitem(outbox._handlers, 'test', handler)
+    return delivered
+
+
+def _rows(db):
+    return {row['id']: row for row in outbox._connect(db).execute('SELECT * FROM outbox')}
+
+
+def test_failed_head_blocks_its_stream_only(db, sent):
+    outbox.enqueue('test', {'n': 1, 'fail': 1}, stream='a', db_path=db)
+    outbox.enqueue('test', {'n': 2}, stream='a', db_path=db)
+    outbox.enqueue('test', {'n': 3}, stream='b', db_path=db)
+
+    assert outbox.drain(db_path=db) == {'sent': 1, 'failed': 1}
+    # 第 1 筆等待退避，同一 stream 的第 2 筆不能超車
+    assert sent == [3]
+
+    outbox._connect(db).execute('UPDATE outbox SET next_attempt_at = 0')
+    outbox.drain(db_path=db)
+    assert sent == [3, 1, 2]
+
+
+def test_retry_delay_backs_off(db, sent):
+    item = outbox.enqueue('test', {'n': 1, 'fail': 2}, db_path=db)
+
+    outbox.drain(db_path=db)
+    first_delay = _rows(db)[item]['next_attempt_at'] - time.time()
+    outbox._connect(db).execute('UPDATE outbox SET next_attempt_at = 0')
+    outbox.drain(db_path=db)
+    second_delay = _rows(db)[item]['next_attempt_at'] - time.time()
+
+    assert first_delay == pytest.approx(outbox.BASE_RETRY_DELAY, abs=1)
+    assert second_delay == pytest.approx(outbox.BASE_RETRY_DELAY * 2, abs=1)
+
+
+def test_item_is_dead_lettered_after_max_attempts_and_stream_moves_on(db, sent, monkeypatch):
+    monkeypatch.setattr(outbox, 'MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(outbox, 'BASE_RETRY_DELAY', 0)
+    dead = outbox.enqueue('test', {'n': 1, 'fail': 5}, stream='a', db_path=db)
+    outbox.enqueue('test', {'n': 2}, stream='a', db_path=db)
+
+    assert outbox.drain(db_path=db) == {'sent': 1, 'failed': 2}
+
+    row = _rows(db)[dead]
+    assert (row['status'], row['attempts'], row['last_error']) == ('dead', 2, 'item 1 failed')
+    assert sent == [2]
+    assert outbox.stats(db) == {'dead': 1, 'sent': 1}
+
+
+def test_expired_lease_is_reclaimed(db, sent):
+    item = outbox.enqueue('test', {'n': 1}, db_path=db)
+    outbox._connect(db).execute("UPDATE outbox SET status = 'sending', lease_until = ? WHERE id = ?",
+                                (time.time() + 60, item))
+    assert outbox.drain(db_path=db) == {'sent': 0, 'failed': 0}
+
+    outbox._connect(db).execute('UPDATE outbox SET lease_until = ? WHERE id = ?', (time.time() - 1, item))
+    assert outbox.drain(db_path=db) == {'sent': 1, 'failed': 0}
+    assert sent == [1]
+
+
+def test_async_drain_keeps_order_within_each_stream(db, monkeypatch):
+    delivered = []
+
+    async def handler(payload):
+        # 後寫入的項目較快完成：若同一 stream 並行送出，順序就會顛倒
+        await asyncio.sleep(0.01 * (3 - payload['n'] % 3))
+        delivered.append((payload['stream'], payload['n']))
+
+    monkeypatch.setitem(outbox._async_handlers, 'atest', handler)
+    for n in range(6):
+        stream = 'a' if n % 2 == 0 else 'b'
+        outbox.enqueue('atest', {'stream': stream, 'n': n}, stream=stream, db_path=db)
+
+    assert asyncio.run(outbox.adrain(db)) == {'sent': 6, 'failed': 0}
+    assert [n for stream, n in delivered if stream == 'a'] == [0, 2, 4]
+    assert [n for stream, n in delivered if stream == 'b'] == [1, 3, 5]
+
+
+def test_background_worker_sends_items_as_they_are_enqueued(db, sent):
+    stop = threading.Event()
+    worker = threading.Thread(target=outbox.run_worker, args=(stop, db), daemon=True)
+    worker.start()
+    try:
+        outbox.enqueue('test', {'n': 1}, db_path=db)
+        deadline = time.time() + 2
+        while not sent and time.time() < deadline:
+            time.sleep(0.01)
+        assert sent == [1]
+    finally:
+        stop.set()
+        worker.join(timeout=5)
+    assert not worker.is_alive()
@@ -0,0 +1,81 @@
+"""
+services/slack_blocks.py：長行切段與訊息分頁
+"""
+from services.slack_blocks import (
+    MAX_BLOCKS_PER_MESSAGE, _split_long_line, escape_mrkdwn, paginate_blocks, render_report_messages,
+)
+
+
+def test_long_line_splits_on_whitespace():
+    line = ' '.join(['word'] * 30)
+
+    pieces = _split_long_line(line, limit=40)
+
+    assert ''.join(pieces) == line
+    assert all(len(piece) <= 40 for piece in pieces)
+    assert all(piece.endswith(' ') for piece in pieces[:-1])
+
+
+def test_long_line_keeps_entities_and_bold_spans_whole():
+    line = escape_mrkdwn('R&D' * 20) + ' *quarterly results are in* ' + 'x' * 10
+
+    pieces = _split_long_line(line, limit=40)
+
+    assert ''.join(pieces) == line
+    for piece in pieces:
+        assert len(piece) <= 40
+        assert piece.count('*') % 2 == 0
+        # 每段的 & 都是完整的實體
+        assert piece.count('&') == piece.count('&amp;')
+
+
+def test_bold_span_longer_than_limit_is_rewrapped():
+    line = '*' + 'x' * 100 + '*'
+
+    pieces = _split_long_line(line, limit=40)
+
+    assert all(len(piece) <= 40 for piece in pieces)
+    assert all(piece.startswith('*') and piece.endswith('*') and len(piece) > 2 for piece in pieces)
+    assert ''.join(piece.strip('*') for piece in pieces) == 'x' * 100
+
+
+def _section(text: str = 'x') -> dict:
+    return {'type': 'section', 'text': {'type': 'mrkdwn', 'text': text}}
+
+
+def _header(text: str = 'h') -> dict:
+    return {'type': 'header', 'text': {'type': 'plain_text', 'text': text}}
+
+
+def test_pages_respect_block_and_character_limits():
+    blocks = [_section('a' * 100) for _ in range(25)]
+
+    by_count = paginate_blocks(blocks, max_blocks=10, max_chars=100000)
+    by_chars = paginate_blocks(blocks, max_blocks=50, max_chars=450)
+
+    assert [len(page) for page in by_count] == [10, 10, 5]
+    assert [len(page) for page in by_chars] == [4] * 6 + [1]
+    assert sum(by_count, []) == blocks
+
+
+def test_page_never_ends_with_a_divider_or_splits_a_header_from_its_section():
+    blocks = [_section(), _section(), {'type': 'divider'}, _header('Next'), _section('after header'), _section()]
+
+    pages = paginate_blocks(blocks, max_blocks=4)
+
+    assert pages[0] == blocks[:2]
+    # divider 在分頁處丟棄，header 與其後的 section 在同一頁
+    assert pages[1][:2] == [_header('Next'), _section('after header')]
+    assert all(page[-1]['type'] not in ('divider', 'header') for page in pages)
+
+
+def test_long_report_is_rendered_as_numbered_messages():
+    report = '# 每日摘要\n' + '\n'.join(f'## 郵件 {i}\n內容 {i}' for i in range(120))
+
+    messages = render_report_messages(report)
+
+    assert len(messages) > 1
+    assert all(len(message['blocks']) <= MAX_BLOCKS_PER_MESSAGE for message in messages)
+    assert messages[0]['text'] == f'每日摘要 (1/{len(messages)})'
+    assert messages[-1]['blocks'][-1]['elements'][0]['text'] == f'({len(messages)}/{len(messages)})'
+    assert messages[0]['blocks'][0]['type'] == 'header'
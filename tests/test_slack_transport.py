@@ -0,0 +1,92 @@
+"""
+services/slack_transport.py：重試規則與每個 event loop 的非同步用戶端
+"""
+import asyncio
+import gc
+
+import pytest
+import requests
+
+from services import slack_transport
+from services.slack_transport import SlackTransport, SlackTransportError
+
+
+class _Response:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers = {'Retry-After': '0'}
+        self.text = ''
+
+    def json(self):
+        return {'ok': True, 'ts': '1.0'}
+
+
+class _Session:
+    """依序回傳 statuses 中的狀態碼（Exception 則拋出）"""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.posts = 0
+
+    def post(self, url, **kwargs):
+        self.posts += 1
+        status = self.statuses.pop(0)
+        if isinstance(status, Exception):
+            raise status
+        return _Response(status)
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    monkeypatch.setattr(slack_transport.time, 'sleep', lambda seconds: None)
+    return SlackTransport(token='xoxb-test')
+
+
+def test_post_message_is_not_retried_on_5xx(transport):
+    transport.session = _Session([502, 200])
+    with pytest.raises(SlackTransportError) as error:
+        transport.api_call('chat.postMessage', channel='C1', text='hi')
+    assert error.value.status_code == 502
+    assert transport.session.posts == 1
+
+
+def test_post_message_is_not_retried_on_read_timeout(transport):
+    transport.session = _Session([requests.exceptions.ReadTimeout('slow'), 200])
+    with pytest.raises(SlackTransportError):
+        transport.api_call('chat.postMessage', channel='C1', text='hi')
+    assert transport.session.posts == 1
+
+
+def test_post_message_is_retried_on_429_and_connection_error(transport):
+    transport.session = _Session([429, requests.exceptions.ConnectionError('refused'), 200])
+    assert transport.api_call('chat.postMessage', channel='C1', text='hi')['ok']
+    assert transport.session.posts == 3
+
+
+def test_webhook_is_not_retried_on_5xx(transport):
+    transport.session = _Session([500, 200])
+    with pytest.raises(SlackTransportError):
+        transport.post_webhook('https://hooks.slack.invalid/x', {'text': 'hi'})
+    assert transport.session.posts == 1
+
+
+def test_idempotent_method_is_retried_on_5xx(transport):
+    transport.session = _Session([503, 200])
+    assert transport.api_call('chat.update', channel='C1', ts='1.0', text='hi')['ok']
+    assert transport.session.posts == 2
+
+
+def test_async_transport_is_released_with_its_loop():
+    pytest.importorskip('httpx')
+
+    async def create():
+        return slack_transport.get_async_slack_transport()
+
+    loop = asyncio.new_event_loop()
+    first = loop.run_until_complete(create())
+    assert loop.run_until_complete(create()) is first
+    loop.run_until_complete(first.aclose())
+    loop.close()
+    del loop, first
+    gc.collect()
+    assert len(slack_transport._async_transports) == 0
@@ -0,0 +1,82 @@
+"""
+services/text_service.py：引用歷史移除與正規化快取
+"""
+from services import text_service
+from services.text_service import normalize_text, strip_quoted_history
+
+FORWARDED_INVITE = """FYI，請參考下方的面試邀請
+
+---------- Forwarded message ---------
+From: Recruiting Team <jobs@acme.example>
+Date: Mon, 3 Mar 2025 10:00:00 +0800
+Subject: Interview invitation
+To: me@example.com
+
+Interview with the platform team on March 12 at 2:00 PM, Room 301.
+On the day, please bring your ID.
+"""
+
+
+def test_forwarded_invite_keeps_forwarded_body():
+    text = normalize_text(FORWARDED_INVITE)
+    assert 'FYI' in text
+    assert 'March 12 at 2:00 PM' in text
+    assert 'Room 301' in text
+
+
+def test_forward_without_comment_keeps_body():
+    text = normalize_text(FORWARDED_INVITE.split('\n', 2)[2])
+    assert 'March 12 at 2:00 PM' in text
+
+
+def test_reply_above_quote_strips_history():
+    text = """Sounds good, see you then.
+
+On Mon, 3 Mar 2025 at 10:00, Alice <alice@example.com> wrote:
+> Can we meet on Friday at 3pm?
+> Thanks
+"""
+    stripped = strip_quoted_history(text)
+    assert 'Sounds good' in stripped
+    assert 'Friday' not in stripped
+    assert 'wrote:' not in stripped
+
+
+def test_quote_without_reply_text_is_kept():
+    text = """On Mon, 3 Mar 2025 at 10:00, Alice <alice@example.com> wrote:
+> Team offsite on Friday at 3pm
+"""
+    assert 'Friday at 3pm' in strip_quoted_history(text)
+
+
+def test_outlook_reply_header_with_reply_text():
+    text = """收到，謝謝
+
+-----Original Message-----
+From: Bob <bob@example.com>
+Sent: Monday, March 3, 2025 10:00 AM
+請於週五前回覆
+"""
+    stripped = strip_quoted_history(text)
+    assert '收到' in stripped
+    assert '週五' not in stripped
+
+
+def test_reply_to_forward_strips_quoted_forward():
+    text = """Thanks, I'll be there.
+
+> ---------- Forwarded message ---------
+> Interview on March 12 at 2:00 PM
+"""
+    stripped = strip_quoted_history(text)
+    assert "I'll be there" in stripped
+    assert 'March 12' not in stripped
+
+
+def test_normalized_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(text_service, 'NORMALIZE_CACHE_SIZE', 3)
+    text_service._normalized_cache.clear()
+    for i in range(10):
+        text_service.normalize_email({'id': f'm{i}', 'body': f'body {i}', 'snippet': ''})
+    assert len(text_service._normalized_cache) == 3
+    assert [key.split(':')[0] for key in text_service._normalized_cache] == ['m7', 'm8', 'm9']
@@ -0,0 +1,41 @@
+"""
+services/tracing.py：span 結束時不同步匯出，由背景執行緒寫出
+"""
+import threading
+
+import pytest
+
+from services import tracing
+
+
+@pytest.fixture
+def exported(monkeypatch, tmp_path):
+    """以可控制的匯出取代 JSONL：release 設定前匯出會卡住（模擬緩慢的 OTLP collector）"""
+    records = []
+    release = threading.Event()
+
+    def slow_export(batch, path=None):
+        release.wait(5)
+        records.extend(batch)
+
+    monkeypatch.setattr(tracing, 'TRACE_EXPORTER', 'jsonl')
+    monkeypatch.setattr(tracing, 'export_jsonl', slow_export)
+    yield records, release
+    release.set()
+    tracing.flush()
+
+
+def test_root_span_close_does_not_block_on_export(exported):
+    records, release = exported
+
+    with tracing.span('workflow.run', kind='run', trace_id='run-1'):
+        with tracing.span('node.fetch', kind='node'):
+            pass
+
+    # 匯出仍卡在背景執行緒中，span 結束已返回
+    assert records == []
+
+    release.set()
+    tracing.flush()
+    assert sorted(record['name'] for record in records) == ['node.fetch', 'workflow.run']
+    assert {record['trace_id'] for record in records} == {'run-1'}
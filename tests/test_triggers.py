@@ -0,0 +1,62 @@
+"""
+api/triggers.py：冪等鍵推導的 run ID 與同一範圍的互斥
+"""
+from api import triggers
+from api.triggers import TriggerRegistry, run_id_for_key, trigger_key, trigger_scope
+
+WINDOW = triggers.TRIGGER_DEDUP_WINDOW
+
+
+def test_triggers_in_the_same_window_share_a_run_id():
+    start = 1000 * WINDOW
+    first = trigger_key('24h', 20, now=start + 1)
+    retry = trigger_key('24h', 20, now=start + WINDOW - 1)
+
+    assert first == retry
+    assert run_id_for_key(first) == run_id_for_key(retry)
+    assert trigger_key('24h', 20, now=start + WINDOW) != first
+    assert trigger_key('24h', 50, now=start + 1) != first
+
+
+def test_idempotency_key_overrides_the_time_window():
+    key = trigger_key('24h', 20, idempotency_key='gh-run-42', now=0)
+
+    assert key == trigger_key('24h', 50, idempotency_key='gh-run-42', now=10 * WINDOW)
+    assert key != trigger_key('24h', 20, idempotency_key='gh-run-43', now=0)
+
+
+def test_scope_depends_on_the_account_mode(monkeypatch):
+    monkeypatch.setenv('GMAIL_MULTI_ACCOUNT', 'false')
+    single = trigger_scope('24h')
+    monkeypatch.setenv('GMAIL_MULTI_ACCOUNT', 'true')
+
+    assert trigger_scope('24h') != single
+    assert trigger_scope('24h') != trigger_scope('7d')
+
+
+def test_only_one_active_run_per_scope():
+    registry = TriggerRegistry()
+
+    assert registry.acquire('single:24h', 'run-1')
+    assert not registry.acquire('single:24h', 'run-2')
+    assert registry.active_run('single:24h') == 'run-1'
+
+    # 其他 run 無法釋放不屬於自己的範圍
+    registry.release('single:24h', 'run-2')
+    assert registry.active_run('single:24h') == 'run-1'
+
+    registry.release_run('run-1')
+    assert registry.active_run('single:24h') is None
+    assert registry.acquire('single:24h', 'run-2')
+
+
+def test_replaced_key_maps_to_a_new_run_id():
+    registry = TriggerRegistry()
+    key = trigger_key('24h', 20, idempotency_key='gh-run-42')
+    original = registry.run_for_key(key)
+
+    retry = registry.replace(key)
+
+    assert original == run_id_for_key(key)
+    assert retry != original and retry.startswith(original)
+    assert registry.run_for_key(key) == retry
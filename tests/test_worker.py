@@ -0,0 +1,86 @@
+"""
+worker.py：每個 job 結束時都會記錄 finish 事件（API 服務據此結束 run 並釋放觸發範圍）
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import worker
+from api.tracking import CANCELLED, COMPLETED, FAILED, WAITING
+from services import job_queue
+
+
+class _Graph:
+    """只提供 get_state 的 graph：checkpoint 固定停在 next"""
+
+    def __init__(self, next_nodes=(), values=None, error=None):
+        self.snapshot = SimpleNamespace(next=tuple(next_nodes), values=values or {})
+        self.error = error
+
+    def get_state(self, config):
+        if self.error:
+            raise self.error
+        return self.snapshot
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = str(tmp_path / 'jobs.db')
+    monkeypatch.setattr(job_queue, 'JOB_QUEUE_DB_PATH', path)
+    return path
+
+
+def _claim(db, kind='run', run_id='run-1', payload=None):
+    job_queue.enqueue_job(kind, run_id, payload or {}, db_path=db)
+    return job_queue.claim_job('w1', db_path=db)
+
+
+def _finish_events(db, run_id='run-1'):
+    return [event['data'] for event in job_queue.read_events(db_path=db)
+            if event['run_id'] == run_id and event['event'] == 'finish']
+
+
+def test_redelivered_run_waiting_for_confirmation_records_finish(db):
+    # worker 在工作流停在確認節點後、回報 job 完成前當機：job 重新投遞，run_job 略過執行
+    graph = _Graph(next_nodes=['request_confirmation'], values={'emails': []})
+
+    worker.process_job(graph, _claim(db), 'w1')
+
+    assert [(data['status'], data.get('current_node')) for data in _finish_events(db)] == [
+        (WAITING, 'request_confirmation')]
+
+
+def test_redelivered_completed_run_records_finish(db):
+    worker.process_job(_Graph(values={'emails': []}), _claim(db), 'w1')
+
+    assert [data['status'] for data in _finish_events(db)] == [COMPLETED]
+
+
+def test_error_before_execution_records_failed_finish(db):
+    worker.process_job(_Graph(error=RuntimeError('checkpoint db locked')), _claim(db), 'w1')
+
+    assert [(data['status'], data['error']) for data in _finish_events(db)] == [(FAILED, 'checkpoint db locked')]
+
+
+def test_cancel_before_execution_records_cancelled_finish(db, monkeypatch):
+    def handler(graph, job, cancelled):
+        raise worker.JobCancelled(job['run_id'])
+
+    monkeypatch.setitem(worker.JOB_HANDLERS, 'run', handler)
+
+    worker.process_job(_Graph(), _claim(db), 'w1')
+
+    assert [data['status'] for data in _finish_events(db)] == [CANCELLED]
+
+
+def test_finish_is_not_recorded_twice(db, monkeypatch):
+    def handler(graph, job, cancelled):
+        job_queue.add_event(job['run_id'], 'finish', {'status': CANCELLED})
+        raise worker.JobCancelled(job['run_id'])
+
+    monkeypatch.setitem(worker.JOB_HANDLERS, 'run', handler)
+    job_queue.add_event('run-1', 'finish', {'status': COMPLETED})  # 上一次執行的事件
+
+    worker.process_job(_Graph(), _claim(db), 'w1')
+
+    assert [data['status'] for data in _finish_events(db)] == [COMPLETED, CANCELLED]
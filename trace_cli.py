@@ -0,0 +1,239 @@
+"""
+執行追蹤 CLI
+讀取 services/tracing.py 匯出的 span（TRACE_FILE，預設 traces.jsonl），顯示單次執行的耗時分解
+
+使用方式:
+    python trace_cli.py list                          # 列出最近的執行
+    python trace_cli.py show <run ID>                 # 以時間軸（flame 風格）顯示 span 樹與各類 span 的耗時
+    python trace_cli.py show <run ID> --min-ms 5      # 隱藏短於 5ms 的 span
+    python trace_cli.py collector --port 4318         # 本機 OTLP/HTTP collector：接收 span 並寫入 JSONL
+
+collector 用於測試 TRACE_EXPORTER=otlp：
+    python trace_cli.py collector --file collected.jsonl &
+    TRACE_EXPORTER=otlp OTEL_EXPORTER_OTLP_ENDPOINT=http://localhost:4318 python main.py
+    python trace_cli.py show <run ID> --file collected.jsonl
+"""
+import sys
+import json
+import argparse
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from services.tracing import TRACE_FILE, read_spans, from_otlp, export_jsonl
+
+BAR_WIDTH = 40
+# 顯示在 span 名稱後的屬性（其餘屬性省略）
+LABEL_ATTRIBUTES = ('account', 'emails', 'results', 'bytes', 'request_bytes', 'output_bytes',
+                    'chunks', 'batches', 'events', 'digests', 'prompt_chars', 'waiting_for')
+STATUS_MARKS = {'ok': '', 'error': ' ✗', 'interrupted': ' ⏸', 'cancelled': ' ⊘'}
+
+
+def _format_duration(ms: float) -> str:
+    if ms >= 1000:
+        return f'{ms / 1000:.2f}s'
+    return f'{ms:.1f}ms'
+
+
+def _display_width(text: str) -> int:
+    return sum(2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1 for char in text)
+
+
+def _pad(text: str, width: int) -> str:
+    """依顯示寬度截斷並補齊（中文字元佔兩格）"""
+    result, used = '', 0
+    for char in text:
+        char_width = _display_width(char)
+        if used + char_width > width:
+            break
+        result += char
+        used += char_width
+    return result + ' ' * (width - used)
+
+
+def _label(record: Dict) -> str:
+    attributes = record.get('attributes', {})
+    parts = [f'{key}={attributes[key]}' for key in LABEL_ATTRIBUTES if key in attributes]
+    label = record['name']
+    if parts:
+        label += f" [{' '.join(parts)}]"
+    return label + STATUS_MARKS.get(record.get('status', 'ok'), f" ({record.get('status')})")
+
+
+def _bar(record: Dict, origin: float, total: float) -> str:
+    """span 在整次執行時間軸上的位置與長度"""
+    if total <= 0:
+        return '█'
+    offset = int((record['start'] - origin) / total * BAR_WIDTH)
+    length = max(1, round((record['end'] - record['start']) / total * BAR_WIDTH))
+    offset = min(offset, BAR_WIDTH - 1)
+    return ' ' * offset + '█' * min(length, BAR_WIDTH - offset)
+
+
+# ===== list =====
+
+def list_runs(spans: List[Dict], limit: int) -> None:
+    runs = defaultdict(list)
+    for record in spans:
+        runs[record['trace_id']].append(record)
+
+    ordered = sorted(runs.items(), key=lambda item: min(r['start'] for r in item[1]), reverse=True)[:limit]
+    if not ordered:
+        print('沒有追蹤資料')
+        return
+
+    print(f"開始時間                  耗時   span  狀態         run ID")
+    for trace_id, records in ordered:
+        start = min(r['start'] for r in records)
+        end = max(r['end'] for r in records)
+        errors = sum(1 for r in records if r.get('status') == 'error')
+        roots = [r for r in records if r.get('kind') == 'run']
+        # 沒有 workflow.run（例如 main.py 直接執行）時以 ok 為準，另外標示失敗的 span 數
+        status = roots[-1]['status'] if roots else 'ok'
+        if errors and status != 'error':
+            status += f' ({errors}✗)'
+        print(f"{datetime.fromtimestamp(start):%Y-%m-%d %H:%M:%S} {_format_duration((end - start) * 1000):>10} "
+              f"{len(records):>6}  {status:<12} {trace_id}")
+
+
+# ===== show =====
+
+def show_run(spans: List[Dict], run_id: str, min_ms: float) -> int:
+    if not spans:
+        print(f'找不到執行 {run_id} 的追蹤資料')
+        return 1
+
+    by_id = {record['span_id']: record for record in spans}
+    children = defaultdict(list)
+    roots = []
+    for record in spans:
+        parent = record.get('parent_id')
+        if parent and parent in by_id:
+            children[parent].append(record)
+        else:
+            roots.append(record)
+
+    origin = min(r['start'] for r in spans)
+    total = max(r['end'] for r in spans) - origin
+    name_width = 56
+
+    print(f"執行 {run_id}：{_format_duration(total * 1000)}，{len(spans)} 個 span "
+          f"（{datetime.fromtimestamp(origin):%Y-%m-%d %H:%M:%S}）\n")
+
+    hidden = 0
+
+    def render(record: Dict, depth: int):
+        nonlocal hidden
+        if record['duration_ms'] < min_ms and record.get('status') == 'ok':
+            hidden += 1
+            return
+        label = _pad('  ' * depth + _label(record), name_width)
+        print(f"{label} {_format_duration(record['duration_ms']):>9}  |{_bar(record, origin, total):<{BAR_WIDTH}}|")
+        if record.get('error'):
+            print(f"{'  ' * (depth + 1)}↳ {record['error'][:100]}")
+        for child in sorted(children[record['span_id']], key=lambda r: r['start']):
+            render(child, depth + 1)
+
+    for root in sorted(roots, key=lambda r: r['start']):
+        render(root, 0)
+    if hidden:
+        print(f"\n（隱藏 {hidden} 個短於 {min_ms}ms 的 span）")
+
+    # 依名稱彙總：總耗時與自身耗時（扣除子 span）
+    totals = defaultdict(lambda: [0, 0.0, 0.0])  # 次數, 總耗時, 自身耗時
+    for record in spans:
+        child_ms = sum(child['duration_ms'] for child in children[record['span_id']])
+        entry = totals[record['name']]
+        entry[0] += 1
+        entry[1] += record['duration_ms']
+        entry[2] += max(0.0, record['duration_ms'] - child_ms)
+
+    print(f"\n{'span':<40}   次數     總耗時   自身耗時")
+    for name, (count, total_ms, self_ms) in sorted(totals.items(), key=lambda item: item[1][2], reverse=True):
+        print(f"{name:<40} {count:>6} {_format_duration(total_ms):>10} {_format_duration(self_ms):>10}")
+    return 0
+
+
+# ===== collector =====
+
+def run_collector(host: str, port: int, path: str) -> None:
+    """本機 OTLP/HTTP（JSON）collector：POST /v1/traces 的 span 以 JSONL 格式附加到檔案"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip('/') != '/v1/traces':
+                self.send_error(404)
+                return
+            if 'json' not in self.headers.get('Content-Type', ''):
+                # 只支援 OTLP JSON 編碼（不支援 protobuf）
+                self.send_error(415, 'only application/json is supported')
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                records = from_otlp(json.loads(self.rfile.read(length)))
+            except (ValueError, KeyError) as e:
+                self.send_error(400, str(e))
+                return
+            export_jsonl(records, path)
+            print(f"收到 {len(records)} 個 span")
+
+            body = b'{}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"OTLP collector 監聽 http://{host}:{port}/v1/traces，寫入 {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='檢視工作流執行追蹤')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list', help='列出最近的執行')
+    list_parser.add_argument('--file', default=TRACE_FILE, help='追蹤檔案（JSONL）')
+    list_parser.add_argument('--limit', type=int, default=20, help='最多顯示幾筆')
+
+    show_parser = subparsers.add_parser('show', help='顯示單次執行的耗時分解')
+    show_parser.add_argument('run_id', help='run ID（thread ID）')
+    show_parser.add_argument('--file', default=TRACE_FILE, help='追蹤檔案（JSONL）')
+    show_parser.add_argument('--min-ms', type=float, default=0.0, help='隱藏短於此耗時且成功的 span')
+
+    collector_parser = subparsers.add_parser('collector', help='本機 OTLP/HTTP collector')
+    collector_parser.add_argument('--host', default='127.0.0.1')
+    collector_parser.add_argument('--port', type=int, default=4318)
+    collector_parser.add_argument('--file', default=TRACE_FILE, help='寫入的 JSONL 檔案')
+
+    args = parser.parse_args()
+
+    if args.command == 'collector':
+        run_collector(args.host, args.port, args.file)
+        return 0
+
+    try:
+        spans = read_spans(args.file, trace_id=getattr(args, 'run_id', None))
+    except FileNotFoundError:
+        print(f'找不到追蹤檔案: {args.file}')
+        return 1
+
+    if args.command == 'list':
+        list_runs(spans, args.limit)
+        return 0
+    return show_run(spans, args.run_id, args.min_ms)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
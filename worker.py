@@ -0,0 +1,270 @@
+# Workflow Worker
+# 從 job queue（jobs.db）領取工作流並執行，讓 API 服務只負責接收請求：
+#     python worker.py --processes 4
+# 需設定 API 服務 WORKFLOW_EXECUTOR=queue，並與 worker 共用 jobs.db / checkpoints.db / outbox.db
+import os
+import time
+import signal
+import socket
+import argparse
+import threading
+import multiprocessing
+from typing import Optional
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv()
+
+POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+PRUNE_INTERVAL = 3600.0
+
+
+class JobCancelled(Exception):
+    """job 在執行中被要求取消"""
+
+
+def _run_config(run_id: str) -> dict:
+    return {"configurable": {"thread_id": run_id}}
+
+
+# ===== 執行 =====
+
+def execute_job_graph(graph, run_id: str, graph_input, cancelled: threading.Event, resume: bool = False):
+    """以 stream 執行（或恢復）工作流，並將節點進度寫入 job_events（API 服務據此更新 /runs）
+
+    Args:
+        graph: compiled graph
+        run_id: 執行 ID（thread ID）
+        graph_input: 初始 state；恢復時為 None
+        cancelled: 被要求取消時設定，於下一個節點開始前中止
+        resume: 是否為恢復執行
+    """
+    from services.job_queue import add_event
+    from api.tracking import count_outputs, CANCELLED, FAILED
+    from services.tracing import span
+
+    config = _run_config(run_id)
+    add_event(run_id, "start", {"resume": resume, "at": time.time()})
+
+    # 整次執行為 trace 的根 span，節點與外部呼叫的 span 掛在其下
+    with span("workflow.run", kind="run", trace_id=run_id, resume=resume, executor="worker") as run_span:
+        try:
+            for task in graph.stream(graph_input, config, stream_mode="tasks"):
+                if "result" in task:
+                    add_event(run_id, "node_end", {
+                        "node": task["name"],
+                        "counts": count_outputs(task["result"]),
+                        "error": task.get("error") and str(task["error"]),
+                        "at": time.time(),
+                    })
+                    print(f"[{run_id}] 節點完成: {task['name']}")
+                    if cancelled.is_set():
+                        raise JobCancelled(run_id)
+                else:
+                    add_event(run_id, "node_start", {"node": task["name"], "at": time.time()})
+        except JobCancelled:
+            add_event(run_id, "finish", {"status": CANCELLED, "at": time.time()})
+            run_span.status = "cancelled"
+            raise
+        except Exception as e:
+            add_event(run_id, "finish", {"status": FAILED, "error": str(e), "at": time.time()})
+            raise
+
+        snapshot = graph.get_state(config)
+        add_event(run_id, "finish", _finish_data(snapshot))
+        if snapshot.next:
+            run_span.status = "interrupted"
+            run_span.set("waiting_for", snapshot.next[0])
+
+
+def _finish_data(snapshot) -> dict:
+    """依 checkpoint 決定 finish 事件的內容：停在中斷節點為等待確認，否則為完成"""
+    from api.tracking import WAITING, COMPLETED
+
+    if snapshot.next:
+        return {"status": WAITING, "current_node": snapshot.next[0], "at": time.time()}
+    return {"status": COMPLETED, "at": time.time()}
+
+
+def run_job(graph, job: dict, cancelled: threading.Event):
+    """首次執行；若 checkpoint 顯示上次在中途中斷（worker 當機），從最後的 checkpoint 繼續"""
+    from api.confirmations import CONFIRMATION_NODES
+
+    run_id = job['run_id']
+    snapshot = graph.get_state(_run_config(run_id))
+
+    if not snapshot.values:
+        execute_job_graph(graph, run_id, job['payload'], cancelled)
+    elif snapshot.next and snapshot.next[0] not in CONFIRMATION_NODES:
+        print(f"從 checkpoint 繼續執行 {run_id}（第 {job['attempts']} 次嘗試）")
+        execute_job_graph(graph, run_id, None, cancelled, resume=True)
+    else:
+        print(f"工作流 {run_id} 已執行過，略過")
+
+
+def resume_job(graph, job: dict, cancelled: threading.Event):
+    """套用一批事件確認並恢復工作流，完成後每則訊息送一次 chat.update"""
+    from api.confirmations import CONFIRMATION_NODES, split_decisions, enqueue_message_updates
+
+    run_id = job['run_id']
+    config = _run_config(run_id)
+    decisions = job['payload']['decisions']
+
+    snapshot = graph.get_state(config)
+    if not snapshot.next or snapshot.next[0] not in CONFIRMATION_NODES:
+        print(f"工作流 {run_id} 沒有在等待確認，忽略 {len(decisions)} 個回應")
+        return
+
+    confirmed, skipped = split_decisions(decisions, snapshot.values.get('decided_events', []))
+    print(f"用戶回應（執行 {run_id}）: 確認 {len(confirmed)} 個、跳過 {len(skipped)} 個事件")
+
+    graph.update_state(
+        config,
+        {"confirmed_events": confirmed, "skipped_events": skipped},
+        as_node=snapshot.next[0]
+    )
+    execute_job_graph(graph, run_id, None, cancelled, resume=True)
+
+    enqueue_message_updates({
+        (update['channel'], update['ts']): update['blocks'] for update in job['payload']['updates']
+    })
+
+
+JOB_HANDLERS = {
+    'run': run_job,
+    'resume': resume_job,
+}
+
+
+# ===== Worker 行程 =====
+
+def _heartbeat_loop(job_id: int, worker_id: str, cancelled: threading.Event, done: threading.Event):
+    from services.job_queue import heartbeat, HEARTBEAT_INTERVAL
+
+    while not done.wait(HEARTBEAT_INTERVAL):
+        try:
+            if heartbeat(job_id, worker_id):
+                cancelled.set()
+        except Exception as e:
+            print(f"Heartbeat 失敗（job #{job_id}）: {e}")
+
+
+def _ensure_finish_event(graph, run_id: str, after_id: int, data: Optional[dict] = None):
+    """job 結束時若沒有經過 execute_job_graph 記錄 finish（略過、重新投遞、執行前失敗），補上一筆
+
+    API 服務收到 finish 才會結束 /runs 的記錄並釋放觸發範圍
+
+    Args:
+        graph: compiled graph
+        run_id: 執行 ID
+        after_id: job 開始前最後一筆進度事件的 ID
+        data: finish 事件內容；未提供時依 checkpoint 決定
+    """
+    from services.job_queue import add_event, finish_recorded
+
+    if finish_recorded(run_id, after_id):
+        return
+    if data is None:
+        data = _finish_data(graph.get_state(_run_config(run_id)))
+    add_event(run_id, "finish", data)
+
+
+def process_job(graph, job: dict, worker_id: str):
+    """執行單一 job（期間持續 heartbeat 延長 lease），任何結束路徑都會記錄 finish 事件"""
+    from services.job_queue import finish_job, last_event_id
+    from services.metrics import flush as flush_metrics
+    from api.tracking import CANCELLED, FAILED
+
+    cancelled = threading.Event()
+    done = threading.Event()
+    beat = threading.Thread(target=_heartbeat_loop, args=(job['id'], worker_id, cancelled, done), daemon=True)
+    beat.start()
+
+    run_id = job['run_id']
+    after_id = 0
+    try:
+        after_id = last_event_id()
+        JOB_HANDLERS[job['kind']](graph, job, cancelled)
+        _ensure_finish_event(graph, run_id, after_id)
+        finish_job(job['id'], 'done')
+    except JobCancelled:
+        print(f"Job #{job['id']}（{run_id}）已取消")
+        _ensure_finish_event(graph, run_id, after_id, {"status": CANCELLED, "at": time.time()})
+        finish_job(job['id'], 'cancelled')
+    except Exception as e:
+        print(f"Job #{job['id']}（{run_id}）失敗: {e}")
+        import traceback
+        traceback.print_exc()
+        try:
+            _ensure_finish_event(graph, run_id, after_id, {"status": FAILED, "error": str(e), "at": time.time()})
+        except Exception as event_error:
+            print(f"記錄 finish 事件失敗（{run_id}）: {event_error}")
+        finish_job(job['id'], 'failed', error=str(e))
+    finally:
+        done.set()
+        beat.join()
+        # 指標寫到 METRICS_MULTIPROC_DIR，由 API 服務的 /metrics 合併輸出
+        flush_metrics()
+
+
+def worker_main(index: int, stop: "multiprocessing.synchronize.Event"):
+    """單一 worker 行程：持續領取並執行 job，直到 stop 被設定"""
+    # Ctrl+C / SIGTERM 由主行程處理：目前的 job 執行完畢後才結束
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    from init_credentials import init_credentials
+    init_credentials()
+
+    from agent.graph import get_graph
+    from services.job_queue import claim_job, prune
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    graph = get_graph()
+    last_prune = 0.0
+    print(f"Worker {index} 啟動: {worker_id}")
+
+    while not stop.is_set():
+        job = claim_job(worker_id)
+        if job is None:
+            if time.time() - last_prune > PRUNE_INTERVAL:
+                prune()
+                last_prune = time.time()
+            stop.wait(POLL_INTERVAL)
+            continue
+
+        print(f"Worker {index} 領取 job #{job['id']}（{job['kind']} {job['run_id']}）")
+        process_job(graph, job, worker_id)
+
+    print(f"Worker {index} 結束")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="執行工作流 worker 行程")
+    parser.add_argument("--processes", "-n", type=int,
+                        default=int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 1))),
+                        help="worker 行程數量（預設 WORKER_PROCESSES 或 CPU 核心數）")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    processes = [
+        context.Process(target=worker_main, args=(i, stop), name=f"workflow-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def shutdown(signum, frame):
+        print("收到結束訊號，等待執行中的 job 完成...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()